@@ -0,0 +1,81 @@
+"""
+Recall / latency benchmark for the vector store search backends
+
+Compares IVF-flat against the exact scan on synthetic clustered embeddings
+and reports recall@k, QPS and p50/p99 latency per corpus size.
+
+Usage:
+    python -m backend.benchmarks.ann_benchmark --sizes 10000 100000 1000000 --dim 384
+"""
+import sys
+import time
+import argparse
+from typing import List
+
+import numpy as np
+
+from backend.rag.ann_index import ExactIndex, IVFFlatIndex
+
+def make_corpus(n: int, dim: int, clusters: int, seed: int = 0) -> np.ndarray:
+    """Gaussian-mixture vectors, normalised like real embeddings"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    corpus = np.empty((n, dim), dtype=np.float32)
+    for start in range(0, n, 100000):
+        end = min(n, start + 100000)
+        labels = rng.integers(0, clusters, end - start)
+        corpus[start:end] = centers[labels] + 0.6 * rng.standard_normal((end - start, dim)).astype(np.float32)
+    corpus /= np.linalg.norm(corpus, axis=1, keepdims=True)
+    return corpus
+
+def measure(index, corpus: np.ndarray, queries: np.ndarray, k: int, **kwargs):
+    """Run every query, returning (results, latencies in ms)"""
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        rows, _ = index.search(corpus, query, k, **kwargs)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append(rows)
+    return results, np.asarray(latencies)
+
+def recall(truth: List[np.ndarray], found: List[np.ndarray], k: int) -> float:
+    hits = sum(len(np.intersect1d(t[:k], f[:k])) for t, f in zip(truth, found))
+    return hits / (k * len(truth))
+
+def report(label: str, latencies: np.ndarray, rec: float) -> None:
+    qps = 1000.0 / latencies.mean()
+    print(
+        f"  {label:<16} recall={rec:6.3f}  qps={qps:9.1f}  "
+        f"p50={np.percentile(latencies, 50):7.2f}ms  p99={np.percentile(latencies, 99):7.2f}ms"
+    )
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark exact vs IVF vector search")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=0, help="IVF lists (default: ~sqrt(n))")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    args = parser.parse_args(argv)
+
+    for n in args.sizes:
+        corpus = make_corpus(n, args.dim, clusters=max(16, n // 1000))
+        queries = make_corpus(args.queries, args.dim, clusters=max(16, n // 1000), seed=1)
+        nlist = args.nlist or max(16, int(np.sqrt(n)))
+        print(f"n={n} dim={args.dim} k={args.k} nlist={nlist}")
+
+        truth, latencies = measure(ExactIndex(), corpus, queries, args.k)
+        report("exact", latencies, 1.0)
+
+        ivf = IVFFlatIndex(nlist=nlist)
+        start = time.perf_counter()
+        ivf.sync(corpus)
+        print(f"  ivf build: {time.perf_counter() - start:.1f}s")
+        for nprobe in args.nprobe:
+            found, latencies = measure(ivf, corpus, queries, args.k, nprobe=nprobe)
+            report(f"ivf nprobe={nprobe}", latencies, recall(truth, found, args.k))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
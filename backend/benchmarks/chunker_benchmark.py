@@ -0,0 +1,144 @@
+"""
+Chunking quality and cost: fixed character windows vs StructureChunker
+
+Generates a synthetic corpus of Chinese industry reports (chapter/section
+headings, paragraphs, tab-separated tables) in which every section carries
+one planted fact such as "杭州高新区生物医药产业2021年实现产值1234亿元". Both
+chunkers split the corpus and the script reports:
+
+- chunk count and total embedding tokens (backend.models.tokens.estimate_tokens)
+- retrieval hit rate: for every fact a question is embedded and the top-k
+  chunks are searched for the complete fact; a chunk boundary through the
+  fact sentence is a miss
+- chunking throughput, on the corpus and on one document made of --scale
+  copies of the whole corpus, to show that the cost stays linear in the
+  text size
+
+Embeddings are hashed character-bigram vectors (no API calls), which is
+enough to compare how well the two splitters keep facts retrievable.
+
+Usage:
+    python -m backend.benchmarks.chunker_benchmark --docs 40 --sections 12 --max-tokens 300 --top-k 1 5
+"""
+import sys
+import time
+import zlib
+import random
+import argparse
+from typing import List, Tuple
+
+import numpy as np
+
+REGIONS = ["北京", "上海", "广州", "深圳", "杭州", "南京", "成都", "武汉", "西安"]
+INDUSTRIES = ["生物医药", "电子信息", "人工智能", "新能源", "先进制造", "集成电路", "汽车", "文创"]
+PARKS = ["高新区", "经开区", "自贸片区", "科学城", "未来科技城", "临空经济区", "综合保税区", "大学科技园",
+         "滨江园区", "东部新城", "西部产业园", "南部新区", "北部工业区", "创新港", "智造谷", "数字小镇"]
+FILLER = [
+    "{r}持续优化营商环境，{i}领域的龙头企业带动作用明显。",
+    "{p}配套设施不断完善，产业链上下游协同水平稳步提升。",
+    "近年来研发投入保持年均{n}%左右的增长，创新成果加快转化。",
+    "人才引进政策持续发力，{p}累计引进高层次人才{n}人。",
+    "金融机构加大对中小企业的信贷支持力度，融资成本有所下降。",
+    "部分关键环节仍依赖外部供给，产业链韧性有待进一步增强。",
+    "{r}{i}产业集群已形成较为完整的产业生态。",
+]
+
+def build_corpus(docs: int, sections: int, seed: int = 7) -> Tuple[List[str], List[Tuple[str, str]]]:
+    """Returns (documents, [(question, fact that must be retrieved intact)])"""
+    rng = random.Random(seed)
+    texts, probes = [], []
+    for d in range(docs):
+        region, industry = REGIONS[d % len(REGIONS)], INDUSTRIES[d % len(INDUSTRIES)]
+        lines = [f"# {region}{industry}产业集群发展报告"]
+        for s in range(sections):
+            park = PARKS[s % len(PARKS)]
+            lines.append(f"第{s + 1}章 {park}{industry}产业发展情况")
+            year, value = 2000 + (d + s) % 24, rng.randint(100, 9999)
+            fact = f"{region}{park}{industry}产业{year}年实现产值{value}亿元"
+            probes.append((f"{region}{park}的{industry}产业{year}年产值是多少？", fact))
+            for p in range(rng.randint(3, 6)):
+                sentences = [
+                    rng.choice(FILLER).format(r=region, i=industry, p=park, n=rng.randint(5, 40))
+                    for _ in range(rng.randint(3, 8))
+                ]
+                if p == 1:
+                    sentences.insert(rng.randint(0, len(sentences)), f"{fact}，同比增长{rng.randint(1, 30)}%。")
+                lines.append("".join(sentences))
+                lines.append("")
+            if s % 3 == 0:
+                lines.append("指标\t2021年\t2022年\t2023年")
+                for metric in ("产值（亿元）", "企业数（家）", "从业人员（万人）"):
+                    lines.append(metric + "".join(f"\t{rng.randint(10, 999)}" for _ in range(3)))
+                lines.append("")
+        texts.append("\n".join(lines) + "\n")
+    return texts, probes
+
+def split(chunker_factory, texts: List[str], block: int = 65536) -> List[str]:
+    chunks = []
+    for text in texts:
+        chunker = chunker_factory()
+        for start in range(0, len(text), block):
+            chunks.extend(chunker.feed(text[start:start + block]))
+        chunks.extend(chunker.finish())
+    return chunks
+
+def embed(texts: List[str], dim: int = 4096) -> np.ndarray:
+    """Hashed character-bigram counts, L2-normalised"""
+    matrix = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for a, b in zip(text, text[1:]):
+            matrix[row, zlib.crc32((a + b).encode("utf-8")) % dim] += 1.0
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-9)
+
+def hit_rates(chunks: List[str], probes: List[Tuple[str, str]], top_ks: List[int]) -> List[float]:
+    scores = embed([question for question, _ in probes]) @ embed(chunks).T
+    ranked = np.argsort(-scores, axis=1)[:, :max(top_ks)]
+    hits = np.zeros((len(probes), len(top_ks)))
+    for i, (_, fact) in enumerate(probes):
+        found = [fact in chunks[j] for j in ranked[i]]
+        for k, top_k in enumerate(top_ks):
+            hits[i, k] = any(found[:top_k])
+    return hits.mean(axis=0).tolist()
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Compare the character splitter with the structure-aware chunker")
+    parser.add_argument("--docs", type=int, default=40)
+    parser.add_argument("--sections", type=int, default=12)
+    parser.add_argument("--char-size", type=int, default=1000)
+    parser.add_argument("--char-overlap", type=int, default=200)
+    parser.add_argument("--max-tokens", type=int, default=300)
+    parser.add_argument("--overlap-tokens", type=int, default=40)
+    parser.add_argument("--top-k", type=int, nargs="+", default=[1, 5])
+    parser.add_argument("--scale", type=int, default=8, help="corpus multiple for the linear-time check")
+    args = parser.parse_args(argv)
+
+    from backend.models.tokens import estimate_tokens
+    from backend.rag.chunker import CharChunker, StructureChunker
+
+    texts, probes = build_corpus(args.docs, args.sections)
+    chars = sum(len(text) for text in texts)
+    print(f"corpus: {args.docs} docs, {chars / 1e6:.2f}M chars, {len(probes)} fact probes")
+
+    chunkers = [
+        (f"char {args.char_size}/{args.char_overlap}", lambda: CharChunker(args.char_size, args.char_overlap)),
+        (f"structure {args.max_tokens}t/{args.overlap_tokens}t", lambda: StructureChunker(args.max_tokens, args.overlap_tokens)),
+    ]
+    header = "".join(f"  hit@{k:<3}" for k in args.top_k)
+    print(f"{'chunker':<22} {'chunks':>7} {'tokens':>9} {'tok/chunk':>9}{header}  {'Mchar/s':>8} {'Mchar/s x' + str(args.scale):>11}")
+    for name, factory in chunkers:
+        start = time.perf_counter()
+        chunks = split(factory, texts)
+        speed = chars / (time.perf_counter() - start) / 1e6
+        start = time.perf_counter()
+        # One very large document: the per-character cost must not grow with it
+        split(factory, ["".join(texts) * args.scale])
+        scaled_speed = chars * args.scale / (time.perf_counter() - start) / 1e6
+
+        tokens = sum(estimate_tokens(chunk) for chunk in chunks)
+        rates = "".join(f"  {rate:7.1%}" for rate in hit_rates(chunks, probes, args.top_k))
+        print(f"{name:<22} {len(chunks):>7} {tokens:>9} {tokens / len(chunks):>9.0f}{rates}  {speed:>8.2f} {scaled_speed:>11.2f}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
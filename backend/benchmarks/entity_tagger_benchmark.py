@@ -0,0 +1,93 @@
+"""
+Entity tagging: compiled Aho–Corasick automaton vs a substring loop
+
+Builds a dictionary of --patterns synthetic entity names (2-6 CJK
+characters, a stand-in for industry codes and county names) and a document
+of --mb megabytes of Chinese text with mentions scattered through it, then
+counts the mentions of every entity two ways:
+
+- naive:     `text.count(name)` for each name, i.e. one scan of the whole
+             text per pattern, which is what `if name in text` over a long
+             keyword list amounts to
+- automaton: EntityTagger, one pass over the text whatever the number of
+             patterns (the build time is reported separately; it is paid
+             once per process)
+
+The counts of the two methods are compared to check the automaton.
+
+Usage:
+    python -m backend.benchmarks.entity_tagger_benchmark --patterns 5000 --mb 1 2
+"""
+import sys
+import time
+import random
+import argparse
+
+# Common characters; synthetic names and filler text are drawn from them
+ALPHABET = (
+    "的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后多定行学法"
+    "所民得经十三之进着等部度家电力里如水化高自二理起小物现实加量都两体制机当使点从业本去把性好应开它合还因由其些然前外天政"
+    "四日那社义事平形相全表间样与关各重新线内数正心反你明看原又么利比或但质气第向道命此变条只没结解问意建月公无系军很情者最立"
+)
+FILLER = "产业集群发展迅速，龙头企业带动作用明显，研发投入持续增长。"
+
+def build(patterns: int, mb: float, seed: int = 11):
+    rng = random.Random(seed)
+    names = set()
+    while len(names) < patterns:
+        names.add("".join(rng.choice(ALPHABET) for _ in range(rng.randint(2, 6))))
+    names = sorted(names)
+
+    target = int(mb * 1024 * 1024 / 3)  # ~3 bytes per character in UTF-8
+    parts, size = [], 0
+    while size < target:
+        piece = FILLER if rng.random() < 0.7 else "".join(rng.choice(ALPHABET) for _ in range(rng.randint(5, 30)))
+        if rng.random() < 0.2:
+            piece += rng.choice(names) + "。"
+        parts.append(piece)
+        size += len(piece)
+    return names, "".join(parts)
+
+def naive(names, text):
+    counts = {}
+    for name in names:
+        count = text.count(name)
+        if count:
+            counts[name] = count
+    return counts
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Compare the Aho–Corasick tagger with a per-pattern substring loop")
+    parser.add_argument("--patterns", type=int, default=5000)
+    parser.add_argument("--mb", type=float, nargs="+", default=[1.0, 2.0])
+    args = parser.parse_args(argv)
+
+    from backend.rag.entity_tagger import EntityTagger
+
+    names, _ = build(args.patterns, 0)
+    start = time.perf_counter()
+    tagger = EntityTagger(("entity", name, [name]) for name in names)
+    print(f"{args.patterns} patterns, automaton built in {time.perf_counter() - start:.2f}s (once per process)")
+
+    for mb in args.mb:
+        _, text = build(args.patterns, mb)
+        start = time.perf_counter()
+        expected = naive(names, text)
+        naive_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        counts = tagger.tag(text).get("entity", {})
+        automaton_s = time.perf_counter() - start
+
+        # str.count scans each name on its own; the automaton resolves overlaps
+        # leftmost-longest, so names nested in longer ones may legitimately differ
+        agree = sum(1 for name in expected if counts.get(name) == expected[name])
+        print(
+            f"{mb:5.1f}MB  naive {naive_s:7.2f}s   automaton {automaton_s:7.2f}s   "
+            f"speedup {naive_s / automaton_s:5.1f}x   entities found {len(counts)}, "
+            f"same count as naive for {agree}/{len(expected)}"
+        )
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,160 @@
+"""
+Text extraction throughput: in-process vs the pre-warmed process pool
+
+Generates a corpus of synthetic multi-page PDFs (hand-written PDF objects,
+Helvetica text, no extra dependencies) and DOCX files (python-docx), then
+extracts it two ways:
+
+- inline: the parser functions called directly on the event loop thread,
+  which is what running them inside a request coroutine amounts to
+- pool:   TextExtractor with --workers processes (page-level PDF tasks)
+
+and reports pages/s, plus how long the event loop was blocked at worst
+while extraction was running (a 10 ms ticker measures its own lateness).
+
+Usage:
+    python -m backend.benchmarks.extraction_benchmark --pdfs 8 --pages 40 --docx 8 --workers 1 2 4
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+
+LINE = "Hangzhou biomedical industry cluster output grew {n} percent with {m} new firms"
+
+def write_pdf(path: str, pages: int, lines_per_page: int = 40) -> None:
+    """Minimal valid PDF with one text stream per page"""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in below
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"
+    ]
+    page_ids = []
+    for p in range(pages):
+        text = "".join(
+            f"({LINE.format(n=p, m=i)}) Tj T* " for i in range(lines_per_page)
+        )
+        stream = f"BT /F1 10 Tf 12 TL 40 800 Td {text}ET".encode()
+        objects.append(b"<< /Length " + str(len(stream)).encode() + b" >>\nstream\n" + stream + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>".encode()
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{i} 0 R" for i in page_ids)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode()
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, "wb") as f:
+        f.write(out)
+
+def write_docx(path: str, paragraphs: int) -> None:
+    import docx
+    document = docx.Document()
+    document.add_heading("杭州生物医药产业集群发展报告", level=1)
+    for i in range(paragraphs):
+        document.add_paragraph(f"第{i}段：产业集群产值增长{i % 30}%，新增企业{i % 50}家，研发投入持续提升。")
+    document.save(path)
+
+class LoopLag:
+    """Measures the worst scheduling delay of a periodic 10 ms task"""
+
+    def __init__(self):
+        self.worst = 0.0
+        self._task = None
+
+    async def _tick(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + 0.01
+            await asyncio.sleep(0.01)
+            self.worst = max(self.worst, loop.time() - expected)
+
+    def __enter__(self):
+        self._task = asyncio.ensure_future(self._tick())
+        return self
+
+    def __exit__(self, *exc):
+        self._task.cancel()
+
+async def run_inline(corpus) -> None:
+    from backend.rag import extractors
+    for path, _ in corpus:
+        if path.endswith(".pdf"):
+            extractors._pdf_pages_text(path, 0, extractors._pdf_page_count(path))
+        else:
+            extractors._docx_text(path)
+        # Yield once per file, as an async handler would between awaits
+        await asyncio.sleep(0)
+
+async def start_pool(workers: int):
+    from backend.rag.extractors import TextExtractor
+    extractor = TextExtractor(max_workers=workers, pages_per_task=8)
+    start = time.perf_counter()
+    await extractor.start()
+    warm = time.perf_counter() - start
+
+    async def one(path):
+        ext = os.path.splitext(path)[1]
+        async for _piece in extractor.iter_text(path, ext):
+            pass
+
+    return extractor, warm, one
+
+async def main_async(args) -> None:
+    with tempfile.TemporaryDirectory() as scratch:
+        corpus = []
+        for i in range(args.pdfs):
+            path = os.path.join(scratch, f"report_{i}.pdf")
+            write_pdf(path, args.pages)
+            corpus.append((path, args.pages))
+        for i in range(args.docx):
+            path = os.path.join(scratch, f"report_{i}.docx")
+            write_docx(path, args.paragraphs)
+            # Count a DOCX as one "page" of work per 40 paragraphs
+            corpus.append((path, max(args.paragraphs // 40, 1)))
+        total_pages = sum(pages for _, pages in corpus)
+        print(f"corpus: {args.pdfs} PDFs x {args.pages} pages, {args.docx} DOCX, cpu_count={os.cpu_count()}")
+
+        with LoopLag() as lag:
+            start = time.perf_counter()
+            await run_inline(corpus)
+            elapsed = time.perf_counter() - start
+        print(f"{'inline':<10} {total_pages / elapsed:8.1f} pages/s   worst loop stall {lag.worst * 1000:8.1f}ms")
+
+        for workers in args.workers:
+            extractor, warm, one = await start_pool(workers)
+            with LoopLag() as lag:
+                start = time.perf_counter()
+                await asyncio.gather(*[one(path) for path, _ in corpus])
+                elapsed = time.perf_counter() - start
+            await extractor.close()
+            print(
+                f"pool x{workers:<4} {total_pages / elapsed:8.1f} pages/s   worst loop stall {lag.worst * 1000:8.1f}ms"
+                f"   (pre-warm {warm:.2f}s, paid once)"
+            )
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Measure document text extraction throughput")
+    parser.add_argument("--pdfs", type=int, default=8)
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--docx", type=int, default=8)
+    parser.add_argument("--paragraphs", type=int, default=400)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args(argv)
+    asyncio.run(main_async(args))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+"""
+Per-request AsyncClient vs shared pooled client, against a local mock API
+
+Starts a minimal keep-alive HTTP server that answers /chat/completions
+and fires `--concurrency` simultaneous chats for `--rounds` rounds in two
+modes: a fresh httpx.AsyncClient per request (the old behaviour) and the
+shared client owned by OpenAIHandler. Reports mean/p50/p99 latency and
+how many TCP connections each mode opened.
+
+Usage:
+    python -m backend.benchmarks.http_client_benchmark --concurrency 100 --rounds 10
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+import httpx
+import numpy as np
+
+RESPONSE_BODY = json.dumps({
+    "id": "chatcmpl-mock",
+    "object": "chat.completion",
+    "choices": [{"index": 0, "message": {"role": "assistant", "content": "好"}, "finish_reason": "stop"}]
+}).encode("utf-8")
+
+class MockServer:
+    """HTTP/1.1 keep-alive server returning a canned chat completion"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.connections = 0
+        self.server = None
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        try:
+            while True:
+                header = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in header.split(b"\r\n"):
+                    if line.lower().startswith(b"content-length:"):
+                        length = int(line.split(b":", 1)[1])
+                if length:
+                    await reader.readexactly(length)
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    b"Content-Length: " + str(len(RESPONSE_BODY)).encode() + b"\r\n\r\n" + RESPONSE_BODY
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self) -> int:
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+async def run_mode(label: str, call, concurrency: int, rounds: int, server: MockServer):
+    server.connections = 0
+    latencies = []
+
+    async def one():
+        start = time.perf_counter()
+        await call()
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    wall = time.perf_counter()
+    for _ in range(rounds):
+        await asyncio.gather(*(one() for _ in range(concurrency)))
+    wall = time.perf_counter() - wall
+
+    latencies = np.asarray(latencies)
+    print(
+        f"{label:<22} mean={latencies.mean():7.2f}ms  p50={np.percentile(latencies, 50):7.2f}ms  "
+        f"p99={np.percentile(latencies, 99):7.2f}ms  req/s={len(latencies) / wall:8.1f}  "
+        f"connections={server.connections}"
+    )
+
+async def main_async(args) -> None:
+    server = MockServer(args.latency / 1000)
+    port = await server.start()
+    base_url = f"http://127.0.0.1:{port}"
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ["OPENAI_HTTP2"] = "false"  # plain-text mock server speaks HTTP/1.1 only
+
+    from backend.models.openai_handler import OpenAIHandler
+    handler = OpenAIHandler()
+    await handler.start()
+    messages = [{"role": "user", "content": "杭州生物医药产业集群发展潜力如何"}]
+
+    async def per_request_client():
+        async with httpx.AsyncClient(timeout=handler.timeout) as client:
+            response = await client.post(f"{base_url}/chat/completions", json={"messages": messages})
+            response.json()
+
+    async def shared_client():
+        await handler.chat_completion(messages=messages)
+
+    print(f"concurrency={args.concurrency} rounds={args.rounds} server_latency={args.latency}ms")
+    # Warm up both paths once
+    await per_request_client()
+    await shared_client()
+    await run_mode("per-request client", per_request_client, args.concurrency, args.rounds, server)
+    await run_mode("shared pooled client", shared_client, args.concurrency, args.rounds, server)
+
+    await handler.close()
+    await server.stop()
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark OpenAIHandler HTTP client reuse")
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=20.0, help="Simulated server latency (ms)")
+    args = parser.parse_args(argv)
+    asyncio.run(main_async(args))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
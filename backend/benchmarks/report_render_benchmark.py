@@ -0,0 +1,99 @@
+"""
+DOCX rendering throughput: reports per minute, per core
+
+Renders --reports synthetic comprehensive reports (10 sections of text,
+the three standard charts) through ReportRenderer with each --workers
+pool size, all submitted at once as a batch would, and reports the
+throughput per pool and per core used. Pool start-up (imports, skeleton
+compilation) happens before timing, as it does at application start.
+
+Also times, in this process, compiling the styled skeleton against
+loading a report document from the compiled one, i.e. the per-report
+styling cost the skeleton saves.
+
+Usage:
+    python -m backend.benchmarks.report_render_benchmark --reports 40 --workers 1 2 4
+"""
+import io
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+
+import numpy as np
+
+PARAGRAPH = "杭州新能源产业集群依托长三角完备的制造业基础，已形成从材料、电池到整车的完整链条，" * 6
+
+def synthetic_report(i: int, charts):
+    sections = [{"title": f"{n}. 第{n}节", "type": "text", "content": "\n".join([PARAGRAPH] * 3 + ["- 要点一", "- 要点二", "- 要点三"])} for n in range(1, 10)]
+    sections[2].update(type="assessment", includes_chart=True)
+    sections[5].update(type="forecast", includes_chart=True)
+    return {
+        "id": f"bench{i}",
+        "title": "杭州新能源综合评估报告",
+        "region": "杭州",
+        "industry": "新能源",
+        "date": "2024-01-01T00:00:00",
+        "structure": {"title": "杭州新能源综合评估报告", "sections": [{"title": "摘要", "type": "text", "content": PARAGRAPH}] + sections},
+        "charts": charts
+    }
+
+async def run(args) -> None:
+    from backend.reports.renderer import ReportRenderer
+    from backend.reports.report_generator import ReportGenerator
+
+    charts = await ReportGenerator()._generate_charts("comprehensive", "新能源", "杭州")
+    cores = os.cpu_count() or 1
+    print(f"{'workers':>7} {'reports/min':>12} {'per core':>10} {'p50 report':>11}")
+    for workers in args.workers:
+        renderer = ReportRenderer("./data/reports", "./data/templates", max_workers=workers)
+        await renderer.start()
+        latencies = []
+
+        async def render(i: int) -> None:
+            start = time.perf_counter()
+            await renderer.render(synthetic_report(i, charts))
+            latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(render(i) for i in range(args.reports)))
+        elapsed = time.perf_counter() - start
+        await renderer.close()
+        per_minute = args.reports / elapsed * 60
+        print(f"{workers:>7} {per_minute:12.1f} {per_minute / min(workers, cores):10.1f} {np.median(latencies):10.2f}s")
+
+def skeleton_cost(repeat: int) -> None:
+    import docx
+    from backend.reports import renderer
+
+    compile_ms, load_ms = [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        skeleton = renderer._compile_skeleton("zh")
+        compile_ms.append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        docx.Document(io.BytesIO(skeleton))
+        load_ms.append((time.perf_counter() - start) * 1000)
+    print(f"skeleton: compile {np.median(compile_ms):.1f}ms, load compiled {np.median(load_ms):.1f}ms per report")
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Measure DOCX report rendering throughput")
+    parser.add_argument("--reports", type=int, default=40)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    args = parser.parse_args(argv)
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as scratch:
+        os.chdir(scratch)
+        try:
+            os.makedirs("./data/reports", exist_ok=True)
+            asyncio.run(run(args))
+            skeleton_cost(20)
+        finally:
+            os.chdir(cwd)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,16 +1,37 @@
 -- 启用pgvector扩展
 CREATE EXTENSION IF NOT EXISTS vector;
 
+-- 文档块表（向量库本地副本，行业/地区冗余存储以便在SQL中过滤）
+CREATE TABLE IF NOT EXISTS document_chunks (
+    id SERIAL PRIMARY KEY,
+    document_id VARCHAR(64) NOT NULL,  -- 与文件存储一致的文档UUID
+    chunk_index INTEGER NOT NULL,
+    content TEXT NOT NULL,
+    industry VARCHAR(100),
+    region VARCHAR(100),
+    metadata JSONB DEFAULT '{}'::JSONB,
+    tags JSONB DEFAULT '{}'::JSONB,  -- 分块自身提及的实体及次数，如 {"region": {"杭州": 2}}
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (document_id, chunk_index)
+);
+
+-- 已有数据库升级
+ALTER TABLE document_chunks ADD COLUMN IF NOT EXISTS tags JSONB DEFAULT '{}'::JSONB;
+
+CREATE INDEX IF NOT EXISTS idx_document_chunks_industry ON document_chunks(industry);
+CREATE INDEX IF NOT EXISTS idx_document_chunks_region ON document_chunks(region);
+
 -- 创建向量表
 CREATE TABLE IF NOT EXISTS embeddings (
     id SERIAL PRIMARY KEY,
-    document_chunk_id INTEGER NOT NULL,
-    embedding vector(1536),  -- 使用OpenAI的embedding维度
+    document_chunk_id INTEGER NOT NULL REFERENCES document_chunks(id) ON DELETE CASCADE,
+    embedding vector(1536),  -- 与 EMBEDDING_DIMENSIONS 一致：text-embedding-3 模型以 dimensions=1536 请求（ivfflat索引最多支持2000维）
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
--- 创建用于快速检索的索引
-CREATE INDEX IF NOT EXISTS embeddings_vector_idx ON embeddings USING ivfflat (embedding vector_l2_ops) WITH (lists = 100);
+-- 创建用于快速检索的索引（余弦距离，与检索函数中的 <=> 运算符一致）
+CREATE INDEX IF NOT EXISTS embeddings_vector_idx ON embeddings USING ivfflat (embedding vector_cosine_ops) WITH (lists = 100);
+CREATE INDEX IF NOT EXISTS idx_embeddings_document_chunk_id ON embeddings(document_chunk_id);
 
 -- 文本搜索历史表
 CREATE TABLE IF NOT EXISTS search_history (
@@ -21,17 +42,23 @@ CREATE TABLE IF NOT EXISTS search_history (
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
--- 创建检索函数
+-- 创建检索函数（行业/地区过滤下推到WHERE子句）
+DROP FUNCTION IF EXISTS search_similar_chunks(vector, FLOAT, INTEGER);
+-- 返回列增加了 tags，旧版本须先删除（CREATE OR REPLACE 不能修改返回类型）
+DROP FUNCTION IF EXISTS search_similar_chunks(vector, FLOAT, INTEGER, VARCHAR, VARCHAR);
 CREATE OR REPLACE FUNCTION search_similar_chunks(
     query_embedding vector,
     similarity_threshold FLOAT,
-    max_results INTEGER
+    max_results INTEGER,
+    filter_industry VARCHAR DEFAULT NULL,
+    filter_region VARCHAR DEFAULT NULL
 )
 RETURNS TABLE (
     chunk_id INTEGER,
-    document_id INTEGER,
+    document_id VARCHAR,
     content TEXT,
     metadata JSONB,
+    tags JSONB,
     similarity FLOAT
 )
 LANGUAGE plpgsql
@@ -43,6 +70,7 @@ BEGIN
         dc.document_id,
         dc.content,
         dc.metadata,
+        dc.tags,
         1 - (e.embedding <=> query_embedding) AS similarity
     FROM 
         embeddings e
@@ -50,8 +78,10 @@ BEGIN
         document_chunks dc ON e.document_chunk_id = dc.id
     WHERE 
         1 - (e.embedding <=> query_embedding) > similarity_threshold
+        AND (filter_industry IS NULL OR dc.industry = filter_industry)
+        AND (filter_region IS NULL OR dc.region = filter_region)
     ORDER BY 
-        similarity DESC
+        e.embedding <=> query_embedding
     LIMIT 
         max_results;
 END;
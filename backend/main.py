@@ -1,20 +1,28 @@
 import os
 import logging
-from fastapi import FastAPI, Depends, HTTPException, Request, status
+from fastapi import FastAPI, Depends, HTTPException, Request, status, UploadFile, File, Header
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
 import time
+import json
+import uuid
 import asyncio
+import hashlib
 from dotenv import load_dotenv
 from pathlib import Path
 
 # 导入自定义模块
 from backend.models.openai_handler import OpenAIHandler
+from backend.models.claude_handler import ClaudeHandler
 from backend.rag.document_processor import DocumentProcessor
 from backend.rag.vector_store import VectorStore
+from backend.rag.pg_vector_store import PgVectorStore
+from backend.rag.ingestion_queue import IngestionQueue, public_view
 from backend.reports.report_generator import ReportGenerator
+from backend.reports.batch_reports import BatchReportRunner, expand_regions
 
 # 加载环境变量
 load_dotenv()
@@ -49,9 +57,19 @@ app.add_middleware(
 
 # 初始化服务
 openai_handler = OpenAIHandler()
-document_processor = DocumentProcessor(openai_handler)
-vector_store = VectorStore(openai_handler)
+claude_handler = ClaudeHandler(response_cache=openai_handler.response_cache)
+# 向量存储：本地文件（默认）或 pgvector（多副本共享索引）
+if os.getenv("VECTOR_STORE", "file").lower() == "pgvector":
+    vector_store = PgVectorStore(openai_handler)
+else:
+    vector_store = VectorStore(openai_handler)
+document_processor = DocumentProcessor(openai_handler, vector_store)
+# 后台文档入库队列（INGEST_WORKERS=0 时仅入队，由独立worker进程处理）
+ingestion_queue = IngestionQueue(document_processor)
 report_generator = ReportGenerator(openai_handler, vector_store)
+# 批量报告（清单文件记录进度，可断点续跑）
+batch_runner = BatchReportRunner(report_generator)
+batch_tasks: Dict[str, asyncio.Task] = {}
 
 # 中间件 - 请求计时和日志
 @app.middleware("http")
@@ -89,6 +107,169 @@ async def add_process_time_header(request: Request, call_next):
 async def health_check():
     return {"status": "ok", "version": "1.0.0"}
 
+# 流式对话请求
+class ChatStreamRequest(BaseModel):
+    messages: List[Dict[str, str]]
+    provider: str = "openai"  # openai, claude
+    model: Optional[str] = None
+    temperature: float = 0.7
+    max_tokens: Optional[int] = None
+
+# 流式对话端点 - 以SSE逐段返回模型输出
+@app.post("/api/chat/stream")
+async def chat_stream(body: ChatStreamRequest):
+    if body.provider == "claude":
+        deltas = claude_handler.stream_response(
+            messages=body.messages,
+            model=body.model or "claude-3-opus",
+            temperature=body.temperature,
+            max_tokens=body.max_tokens or 2000
+        )
+    elif body.provider == "openai":
+        deltas = openai_handler.stream_chat_completion(
+            messages=body.messages,
+            model=body.model,
+            temperature=body.temperature,
+            max_tokens=body.max_tokens
+        )
+    else:
+        raise HTTPException(status_code=400, detail=f"Unsupported provider: {body.provider}")
+    
+    async def event_stream():
+        try:
+            async for delta in deltas:
+                yield f"data: {json.dumps({'delta': delta}, ensure_ascii=False)}\n\n"
+        except Exception as e:
+            logger.error(f"流式对话出错: {e}")
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)}, ensure_ascii=False)}\n\n"
+        yield "data: [DONE]\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# 文档上传 - 写入磁盘后立即入队，返回任务ID
+@app.post("/api/documents/upload", status_code=status.HTTP_202_ACCEPTED)
+async def upload_document(
+    file: UploadFile = File(...),
+    idempotency_key: Optional[str] = Header(None)
+):
+    max_bytes = int(float(os.getenv("MAX_UPLOAD_SIZE", 10)) * 1024 * 1024)
+    ext = os.path.splitext(file.filename or "")[1].lower()
+    ingest_dir = UPLOAD_DIR / "ingest"
+    ingest_dir.mkdir(parents=True, exist_ok=True)
+    path = ingest_dir / f"{uuid.uuid4().hex}{ext}"
+    
+    # 分块写入并计算内容哈希；未提供Idempotency-Key时以内容哈希去重
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "wb") as f:
+        while block := await file.read(1024 * 1024):
+            size += len(block)
+            if size > max_bytes:
+                f.close()
+                path.unlink()
+                raise HTTPException(status_code=413, detail=f"File exceeds {max_bytes // (1024 * 1024)}MB")
+            digest.update(block)
+            f.write(block)
+    
+    job, created = await ingestion_queue.submit(
+        str(path), filename=file.filename, job_id=idempotency_key or digest.hexdigest()
+    )
+    if not created:
+        path.unlink()
+    return {**public_view(job), "created": created}
+
+# 入库任务进度
+@app.get("/api/documents/jobs/{job_id}")
+async def get_ingestion_job(job_id: str):
+    job = await ingestion_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return public_view(job)
+
+# 取消入库任务
+@app.delete("/api/documents/jobs/{job_id}")
+async def cancel_ingestion_job(job_id: str):
+    job = await ingestion_queue.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return public_view(job)
+
+# 批量报告请求：地区 × 产业 × 报告类型
+class ReportBatchRequest(BaseModel):
+    regions: List[str] = []
+    province: Optional[str] = None  # 追加该省在PROVINCE_MAP中的全部城市
+    industries: List[str] = []
+    report_types: List[str] = ["comprehensive"]
+    language: str = "zh"
+    include_charts: bool = True
+
+def start_report_batch(batch_id: str) -> None:
+    task = batch_tasks.get(batch_id)
+    if task is None or task.done():
+        batch_tasks[batch_id] = asyncio.create_task(batch_runner.run(batch_id))
+
+# 创建并启动批量报告
+@app.post("/api/reports/batch", status_code=status.HTTP_202_ACCEPTED)
+async def create_report_batch(body: ReportBatchRequest):
+    regions = expand_regions(body.regions, body.province)
+    if not (regions or body.industries) or not body.report_types:
+        raise HTTPException(status_code=400, detail="At least one region or industry and one report type are required")
+    manifest = batch_runner.create(regions, body.industries, body.report_types, body.language, body.include_charts)
+    start_report_batch(manifest["id"])
+    return manifest
+
+# 批量报告进度
+@app.get("/api/reports/batch/{batch_id}")
+async def get_report_batch(batch_id: str):
+    manifest = batch_runner.load(batch_id)
+    if manifest is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return manifest
+
+# 续跑中断或部分失败的批量报告
+@app.post("/api/reports/batch/{batch_id}/resume", status_code=status.HTTP_202_ACCEPTED)
+async def resume_report_batch(batch_id: str):
+    manifest = batch_runner.load(batch_id)
+    if manifest is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    start_report_batch(batch_id)
+    return manifest
+
+# 报告文件的媒体类型
+REPORT_MEDIA_TYPES = {
+    "json": "application/json",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "pdf": "application/pdf",
+}
+
+# 报告下载 - 带ETag，If-None-Match命中时返回304；文件由FileResponse直接从磁盘发送
+@app.get("/api/download/report/{report_id}")
+async def download_report(report_id: str, format: Optional[str] = None, if_none_match: Optional[str] = Header(None)):
+    entry = await asyncio.to_thread(report_generator.artifact_cache.get, report_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Report not found")
+    # 默认下载首选的渲染格式，没有则下载JSON
+    fmt = format or next((f for f in report_generator.render_formats if f in entry["files"]), "json")
+    file = entry["files"].get(fmt)
+    if file is None:
+        raise HTTPException(status_code=404, detail=f"Report has no {fmt} file")
+    
+    headers = {"ETag": file["etag"], "Cache-Control": "private, no-cache"}
+    if if_none_match:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        if "*" in tags or file["etag"] in tags:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return FileResponse(
+        file["path"],
+        media_type=REPORT_MEDIA_TYPES.get(fmt, "application/octet-stream"),
+        filename=f"{report_id}.{fmt}",
+        headers=headers
+    )
+
 # API路由组
 from backend.routes import auth, chat, reports, admin, documents
 
@@ -123,6 +304,16 @@ async def startup_event():
     logger.info("应用启动中...")
     # 测试数据库连接
     # 初始化服务
+    await openai_handler.start()
+    if isinstance(vector_store, PgVectorStore):
+        try:
+            await vector_store.connect()
+        except Exception as e:
+            logger.error(f"向量数据库连接失败: {e}")
+    await document_processor.start()
+    ingestion_queue.start()
+    await report_generator.renderer.start()
+    await report_generator.templates.start()
     
     # 预热模型
     try:
@@ -139,7 +330,14 @@ async def startup_event():
 async def shutdown_event():
     logger.info("应用关闭中...")
     # 关闭连接和资源
-    openai_handler.close()
+    await ingestion_queue.stop()
+    await ingestion_queue.store.close()
+    await document_processor.close()
+    await report_generator.renderer.close()
+    await report_generator.templates.close()
+    await openai_handler.close()
+    if isinstance(vector_store, PgVectorStore):
+        await vector_store.close()
 
 # 主入口点
 if __name__ == "__main__":
@@ -1,16 +1,31 @@
 import os
 import json
 import asyncio
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, AsyncIterator, Tuple
 import anthropic
 from anthropic import AsyncAnthropic
 
+from backend.models.response_cache import ResponseCache
+from backend.models.retry import RetryPolicy, RetryableError, parse_retry_after
+
+# Errors worth retrying: rate limits, overload and transient transport failures
+RETRYABLE_ERRORS = (
+    anthropic.RateLimitError,
+    anthropic.InternalServerError,
+    anthropic.APIConnectionError,
+)
+
 class ClaudeHandler:
-    def __init__(self):
+    def __init__(self, response_cache: Optional[ResponseCache] = None):
         # Initialize with API key from environment variable
         # In production, use a secure way to store and retrieve API keys
         self.api_key = os.getenv("ANTHROPIC_API_KEY", "YOUR_API_KEY_HERE")
-        self.client = AsyncAnthropic(api_key=self.api_key)
+        # Retries are handled by our async RetryPolicy so both handlers back off the same way
+        self.client = AsyncAnthropic(api_key=self.api_key, max_retries=0)
+        self.retry_policy = RetryPolicy.from_env()
+        
+        # Optional response cache, usually shared with OpenAIHandler
+        self.response_cache = response_cache
         
         # System prompt for industrial assessment
         self.system_prompt = """
@@ -31,12 +46,44 @@ class ClaudeHandler:
         When generating visualizations, use clear labels and ensure data accuracy.
         """
     
+    def _format_messages(self, messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """Convert chat messages to Claude's format, prepending the system prompt"""
+        formatted_messages = []
+        for msg in messages:
+            role = msg["role"]
+            # Claude uses 'user' and 'assistant' roles
+            if role == "system":
+                role = "user"
+            formatted_messages.append({"role": role, "content": msg["content"]})
+        
+        # Prepend system message
+        if not any(msg.get("role") == "system" for msg in messages):
+            formatted_messages.insert(0, {"role": "user", "content": self.system_prompt})
+        return formatted_messages
+    
+    async def _create(self, deadline: Optional[float], **kwargs) -> Any:
+        """Call messages.create under the shared retry policy"""
+        async def create():
+            try:
+                return await self.client.messages.create(**kwargs)
+            except RETRYABLE_ERRORS as e:
+                response = getattr(e, "response", None)
+                raise RetryableError(
+                    str(e),
+                    retry_after=parse_retry_after(response.headers if response is not None else None),
+                    cause=e
+                )
+        
+        return await self.retry_policy.call(create, deadline=deadline, description="Claude API call")
+    
     async def generate_response(
         self, 
         messages: List[Dict[str, str]],
         model: str = "claude-3-opus",
         temperature: float = 0.7,
-        max_tokens: int = 2000
+        max_tokens: int = 2000,
+        deadline: Optional[float] = None,
+        cache_scope: Optional[Tuple[Optional[str], Optional[str]]] = None
     ) -> str:
         """
         Generate a response using Anthropic's Claude API
@@ -46,38 +93,79 @@ class ClaudeHandler:
             model: Claude model to use
             temperature: Controls randomness (0-1)
             max_tokens: Maximum tokens in the response
+            deadline: Total time budget in seconds, including retries
+            cache_scope: (industry, region) scope for the response cache;
+                ignored when temperature > 0
             
         Returns:
             Generated response as a string
         """
         try:
-            # Format messages for Claude API
-            formatted_messages = []
-            for msg in messages:
-                role = msg["role"]
-                # Claude uses 'user' and 'assistant' roles
-                if role == "system":
-                    role = "user"
-                formatted_messages.append({"role": role, "content": msg["content"]})
-            
-            # Prepend system message
-            if not any(msg.get("role") == "system" for msg in messages):
-                formatted_messages.insert(0, {"role": "user", "content": self.system_prompt})
+            if self.response_cache is not None:
+                cached = await self.response_cache.get(
+                    messages, model, temperature, max_tokens, scope=cache_scope
+                )
+                if cached is not None:
+                    return cached
             
-            # Call Claude API
-            response = await self.client.messages.create(
+            response = await self._create(
+                deadline,
                 model=model,
-                messages=formatted_messages,
+                messages=self._format_messages(messages),
                 temperature=temperature,
                 max_tokens=max_tokens
             )
             
-            return response.content[0].text
+            text = response.content[0].text
+            if self.response_cache is not None:
+                await self.response_cache.put(
+                    messages, model, temperature, text, max_tokens, scope=cache_scope
+                )
+            return text
         
         except Exception as e:
             print(f"Error calling Claude API: {str(e)}")
             return f"I apologize, but I encountered an error: {str(e)}"
     
+    async def stream_response(
+        self,
+        messages: List[Dict[str, str]],
+        model: str = "claude-3-opus",
+        temperature: float = 0.7,
+        max_tokens: int = 2000,
+        deadline: Optional[float] = None
+    ) -> AsyncIterator[str]:
+        """
+        Stream a response from Claude as text deltas
+        
+        Only opening the stream is retried; once text has been yielded a
+        failure propagates to the caller instead of replaying output.
+        
+        Args:
+            messages: List of message dictionaries with 'role' and 'content'
+            model: Claude model to use
+            temperature: Controls randomness (0-1)
+            max_tokens: Maximum tokens in the response
+            deadline: Time budget in seconds for opening the stream
+            
+        Yields:
+            Text deltas as they arrive
+        """
+        stream = await self._create(
+            deadline,
+            model=model,
+            messages=self._format_messages(messages),
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True
+        )
+        try:
+            async for event in stream:
+                if event.type == "content_block_delta" and getattr(event.delta, "text", None):
+                    yield event.delta.text
+        finally:
+            await stream.close()
+    
     async def generate_report_content(
         self,
         report_type: str,
@@ -0,0 +1,132 @@
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, List, Optional
+
+from backend.models.tokens import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    """
+    异步令牌桶，用于RPM/TPM限流
+
+    容量为每分钟配额，按速率连续补充；不足时用 asyncio.sleep 等待。
+    """
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self, amount: float = 1.0) -> None:
+        """获取amount个令牌；超过容量的请求按容量计，避免永远等待"""
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+class EmbeddingBatcher:
+    """
+    嵌入请求调度器
+
+    按token数（而非条数）打包批次，在信号量与RPM/TPM令牌桶约束下并发发送，
+    结果按输入顺序返回。每个批次独立重试（由send_batch内部的重试策略负责），
+    失败的批次不会导致其他批次重发；某个批次最终失败时，其余未完成的批次被取消。
+    """
+
+    def __init__(
+        self,
+        send_batch: Callable[..., Awaitable[List[List[float]]]],
+        max_batch_tokens: int = 8000,
+        max_batch_items: int = 2048,
+        concurrency: int = 4,
+        requests_per_minute: float = 3000,
+        tokens_per_minute: float = 1_000_000
+    ):
+        self.send_batch = send_batch
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_items = max_batch_items
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+
+    def pack(self, token_counts: List[int]) -> List[List[int]]:
+        """
+        按顺序将输入打包为批次（每批不超过token与条数上限）
+
+        Args:
+            token_counts: 每条输入的token数
+
+        Returns:
+            批次列表，每个批次为输入下标列表
+        """
+        batches, current, current_tokens = [], [], 0
+        for index, tokens in enumerate(token_counts):
+            if current and (current_tokens + tokens > self.max_batch_tokens or len(current) >= self.max_batch_items):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(index)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    async def embed(self, texts: List[str], **kwargs: Any) -> List[List[float]]:
+        """
+        为文本生成嵌入向量，保持输入顺序
+
+        Args:
+            texts: 文本列表
+            **kwargs: 透传给send_batch的参数（如model、deadline）
+
+        Returns:
+            嵌入向量列表
+        """
+        if not texts:
+            return []
+
+        token_counts = [estimate_tokens(text) for text in texts]
+        batches = self.pack(token_counts)
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        started = time.perf_counter()
+
+        async def run(batch: List[int]) -> None:
+            batch_tokens = sum(token_counts[i] for i in batch)
+            async with self.semaphore:
+                await self.request_bucket.acquire(1)
+                await self.token_bucket.acquire(batch_tokens)
+                vectors = await self.send_batch([texts[i] for i in batch], **kwargs)
+            for i, vector in zip(batch, vectors):
+                results[i] = vector
+
+        # 任一批次失败（重试耗尽）即取消其余批次，不再继续发送注定被丢弃的请求
+        tasks = [asyncio.ensure_future(run(batch)) for batch in batches]
+        try:
+            done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                if task.exception() is not None:
+                    raise task.exception()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        total_tokens = sum(token_counts)
+        logger.info(
+            f"嵌入完成: {len(texts)}条/{len(batches)}批, {total_tokens} tokens, 用时{elapsed:.2f}s "
+            f"({len(texts) / elapsed:.1f} texts/s, {total_tokens / elapsed:.0f} tokens/s)"
+        )
+        return results
@@ -0,0 +1,145 @@
+import os
+import time
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+import unicodedata
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+def normalize_text(text: str) -> str:
+    """规范化文本（NFKC、合并空白），使仅有格式差异的块命中同一缓存项"""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+def cache_key(text: str, model: str) -> str:
+    """缓存键：hash(规范化文本, 模型名)"""
+    return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    """
+    基于内容寻址的持久化嵌入缓存（SQLite）
+
+    以 hash(规范化文本, 模型) 为键存储float32向量，按最近访问时间做LRU淘汰，
+    记录命中/未命中次数。SQLite操作在线程中执行，不阻塞事件循环。
+
+    条目数不在每次写入时全表统计：进程内累计写入数（按上限估计，覆盖已有
+    键也计入）超过上限时才执行 COUNT(*)，超限则一次淘汰到上限的90%，
+    因此统计与淘汰的开销按写入条数摊销。
+    """
+
+    # 超限时淘汰到上限的这一比例
+    EVICT_TO = 0.9
+
+    def __init__(self, path: str = "./data/embedding_cache.sqlite", max_entries: int = 200000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, model TEXT NOT NULL, vector BLOB NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings(last_access)")
+        self._conn.commit()
+        # 条目数的上界：上次统计结果加之后写入的条数
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def _get_many(self, keys: Sequence[str]) -> List[Optional[List[float]]]:
+        found = {}
+        with self._lock:
+            # SQLite限制单条语句的参数数量，分段查询
+            for start in range(0, len(keys), 500):
+                part = keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE key = ?", [(now, key) for key in found]
+                )
+                self._conn.commit()
+        return [
+            np.frombuffer(found[key], dtype="<f4").tolist() if key in found else None
+            for key in keys
+        ]
+
+    def _put_many(self, keys: Sequence[str], model: str, vectors: Sequence[Sequence[float]]) -> None:
+        now = time.time()
+        rows = [
+            (key, model, np.asarray(vector, dtype="<f4").tobytes(), now)
+            for key, vector in zip(keys, vectors)
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector, last_access) VALUES (?, ?, ?, ?)", rows
+            )
+            self._count += len(rows)
+            if self._count > self.max_entries:
+                # 估计值超限才统计；其他进程的写入也在此时计入
+                self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+                if self._count > self.max_entries:
+                    # 淘汰最久未访问的条目
+                    target = int(self.max_entries * self.EVICT_TO)
+                    self._conn.execute(
+                        "DELETE FROM embeddings WHERE key IN "
+                        "(SELECT key FROM embeddings ORDER BY last_access LIMIT ?)",
+                        (self._count - target,)
+                    )
+                    self._count = target
+            self._conn.commit()
+
+    async def get_many(self, texts: Sequence[str], model: str) -> List[Optional[List[float]]]:
+        """
+        批量查询缓存
+
+        Args:
+            texts: 文本列表
+            model: 嵌入模型
+
+        Returns:
+            与输入对应的向量，未命中为None
+        """
+        keys = [cache_key(text, model) for text in texts]
+        vectors = await asyncio.to_thread(self._get_many, keys)
+        hits = sum(1 for vector in vectors if vector is not None)
+        self.hits += hits
+        self.misses += len(vectors) - hits
+        return vectors
+
+    async def put_many(self, texts: Sequence[str], model: str, vectors: Sequence[Sequence[float]]) -> None:
+        """
+        批量写入缓存
+
+        Args:
+            texts: 文本列表
+            model: 嵌入模型
+            vectors: 与文本对应的向量
+        """
+        keys = [cache_key(text, model) for text in texts]
+        await asyncio.to_thread(self._put_many, keys, model, vectors)
+
+    def stats(self) -> dict:
+        """命中统计"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -1,11 +1,15 @@
 import os
 import json
 import logging
-from typing import Dict, List, Any, Optional
-import time
+from typing import Dict, List, Any, Optional, AsyncIterator, Tuple
 import httpx
 from dotenv import load_dotenv
 
+from backend.models.embedding_batcher import EmbeddingBatcher
+from backend.models.embedding_cache import EmbeddingCache, normalize_text
+from backend.models.response_cache import ResponseCache
+from backend.models.retry import RetryPolicy, RetryableError, RETRYABLE_STATUS_CODES, parse_retry_after
+
 # 加载环境变量
 load_dotenv()
 
@@ -13,6 +17,13 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# HTTP/2 需要可选依赖 h2（httpx[http2]）
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
 class OpenAIHandler:
     """处理与OpenAI API的交互"""
     
@@ -22,15 +33,92 @@ class OpenAIHandler:
             logger.error("OPENAI_API_KEY未设置")
             raise ValueError("OPENAI_API_KEY环境变量未设置")
             
-        self.base_url = "https://api.openai.com/v1"
+        self.base_url = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
         self.default_model = os.getenv("DEFAULT_MODEL", "gpt-4-turbo-preview")
         self.timeout = httpx.Timeout(30.0, connect=10.0)
         
-        # 初始化HTTP客户端
-        self.client = httpx.Client(
-            headers={"Authorization": f"Bearer {self.api_key}"},
-            timeout=self.timeout
+        # 连接池配置：所有请求复用同一个客户端的连接
+        self.limits = httpx.Limits(
+            max_connections=int(os.getenv("OPENAI_MAX_CONNECTIONS", 100)),
+            max_keepalive_connections=int(os.getenv("OPENAI_MAX_KEEPALIVE", 20)),
+            keepalive_expiry=float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", 30.0))
         )
+        self.http2 = os.getenv("OPENAI_HTTP2", "true").lower() == "true"
+        if self.http2 and not HTTP2_AVAILABLE:
+            logger.warning("未安装h2，回退到HTTP/1.1（pip install httpx[http2]）")
+            self.http2 = False
+        
+        # 重试策略（异步退避，LLM_MAX_ATTEMPTS / LLM_RETRY_DEADLINE 等环境变量可调）
+        self.retry_policy = RetryPolicy.from_env()
+        
+        # 嵌入批处理调度：按token打包、并发发送、RPM/TPM限流
+        self.embedding_batcher = EmbeddingBatcher(
+            self._embed_batch,
+            max_batch_tokens=int(os.getenv("EMBEDDING_BATCH_TOKENS", 8000)),
+            concurrency=int(os.getenv("EMBEDDING_CONCURRENCY", 4)),
+            requests_per_minute=float(os.getenv("OPENAI_EMBEDDING_RPM", 3000)),
+            tokens_per_minute=float(os.getenv("OPENAI_EMBEDDING_TPM", 1000000))
+        )
+        
+        # text-embedding-3 模型按此维度输出（API的dimensions参数）；须与向量库一致，
+        # pgvector的 embeddings.embedding 列为 vector(1536)，ivfflat索引最多支持2000维
+        self.embedding_dimensions = int(os.getenv("EMBEDDING_DIMENSIONS", 1536)) or None
+        
+        # 内容寻址的嵌入缓存（EMBEDDING_CACHE=false 可关闭）
+        self.embedding_cache: Optional[EmbeddingCache] = None
+        if os.getenv("EMBEDDING_CACHE", "true").lower() == "true":
+            self.embedding_cache = EmbeddingCache(
+                path=os.getenv("EMBEDDING_CACHE_PATH", "./data/embedding_cache.sqlite"),
+                max_entries=int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", 200000))
+            )
+        
+        # 回答缓存（精确匹配 + 可选语义匹配），ClaudeHandler可共用同一实例
+        self.response_cache = ResponseCache.from_env(embed=self.embeddings)
+        
+        # 异步HTTP客户端在应用启动时创建（见 start），关闭时释放（见 close）
+        self.client: Optional[httpx.AsyncClient] = None
+    
+    async def start(self) -> httpx.AsyncClient:
+        """创建共享的异步HTTP客户端（幂等）"""
+        if self.client is None or self.client.is_closed:
+            self.client = httpx.AsyncClient(
+                headers={"Authorization": f"Bearer {self.api_key}"},
+                timeout=self.timeout,
+                limits=self.limits,
+                http2=self.http2
+            )
+            logger.info(f"OpenAI HTTP客户端已创建 (http2={self.http2})")
+        return self.client
+    
+    async def _post(self, url: str, payload: Dict[str, Any], description: str) -> httpx.Response:
+        """
+        单次POST请求；可重试的错误转换为 RetryableError 交给重试策略处理
+        
+        Args:
+            url: 请求地址
+            payload: 请求体
+            description: 日志中的操作描述
+            
+        Returns:
+            状态码为200的响应
+        """
+        client = await self.start()
+        response = await client.post(url, json=payload)
+        
+        if response.status_code == 200:
+            return response
+        if response.status_code in RETRYABLE_STATUS_CODES:
+            error = httpx.HTTPStatusError(
+                f"{description}错误: {response.status_code}", request=response.request, response=response
+            )
+            raise RetryableError(
+                f"HTTP {response.status_code}",
+                retry_after=parse_retry_after(response.headers),
+                cause=error
+            )
+        logger.error(f"{description}错误: {response.status_code} - {response.text}")
+        response.raise_for_status()
+        return response
     
     async def chat_completion(
         self, 
@@ -38,7 +126,9 @@ class OpenAIHandler:
         model: Optional[str] = None,
         temperature: float = 0.7,
         max_tokens: Optional[int] = None,
-        stream: bool = False
+        stream: bool = False,
+        deadline: Optional[float] = None,
+        cache_scope: Optional[Tuple[Optional[str], Optional[str]]] = None
     ) -> Dict[str, Any]:
         """
         发送对话请求到OpenAI API
@@ -48,113 +138,219 @@ class OpenAIHandler:
             model: 使用的模型，默认为gpt-4-turbo-preview
             temperature: 温度参数，控制随机性
             max_tokens: 最大生成的token数
-            stream: 是否使用流式响应
+            stream: 是否使用流式响应（为True时返回 stream_chat_completion 的异步生成器）
+            deadline: 本次调用（含重试）的总时限，单位秒
+            cache_scope: 回答缓存的 (行业, 地区) 范围；temperature > 0 时不使用缓存
             
         Returns:
             API响应数据
         """
+        if stream:
+            # 流式请求返回异步生成器，逐段产出文本增量
+            return self.stream_chat_completion(
+                messages, model=model, temperature=temperature, max_tokens=max_tokens, deadline=deadline
+            )
+        
         try:
             url = f"{self.base_url}/chat/completions"
             payload = {
                 "model": model or self.default_model,
                 "messages": messages,
                 "temperature": temperature,
-                "stream": stream
+                "stream": False
             }
             
             if max_tokens:
                 payload["max_tokens"] = max_tokens
-                
-            # 添加请求重试逻辑
-            max_retries = 3
-            retry_delay = 1  # 初始延迟1秒
             
-            for attempt in range(max_retries):
-                try:
-                    async with httpx.AsyncClient(
-                        headers={"Authorization": f"Bearer {self.api_key}"},
-                        timeout=self.timeout
-                    ) as client:
-                        response = await client.post(url, json=payload)
-                        
-                        if response.status_code == 200:
-                            if stream:
-                                return response.aiter_lines()
-                            return response.json()
-                        elif response.status_code == 429:  # 速率限制
-                            retry_delay = min(retry_delay * 2, 60)  # 指数退避，最多等待60秒
-                            logger.warning(f"API速率限制，重试前等待{retry_delay}秒")
-                            time.sleep(retry_delay)
-                            continue
-                        else:
-                            logger.error(f"OpenAI API错误: {response.status_code} - {response.text}")
-                            response.raise_for_status()
-                    
-                except (httpx.ConnectError, httpx.TimeoutException) as e:
-                    logger.warning(f"连接错误: {e}. 尝试 {attempt+1}/{max_retries}")
-                    if attempt == max_retries - 1:
-                        raise
-                    time.sleep(retry_delay)
-                    retry_delay = min(retry_delay * 2, 60)
-            
-            logger.error("重试次数用尽")
-            raise httpx.RequestError("重试次数用尽")
+            if self.response_cache is not None:
+                cached = await self.response_cache.get(
+                    messages, payload["model"], temperature, max_tokens, scope=cache_scope
+                )
+                if cached is not None:
+                    return cached
+                
+            # 速率限制/连接错误时异步退避重试，不阻塞事件循环
+            response = await self.retry_policy.call(
+                lambda: self._post(url, payload, "OpenAI API"),
+                retry_on=(httpx.ConnectError, httpx.TimeoutException),
+                deadline=deadline,
+                description="OpenAI对话请求"
+            )
+            result = response.json()
+            if self.response_cache is not None:
+                await self.response_cache.put(
+                    messages, payload["model"], temperature, result, max_tokens, scope=cache_scope
+                )
+            return result
             
         except Exception as e:
             logger.error(f"调用OpenAI API时出错: {e}")
             raise
     
-    async def embeddings(self, texts: List[str], model: str = "text-embedding-3-large") -> List[List[float]]:
+    async def stream_chat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        model: Optional[str] = None,
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        deadline: Optional[float] = None
+    ) -> AsyncIterator[str]:
+        """
+        流式对话：逐条解析SSE事件，产出文本增量
+        
+        重试只覆盖建立连接与响应头阶段；开始产出内容后不再重试，
+        以免向调用方重复输出。
+        
+        Args:
+            messages: 对话消息列表
+            model: 使用的模型
+            temperature: 温度参数
+            max_tokens: 最大生成的token数
+            deadline: 建立流（含重试）的时限，单位秒
+            
+        Yields:
+            文本增量
+        """
+        url = f"{self.base_url}/chat/completions"
+        payload = {
+            "model": model or self.default_model,
+            "messages": messages,
+            "temperature": temperature,
+            "stream": True
+        }
+        if max_tokens:
+            payload["max_tokens"] = max_tokens
+        
+        async def open_stream() -> httpx.Response:
+            client = await self.start()
+            response = await client.send(client.build_request("POST", url, json=payload), stream=True)
+            if response.status_code == 200:
+                return response
+            await response.aread()
+            await response.aclose()
+            if response.status_code in RETRYABLE_STATUS_CODES:
+                raise RetryableError(
+                    f"HTTP {response.status_code}",
+                    retry_after=parse_retry_after(response.headers),
+                    cause=httpx.HTTPStatusError(
+                        f"OpenAI流式API错误: {response.status_code}", request=response.request, response=response
+                    )
+                )
+            logger.error(f"OpenAI流式API错误: {response.status_code} - {response.text}")
+            response.raise_for_status()
+        
+        response = await self.retry_policy.call(
+            open_stream,
+            retry_on=(httpx.ConnectError, httpx.TimeoutException),
+            deadline=deadline,
+            description="OpenAI流式对话请求"
+        )
+        try:
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                choices = json.loads(data).get("choices") or []
+                delta = choices[0].get("delta", {}).get("content") if choices else None
+                if delta:
+                    yield delta
+        finally:
+            await response.aclose()
+    
+    async def _embed_batch(
+        self,
+        batch: List[str],
+        model: str = "text-embedding-3-large",
+        deadline: Optional[float] = None
+    ) -> List[List[float]]:
+        """
+        发送单个嵌入批次（含重试）
+        
+        Args:
+            batch: 文本批次
+            model: 使用的嵌入模型
+            deadline: 本批次（含重试）的总时限，单位秒
+            
+        Returns:
+            与批次顺序一致的嵌入向量
+        """
+        url = f"{self.base_url}/embeddings"
+        payload = {
+            "model": model,
+            "input": batch
+        }
+        if self.embedding_dimensions and model.startswith("text-embedding-3"):
+            payload["dimensions"] = self.embedding_dimensions
+        response = await self.retry_policy.call(
+            lambda: self._post(url, payload, "OpenAI嵌入API"),
+            retry_on=(httpx.ConnectError, httpx.TimeoutException),
+            deadline=deadline,
+            description="OpenAI嵌入请求"
+        )
+        data = sorted(response.json()["data"], key=lambda item: item["index"])
+        return [item["embedding"] for item in data]
+    
+    async def embeddings(
+        self,
+        texts: List[str],
+        model: str = "text-embedding-3-large",
+        deadline: Optional[float] = None
+    ) -> List[List[float]]:
         """
         为文本生成嵌入向量
         
+        按token数打包批次，在并发与RPM/TPM限额内并行请求（见 EmbeddingBatcher）。
+        
         Args:
             texts: 要嵌入的文本列表
             model: 使用的嵌入模型
+            deadline: 每个批次（含重试）的总时限，单位秒
             
         Returns:
             嵌入向量列表
         """
         try:
-            url = f"{self.base_url}/embeddings"
+            if self.embedding_cache is None:
+                return await self.embedding_batcher.embed(texts, model=model, deadline=deadline)
             
-            # 对于大量文本，分批处理
-            batch_size = 20
-            all_embeddings = []
+            # 先查缓存，只有未命中（且本次调用内去重后）的文本才请求API；
+            # 缓存按模型与输出维度区分
+            cache_model = model
+            if self.embedding_dimensions and model.startswith("text-embedding-3"):
+                cache_model = f"{model}@{self.embedding_dimensions}"
+            results = await self.embedding_cache.get_many(texts, cache_model)
+            pending: Dict[str, List[int]] = {}
+            for i, vector in enumerate(results):
+                if vector is None:
+                    pending.setdefault(normalize_text(texts[i]), []).append(i)
             
-            for i in range(0, len(texts), batch_size):
-                batch = texts[i:i + batch_size]
-                
-                payload = {
-                    "model": model,
-                    "input": batch
-                }
-                
-                async with httpx.AsyncClient(
-                    headers={"Authorization": f"Bearer {self.api_key}"},
-                    timeout=self.timeout
-                ) as client:
-                    response = await client.post(url, json=payload)
-                    
-                    if response.status_code == 200:
-                        result = response.json()
-                        batch_embeddings = [item["embedding"] for item in result["data"]]
-                        all_embeddings.extend(batch_embeddings)
-                    else:
-                        logger.error(f"OpenAI嵌入API错误: {response.status_code} - {response.text}")
-                        response.raise_for_status()
-                
-                # 避免触发速率限制
-                if i + batch_size < len(texts):
-                    time.sleep(0.5)
+            if pending:
+                miss_texts = [texts[indexes[0]] for indexes in pending.values()]
+                vectors = await self.embedding_batcher.embed(miss_texts, model=model, deadline=deadline)
+                await self.embedding_cache.put_many(miss_texts, cache_model, vectors)
+                for indexes, vector in zip(pending.values(), vectors):
+                    for i in indexes:
+                        results[i] = vector
             
-            return all_embeddings
+            stats = self.embedding_cache.stats()
+            logger.info(
+                f"嵌入缓存: 本次命中{len(texts) - sum(len(v) for v in pending.values())}/{len(texts)}, "
+                f"累计命中率{stats['hit_rate']:.1%}"
+            )
+            return results
             
         except Exception as e:
             logger.error(f"生成嵌入时出错: {e}")
             raise
     
-    def close(self):
+    async def close(self):
         """关闭HTTP客户端"""
-        if hasattr(self, 'client'):
-            self.client.close()
\ No newline at end of file
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+        if self.embedding_cache is not None:
+            self.embedding_cache.close()
+            self.embedding_cache = None
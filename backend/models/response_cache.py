@@ -0,0 +1,208 @@
+import os
+import copy
+import json
+import time
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from backend.models.embedding_cache import normalize_text
+
+logger = logging.getLogger(__name__)
+
+def _digest(value: Any) -> str:
+    return hashlib.sha256(json.dumps(value, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+def _normalize_messages(messages: Sequence[Dict[str, str]]) -> List[Tuple[str, str]]:
+    return [(msg.get("role", ""), normalize_text(msg.get("content", ""))) for msg in messages]
+
+class ResponseCache:
+    """
+    对话/分析回答缓存
+
+    - 精确匹配：规范化后的 (messages, model, temperature, max_tokens) 哈希
+    - 语义匹配（可选）：最后一条用户消息的向量与同一上下文、同一行业/地区范围内
+      已缓存问题的余弦相似度超过阈值时复用回答
+    - TTL过期 + LRU淘汰
+    - temperature > 0 的请求视为非确定性，自动绕过缓存
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        ttl: float = 3600,
+        similarity_threshold: Optional[float] = None,
+        embed: Optional[Callable[[List[str]], Awaitable[List[List[float]]]]] = None
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold if embed is not None else None
+        self.embed = embed
+
+        # key -> (response, expires_at, group, query_vector)
+        self._entries: "OrderedDict[str, Tuple[Any, float, str, Optional[np.ndarray]]]" = OrderedDict()
+        # group (上下文 + 参数 + 范围) -> 该组内的key，用于语义匹配
+        self._groups: Dict[str, List[str]] = {}
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls, embed=None) -> Optional["ResponseCache"]:
+        """根据 RESPONSE_CACHE* 环境变量创建；关闭时返回None"""
+        if os.getenv("RESPONSE_CACHE", "true").lower() != "true":
+            return None
+        threshold = os.getenv("RESPONSE_CACHE_SIMILARITY")
+        return cls(
+            max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 1000)),
+            ttl=float(os.getenv("CACHE_TIMEOUT", 3600)),
+            similarity_threshold=float(threshold) if threshold else None,
+            embed=embed
+        )
+
+    @staticmethod
+    def is_cacheable(temperature: float) -> bool:
+        """只缓存确定性请求"""
+        return temperature <= 0
+
+    def _keys(
+        self,
+        messages: Sequence[Dict[str, str]],
+        model: str,
+        temperature: float,
+        max_tokens: Optional[int],
+        scope: Optional[Tuple[Optional[str], Optional[str]]]
+    ) -> Tuple[str, str, str]:
+        normalized = _normalize_messages(messages)
+        params = {"model": model, "temperature": temperature, "max_tokens": max_tokens}
+        key = _digest({"messages": normalized, **params})
+        # 语义分组：除最后一条用户消息外的上下文相同，且参数与范围一致
+        group = _digest({"context": normalized[:-1], "scope": list(scope or (None, None)), **params})
+        query = normalized[-1][1] if normalized and normalized[-1][0] == "user" else ""
+        return key, group, query
+
+    def _evict(self) -> None:
+        now = time.time()
+        expired = [key for key, entry in self._entries.items() if entry[1] <= now]
+        for key in expired:
+            self._remove(key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            keys = self._groups.get(entry[2], [])
+            if key in keys:
+                keys.remove(key)
+            if not keys:
+                self._groups.pop(entry[2], None)
+
+    async def _embed_query(self, query: str) -> Optional[np.ndarray]:
+        if self.similarity_threshold is None or not query:
+            return None
+        try:
+            vector = np.asarray((await self.embed([query]))[0], dtype=np.float32)
+        except Exception as e:
+            logger.warning(f"回答缓存语义向量生成失败: {e}")
+            return None
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else None
+
+    async def get(
+        self,
+        messages: Sequence[Dict[str, str]],
+        model: str,
+        temperature: float,
+        max_tokens: Optional[int] = None,
+        scope: Optional[Tuple[Optional[str], Optional[str]]] = None
+    ) -> Optional[Any]:
+        """
+        查找缓存的回答
+
+        Args:
+            messages: 对话消息列表
+            model: 模型名
+            temperature: 温度参数（>0 时直接返回None）
+            max_tokens: 最大token数
+            scope: (行业, 地区)，语义匹配只在同一范围内进行
+
+        Returns:
+            缓存的回答，未命中为None
+        """
+        if not self.is_cacheable(temperature):
+            return None
+        self._evict()
+        key, group, query = self._keys(messages, model, temperature, max_tokens, scope)
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return copy.deepcopy(entry[0])
+
+        # 先取出候选条目，等待向量生成期间缓存可能被其他请求修改
+        candidates = [
+            (k, self._entries[k]) for k in self._groups.get(group, []) if self._entries[k][3] is not None
+        ]
+        if candidates:
+            vector = await self._embed_query(query)
+            if vector is not None:
+                matrix = np.stack([entry[3] for _, entry in candidates])
+                scores = matrix @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.similarity_threshold:
+                    best_key, best_entry = candidates[best]
+                    if best_key in self._entries:
+                        self._entries.move_to_end(best_key)
+                    self.hits += 1
+                    self.semantic_hits += 1
+                    logger.info(f"回答缓存语义命中 (相似度 {scores[best]:.3f})")
+                    return copy.deepcopy(best_entry[0])
+
+        self.misses += 1
+        return None
+
+    async def put(
+        self,
+        messages: Sequence[Dict[str, str]],
+        model: str,
+        temperature: float,
+        response: Any,
+        max_tokens: Optional[int] = None,
+        scope: Optional[Tuple[Optional[str], Optional[str]]] = None
+    ) -> None:
+        """
+        缓存回答（非确定性请求忽略）
+
+        Args:
+            messages: 对话消息列表
+            model: 模型名
+            temperature: 温度参数
+            response: 要缓存的回答
+            max_tokens: 最大token数
+            scope: (行业, 地区)
+        """
+        if not self.is_cacheable(temperature):
+            return
+        key, group, query = self._keys(messages, model, temperature, max_tokens, scope)
+        vector = await self._embed_query(query)
+
+        self._remove(key)
+        self._entries[key] = (copy.deepcopy(response), time.time() + self.ttl, group, vector)
+        self._groups.setdefault(group, []).append(key)
+        self._evict()
+
+    def stats(self) -> dict:
+        """命中统计"""
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
@@ -0,0 +1,131 @@
+import os
+import time
+import random
+import asyncio
+import logging
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Mapping, Optional, Tuple, Type
+
+logger = logging.getLogger(__name__)
+
+# 值得重试的HTTP状态码：速率限制与服务端临时错误
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504, 529}
+
+class RetryableError(Exception):
+    """操作请求重试；retry_after 为服务端要求的等待秒数，cause 为重试耗尽时抛出的原始异常"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None, cause: Optional[BaseException] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.cause = cause
+
+def parse_retry_after(headers: Optional[Mapping[str, str]]) -> Optional[float]:
+    """
+    解析 Retry-After / retry-after-ms 响应头
+
+    Args:
+        headers: 响应头
+
+    Returns:
+        等待秒数，无法解析时为None
+    """
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return max(float(value) / 1000, 0.0)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+class RetryPolicy:
+    """
+    异步重试策略：带抖动的指数退避、支持Retry-After、单次调用总时限
+
+    所有等待都使用 asyncio.sleep，退避期间事件循环可继续处理其他请求。
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        deadline: Optional[float] = None
+    ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+
+    @classmethod
+    def from_env(cls, prefix: str = "LLM") -> "RetryPolicy":
+        """从环境变量创建，例如 LLM_MAX_ATTEMPTS / LLM_RETRY_DEADLINE"""
+        deadline = os.getenv(f"{prefix}_RETRY_DEADLINE", "120")
+        return cls(
+            max_attempts=int(os.getenv(f"{prefix}_MAX_ATTEMPTS", 3)),
+            base_delay=float(os.getenv(f"{prefix}_RETRY_BASE_DELAY", 1.0)),
+            max_delay=float(os.getenv(f"{prefix}_RETRY_MAX_DELAY", 60.0)),
+            deadline=float(deadline) if deadline else None
+        )
+
+    def backoff(self, attempt: int) -> float:
+        """第attempt次失败后的等待时间（full jitter）"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    async def call(
+        self,
+        operation: Callable[[], Awaitable[Any]],
+        retry_on: Tuple[Type[BaseException], ...] = (),
+        deadline: Optional[float] = None,
+        description: str = "请求"
+    ) -> Any:
+        """
+        执行操作，失败时按策略重试
+
+        Args:
+            operation: 无参协程工厂，每次尝试调用一次
+            retry_on: 除 RetryableError 外需要重试的异常类型
+            deadline: 本次调用的总时限（秒），默认使用策略的deadline
+            description: 日志中的操作描述
+
+        Returns:
+            操作结果
+        """
+        budget = deadline if deadline is not None else self.deadline
+        expires_at = time.monotonic() + budget if budget else None
+        retryable = (RetryableError,) + tuple(retry_on)
+
+        for attempt in range(self.max_attempts):
+            remaining = expires_at - time.monotonic() if expires_at else None
+            if remaining is not None and remaining <= 0:
+                raise asyncio.TimeoutError(f"{description}超出时限 {budget}s")
+
+            try:
+                if remaining is None:
+                    return await operation()
+                return await asyncio.wait_for(operation(), timeout=remaining)
+            except retryable as e:
+                retry_after = getattr(e, "retry_after", None)
+                if attempt == self.max_attempts - 1:
+                    logger.error(f"{description}重试次数用尽: {e}")
+                    raise (getattr(e, "cause", None) or e)
+
+                delay = retry_after if retry_after is not None else self.backoff(attempt)
+                delay = min(delay, self.max_delay)
+                if expires_at and time.monotonic() + delay >= expires_at:
+                    logger.error(f"{description}剩余时限不足以等待{delay:.1f}秒，放弃重试: {e}")
+                    raise (getattr(e, "cause", None) or e)
+
+                logger.warning(f"{description}失败: {e}. {delay:.1f}秒后重试 ({attempt + 1}/{self.max_attempts})")
+                await asyncio.sleep(delay)
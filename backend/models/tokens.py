@@ -0,0 +1,34 @@
+import re
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# 可选依赖：安装tiktoken时使用精确计数，否则使用启发式估算
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:  # ImportError，或离线环境下无法加载编码表
+    _ENCODING = None
+
+# 中日韩字符（含全角标点），在cl100k中大多为1个或以上token
+_CJK_PATTERN = re.compile(r"[　-〿㐀-䶿一-鿿豈-﫿＀-￯]")
+
+def estimate_tokens(text: str, exact: Optional[bool] = None) -> int:
+    """
+    估算文本的token数
+    
+    Args:
+        text: 文本
+        exact: 是否使用tiktoken精确计数；默认在可用时使用
+        
+    Returns:
+        token数
+    """
+    if not text:
+        return 0
+    if _ENCODING is not None and exact is not False:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    # 启发式：每个中文字符约1个token，其余约4个字符1个token
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
@@ -0,0 +1,345 @@
+import os
+import logging
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Rows scored per matrix product when assigning vectors to lists
+ASSIGN_BATCH = 65536
+
+def top_k_rows(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Indices of the k highest finite scores, best first
+
+    Args:
+        scores: 1-D score array (-inf marks excluded rows)
+        k: Number of results
+
+    Returns:
+        Array of indices into scores
+    """
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    candidates = candidates[np.argsort(-scores[candidates])]
+    return candidates[np.isfinite(scores[candidates])]
+
+class ExactIndex:
+    """Brute-force cosine scan over every row"""
+
+    name = "exact"
+
+    def sync(self, matrix: np.ndarray) -> None:
+        """Nothing to maintain: the scan reads the matrix directly"""
+
+    def reset(self) -> None:
+        """Nothing to reset"""
+
+    def save(self, path: Optional[str] = None) -> None:
+        """Nothing to persist"""
+
+    def search(
+        self,
+        matrix: np.ndarray,
+        query: np.ndarray,
+        k: int,
+        mask: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return the top-k rows of matrix for a normalised query
+
+        Args:
+            matrix: (n, dim) normalised row matrix
+            query: (dim,) normalised query vector
+            k: Number of results
+            mask: Optional boolean array of eligible rows
+
+        Returns:
+            Tuple of (row indices, scores)
+        """
+        scores = matrix @ query
+        if mask is not None:
+            scores = np.where(mask, scores, -np.inf)
+        rows = top_k_rows(scores, k)
+        return rows, scores[rows]
+
+    def search_many(
+        self,
+        matrix: np.ndarray,
+        queries: np.ndarray,
+        k: int,
+        mask: Optional[np.ndarray] = None
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Return the top-k rows for several normalised queries with one matrix product
+
+        Args:
+            matrix: (n, dim) normalised row matrix
+            queries: (q, dim) normalised query vectors
+            k: Number of results per query
+            mask: Optional boolean array of eligible rows
+
+        Returns:
+            List of (row indices, scores), one per query
+        """
+        # (n, dim) @ (dim, q) reads the matrix once for all queries
+        scores = (np.asarray(matrix) @ queries.T).T
+        if mask is not None:
+            scores[:, ~mask] = -np.inf
+        results = []
+        for query_scores in scores:
+            rows = top_k_rows(query_scores, k)
+            results.append((rows, query_scores[rows]))
+        return results
+
+class IVFFlatIndex:
+    """
+    Inverted-file index with flat (uncompressed) vectors
+
+    Rows are assigned to the nearest of `nlist` spherical k-means centroids;
+    a query scores only the rows in its `nprobe` closest lists. This mirrors
+    the pgvector ivfflat index in db/init_vector.sql. Vectors themselves stay
+    in the shared memory-mapped matrix; the index stores only centroids and
+    row-to-list assignments.
+    """
+
+    name = "ivf"
+
+    def __init__(
+        self,
+        nlist: int = 100,
+        nprobe: int = 8,
+        path: Optional[str] = None,
+        train_iterations: int = 10,
+        seed: int = 0
+    ):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.path = path
+        self.train_iterations = train_iterations
+        self.seed = seed
+
+        self.centroids: Optional[np.ndarray] = None
+        self._assignments = np.empty(0, dtype=np.int32)
+        self._lists: List[np.ndarray] = []
+        self._dirty = False
+
+        if self.path and os.path.exists(self.path):
+            self.load(self.path)
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    @property
+    def ntotal(self) -> int:
+        return len(self._assignments)
+
+    def train(self, vectors: np.ndarray) -> None:
+        """
+        Train centroids with spherical k-means on (a sample of) vectors
+
+        Args:
+            vectors: (n, dim) normalised training vectors
+        """
+        rng = np.random.default_rng(self.seed)
+        nlist = min(self.nlist, len(vectors))
+        sample_size = min(len(vectors), 256 * nlist)
+        sample = np.asarray(vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))], dtype=np.float32)
+
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+        for _ in range(self.train_iterations):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            order = np.argsort(assign, kind="stable")
+            counts = np.bincount(assign, minlength=nlist)
+            sums = np.zeros_like(centroids)
+            present = counts > 0
+            sums[present] = np.add.reduceat(sample[order], np.concatenate([[0], np.cumsum(counts)[:-1]])[present])
+            # Re-seed empty lists from random sample points
+            empty = counts == 0
+            if empty.any():
+                sums[empty] = sample[rng.choice(sample_size, int(empty.sum()), replace=False)]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            centroids = sums / norms
+
+        self.centroids = centroids.astype(np.float32)
+        self.reset()
+        logger.info(f"IVF index trained: {nlist} lists on {sample_size} vectors")
+
+    def reset(self) -> None:
+        """Drop row assignments (e.g. after the store was compacted), keep centroids"""
+        self._assignments = np.empty(0, dtype=np.int32)
+        self._lists = [np.empty(0, dtype=np.int64) for _ in range(len(self.centroids) if self.is_trained else 0)]
+        self._dirty = True
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        """Nearest centroid for each vector, in batches to bound memory"""
+        out = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), ASSIGN_BATCH):
+            batch = np.asarray(vectors[start:start + ASSIGN_BATCH])
+            out[start:start + len(batch)] = np.argmax(batch @ self.centroids.T, axis=1)
+        return out
+
+    def sync(self, matrix: np.ndarray) -> None:
+        """
+        Assign any rows of matrix not yet in the index
+
+        Trains on first use once there are enough rows for meaningful lists.
+        """
+        if not self.is_trained:
+            if len(matrix) < 39 * self.nlist:
+                return
+            self.train(matrix)
+        if len(matrix) < self.ntotal:
+            self.reset()
+        if len(matrix) == self.ntotal:
+            return
+
+        start = self.ntotal
+        assign = self._assign(matrix[start:])
+        self._assignments = np.concatenate([self._assignments, assign])
+        order = np.argsort(assign, kind="stable")
+        bounds = np.searchsorted(assign[order], np.arange(len(self.centroids) + 1))
+        for list_id in range(len(self.centroids)):
+            new_rows = order[bounds[list_id]:bounds[list_id + 1]]
+            if len(new_rows):
+                self._lists[list_id] = np.concatenate([self._lists[list_id], new_rows + start])
+        self._dirty = True
+
+    def search(
+        self,
+        matrix: np.ndarray,
+        query: np.ndarray,
+        k: int,
+        mask: Optional[np.ndarray] = None,
+        nprobe: Optional[int] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return approximately the top-k rows for a normalised query
+
+        Falls back to an exact scan while the index is untrained.
+
+        Args:
+            matrix: (n, dim) normalised row matrix
+            query: (dim,) normalised query vector
+            k: Number of results
+            mask: Optional boolean array of eligible rows
+            nprobe: Lists to probe (defaults to self.nprobe)
+
+        Returns:
+            Tuple of (row indices, scores)
+        """
+        if not self.is_trained or self.ntotal != len(matrix):
+            self.sync(matrix)
+        if not self.is_trained:
+            return ExactIndex().search(matrix, query, k, mask)
+
+        probe = min(nprobe or self.nprobe, len(self.centroids))
+        centroid_scores = self.centroids @ query
+        lists = np.argpartition(-centroid_scores, probe - 1)[:probe]
+        candidates = np.sort(np.concatenate([self._lists[list_id] for list_id in lists]))
+        if mask is not None:
+            candidates = candidates[mask[candidates]]
+        if len(candidates) == 0:
+            return candidates, np.empty(0, dtype=np.float32)
+
+        scores = np.asarray(matrix[candidates]) @ query
+        best = top_k_rows(scores, k)
+        return candidates[best], scores[best]
+
+    def search_many(
+        self,
+        matrix: np.ndarray,
+        queries: np.ndarray,
+        k: int,
+        mask: Optional[np.ndarray] = None,
+        nprobe: Optional[int] = None
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Return approximately the top-k rows for several normalised queries
+
+        The rows of every list probed by any query are gathered once and
+        scored with one matrix product; each query then ranks only the rows
+        of its own lists, so results match search().
+
+        Args:
+            matrix: (n, dim) normalised row matrix
+            queries: (q, dim) normalised query vectors
+            k: Number of results per query
+            mask: Optional boolean array of eligible rows
+            nprobe: Lists to probe per query (defaults to self.nprobe)
+
+        Returns:
+            List of (row indices, scores), one per query
+        """
+        if not self.is_trained or self.ntotal != len(matrix):
+            self.sync(matrix)
+        if not self.is_trained:
+            return ExactIndex().search_many(matrix, queries, k, mask)
+
+        probe = min(nprobe or self.nprobe, len(self.centroids))
+        probed = np.argpartition(-(queries @ self.centroids.T), probe - 1, axis=1)[:, :probe]
+        candidates = np.sort(np.concatenate([self._lists[list_id] for list_id in np.unique(probed)]))
+        if mask is not None:
+            candidates = candidates[mask[candidates]]
+        if len(candidates) == 0:
+            return [(candidates, np.empty(0, dtype=np.float32)) for _ in range(len(queries))]
+
+        scores = (np.asarray(matrix[candidates]) @ queries.T).T
+        own = np.zeros((len(queries), len(self.centroids)), dtype=bool)
+        own[np.arange(len(queries))[:, None], probed] = True
+        scores[~own[:, self._assignments[candidates]]] = -np.inf
+        results = []
+        for query_scores in scores:
+            best = top_k_rows(query_scores, k)
+            results.append((candidates[best], query_scores[best]))
+        return results
+
+    def save(self, path: Optional[str] = None) -> None:
+        """Persist centroids and assignments to an .npz file"""
+        path = path or self.path
+        if not path or not self.is_trained or not self._dirty:
+            return
+        tmp_path = path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            centroids=self.centroids,
+            assignments=self._assignments,
+            nprobe=np.int32(self.nprobe)
+        )
+        os.replace(tmp_path, path)
+        self._dirty = False
+
+    def load(self, path: str) -> None:
+        """Load centroids and assignments saved by save()"""
+        with np.load(path) as data:
+            self.centroids = data["centroids"]
+            assignments = data["assignments"]
+        self.nlist = len(self.centroids)
+        self.reset()
+        self._assignments = assignments.astype(np.int32)
+        order = np.argsort(self._assignments, kind="stable")
+        bounds = np.searchsorted(self._assignments[order], np.arange(self.nlist + 1))
+        self._lists = [order[bounds[i]:bounds[i + 1]].astype(np.int64) for i in range(self.nlist)]
+        self._dirty = False
+
+def create_index(backend: Optional[str] = None, path: Optional[str] = None):
+    """
+    Build the ANN backend selected by VECTOR_INDEX (exact | ivf)
+
+    IVF parameters come from IVF_NLIST and IVF_NPROBE.
+    """
+    backend = (backend or os.getenv("VECTOR_INDEX", "exact")).lower()
+    if backend == "exact":
+        return ExactIndex()
+    if backend == "ivf":
+        return IVFFlatIndex(
+            nlist=int(os.getenv("IVF_NLIST", 100)),
+            nprobe=int(os.getenv("IVF_NPROBE", 8)),
+            path=path
+        )
+    raise ValueError(f"Unknown vector index backend: {backend}")
@@ -0,0 +1,284 @@
+import os
+import re
+from typing import Callable, List, Optional, Tuple
+
+from backend.models.tokens import estimate_tokens
+
+# Sentence ends: Chinese/ASCII terminal punctuation (plus closing quotes/brackets),
+# or an ASCII full stop followed by whitespace
+_SENTENCE_END = re.compile(r"(?:[。！？；!?;]+|\.(?=\s|$))[”’」』）)\"']*")
+
+# Headings: markdown, 第X章/节/条, 一、 / （一） / 1.2 numbering on a short line
+_HEADING = re.compile(
+    r"^(?:#{1,6}\s+\S"
+    r"|第[一二三四五六七八九十百千零〇\d]+[章节篇部分条]"
+    r"|[一二三四五六七八九十]+[、.．]\S"
+    r"|[（(][一二三四五六七八九十]+[）)]"
+    r"|\d+(?:\.\d+)*[、.．\s]\s*\S)"
+)
+_HEADING_MAX_CHARS = 50
+
+def split_sentences(text: str) -> List[str]:
+    """Split a line into sentences, keeping the punctuation; linear in len(text)"""
+    sentences = []
+    start = 0
+    for match in _SENTENCE_END.finditer(text):
+        sentences.append(text[start:match.end()])
+        start = match.end()
+    if start < len(text):
+        sentences.append(text[start:])
+    return sentences
+
+def heading_level(line: str) -> int:
+    """Outline level of a heading line (1 = top), or 0 if the line is not a heading"""
+    if len(line) > _HEADING_MAX_CHARS or line.endswith(("。", "；", "，", ";", ",")):
+        return 0
+    match = _HEADING.match(line)
+    if match is None:
+        return 0
+    if line.startswith("#"):
+        return len(line) - len(line.lstrip("#"))
+    if line.startswith("第"):
+        return 2 if line[match.end() - 1] in "节条" else 1
+    if line[0] in "（(":
+        return 4
+    if line[0].isdigit():
+        return 2 + line.split(None, 1)[0].rstrip("、.．").count(".")
+    return 3
+
+def is_table_row(line: str) -> bool:
+    # Extracted DOCX/XLSX tables are tab-separated; markdown tables use pipes
+    return "\t" in line or (line.startswith("|") and line.count("|") >= 2)
+
+class StructureChunker:
+    """
+    Structure-aware, token-budgeted chunker for (mostly Chinese) documents
+
+    Text is consumed incrementally with feed()/finish(), so it runs in one
+    pass and memory bounded by the chunk budget (plus the current table).
+
+    - Headings start a new chunk, and the heading path (document title >
+      chapter > section) is repeated at the top of every chunk of the
+      section, so chunk boundaries never cross sections.
+    - Paragraph lines are split into sentences on 。！？；!?; and packed up
+      to max_tokens; only a sentence longer than the whole budget is cut.
+    - Consecutive table rows are kept in one chunk when they fit; larger
+      tables are split between rows with the header row repeated.
+    - The last sentences of a chunk (up to overlap_tokens) are carried into
+      the next chunk of the same section.
+    """
+
+    def __init__(
+        self,
+        max_tokens: Optional[int] = None,
+        overlap_tokens: Optional[int] = None,
+        count_tokens: Callable[[str], int] = estimate_tokens
+    ):
+        self.max_tokens = max_tokens or int(os.getenv("CHUNK_MAX_TOKENS", 300))
+        self.overlap_tokens = overlap_tokens if overlap_tokens is not None else int(os.getenv("CHUNK_OVERLAP_TOKENS", 40))
+        self.count_tokens = count_tokens
+
+        self._pending = ""                            # incomplete last line of the input
+        self._headings: List[Tuple[int, str, int]] = []  # open heading path: (level, text, tokens)
+        self._parts: List[Tuple[str, int, bool]] = []  # (text, tokens, is_sentence) of the open chunk
+        self._tokens = 0
+        self._fresh = 0                               # tokens in the open chunk not carried over as overlap
+        self._line_start = True
+        self._continued = False                       # part of the current line was already packed
+        self._table: List[Tuple[str, int]] = []
+        self._table_tokens = 0
+        self._table_spilled = False
+        self._out: List[str] = []
+        self._budget = self.max_tokens                # body tokens left beside the heading path
+
+    # ---- input ----------------------------------------------------------
+
+    def feed(self, piece: str) -> List[str]:
+        """Add text; returns the chunks that became complete"""
+        lines = (self._pending + piece).split("\n")
+        self._pending = lines.pop()
+        for line in lines:
+            self._line(line)
+        # A huge line without newlines: pack its complete sentences now
+        if len(self._pending) > 16 * self.max_tokens:
+            sentences = split_sentences(self._pending)
+            self._pending = sentences.pop()
+            self._end_table()
+            self._line_start = not self._continued
+            for sentence in sentences:
+                self._add_sentence(sentence)
+            self._continued = True
+        return self._drain()
+
+    def finish(self) -> List[str]:
+        """Flush everything; returns the remaining chunks"""
+        if self._pending:
+            self._line(self._pending)
+            self._pending = ""
+        self._end_table()
+        self._emit(final=True)
+        return self._drain()
+
+    def _drain(self) -> List[str]:
+        out, self._out = self._out, []
+        return out
+
+    def _line(self, line: str) -> None:
+        if self._continued:
+            self._continued = False
+            for sentence in split_sentences(line.rstrip()):
+                self._add_sentence(sentence)
+            self._line_start = True
+            return
+        stripped = line.strip()
+        if not stripped:
+            self._end_table()
+            self._line_start = True
+            return
+        if is_table_row(stripped):
+            self._table_row(stripped)
+            return
+        self._end_table()
+        level = heading_level(stripped)
+        if level:
+            self._emit(final=True)
+            while self._headings and self._headings[-1][0] >= level:
+                self._headings.pop()
+            self._headings.append((level, stripped, self.count_tokens(stripped) + 1))
+            # The heading path may take at most half of the budget
+            heading_tokens = sum(tokens for _, _, tokens in self._headings)
+            self._budget = max(self.max_tokens - heading_tokens, self.max_tokens // 2)
+            return
+        self._line_start = True
+        for sentence in split_sentences(stripped):
+            self._add_sentence(sentence)
+        self._line_start = True
+
+    # ---- packing --------------------------------------------------------
+
+    def _append(self, text: str, tokens: int, is_sentence: bool) -> None:
+        if self._parts and self._line_start:
+            text = "\n" + text
+        self._line_start = False
+        self._parts.append((text, tokens, is_sentence))
+        self._tokens += tokens
+        self._fresh += tokens
+
+    def _add_sentence(self, sentence: str) -> None:
+        tokens = self.count_tokens(sentence)
+        if tokens > self._budget:
+            # Only an over-long sentence is cut, into near-equal character windows
+            pieces = -(-tokens // self._budget)
+            size = -(-len(sentence) // pieces)
+            for start in range(0, len(sentence), size):
+                self._add_sentence(sentence[start:start + size])
+            return
+        if self._tokens + tokens > self._budget:
+            self._emit()
+        self._append(sentence, tokens, True)
+
+    def _emit(self, final: bool = False) -> None:
+        """Close the open chunk; unless final, keep trailing sentences as overlap"""
+        if self._fresh > 0:
+            body = "".join(text for text, _, _ in self._parts).lstrip("\n")
+            self._out.append("\n".join([text for _, text, _ in self._headings] + [body]))
+        carry: List[Tuple[str, int, bool]] = []
+        if not final and self.overlap_tokens > 0:
+            total = 0
+            for text, tokens, is_sentence in reversed(self._parts):
+                if not is_sentence or total + tokens > self.overlap_tokens:
+                    break
+                carry.insert(0, (text.lstrip("\n"), tokens, True))
+                total += tokens
+        self._parts = carry
+        self._tokens = sum(tokens for _, tokens, _ in carry)
+        self._fresh = 0
+
+    # ---- tables ---------------------------------------------------------
+
+    def _table_row(self, row: str) -> None:
+        tokens = self.count_tokens(row) + 1
+        self._table.append((row, tokens))
+        self._table_tokens += tokens
+        if self._table_tokens > self._budget:
+            # Cannot stay in one chunk: stream it out in row groups under its header
+            self._spill_table()
+
+    def _spill_table(self) -> None:
+        if not self._table_spilled:
+            self._emit(final=False)
+            self._parts, self._tokens = [], 0
+            self._table_spilled = True
+        header, header_tokens = self._table[0]
+        while self._table_tokens > self._budget and len(self._table) > 2:
+            group: List[Tuple[str, int]] = []
+            total = 0
+            # Always take at least one row after the header
+            while len(self._table) > 1 and (len(group) < 2 or total + self._table[1][1] <= self._budget):
+                if not group:
+                    group.append((header, header_tokens))
+                    total += header_tokens
+                row = self._table.pop(1)
+                group.append(row)
+                total += row[1]
+            for text, tokens in group:
+                self._line_start = True
+                self._append(text, tokens, False)
+            self._emit()
+            self._parts, self._tokens = [], 0
+            self._table_tokens = header_tokens + sum(tokens for _, tokens in self._table[1:])
+
+    def _end_table(self) -> None:
+        if not self._table:
+            return
+        rows = self._table
+        if self._table_spilled and len(rows) == 1:
+            rows = []
+        elif not self._table_spilled and self._tokens + self._table_tokens > self._budget:
+            self._emit()
+            self._parts, self._tokens = [], 0
+        for text, tokens in rows:
+            self._line_start = True
+            self._append(text, tokens, False)
+        self._line_start = True
+        self._table = []
+        self._table_tokens = 0
+        self._table_spilled = False
+
+class CharChunker:
+    """
+    Incremental fixed-size character chunker with overlap
+
+    Only the current window is buffered, so memory is proportional to
+    chunk_size regardless of document length. This was the only splitter
+    before StructureChunker; it stays available as CHUNKER=char.
+    """
+
+    def __init__(self, chunk_size: int = 1000, overlap: int = 200):
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self._buffer = ""
+        self._emitted = False
+
+    def feed(self, piece: str) -> List[str]:
+        """Add text; returns the chunks that became complete"""
+        self._buffer += piece
+        chunks = []
+        while len(self._buffer) >= self.chunk_size:
+            chunks.append(self._buffer[:self.chunk_size])
+            self._emitted = True
+            self._buffer = self._buffer[self.chunk_size - self.overlap:]
+        return chunks
+
+    def finish(self) -> List[str]:
+        """Final chunk, unless it is entirely covered by the previous chunk's overlap"""
+        if not self._emitted or len(self._buffer) > self.overlap:
+            return [self._buffer]
+        return []
+
+def create_chunker(kind: Optional[str] = None):
+    """Chunker selected by CHUNKER (structure | char)"""
+    kind = (kind or os.getenv("CHUNKER", "structure")).lower()
+    if kind == "char":
+        return CharChunker()
+    return StructureChunker()
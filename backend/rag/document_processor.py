@@ -1,19 +1,95 @@
 import os
+import shutil
 import asyncio
-from typing import List, Dict, Any, Optional, Tuple
+import logging
+from typing import List, Dict, Any, Optional, Tuple, Iterator, Iterable, Callable, Awaitable, AsyncIterator
 import uuid
-import json
 import re
+import hashlib
 from datetime import datetime
 
-# In a real implementation, you would use libraries like:
-# - PyPDF2 or pdfplumber for PDF processing
-# - python-docx for Word documents
-# - langchain for document chunking
-# - sentence-transformers for embeddings
+import numpy as np
+
+from backend.rag.embedding_storage import EmbeddingStorage
+from backend.rag.extractors import TextExtractor, POOL_FORMATS
+from backend.rag.chunker import create_chunker
+from backend.rag.entity_tagger import EntityTagger, get_tagger
+from backend.rag.metadata_store import MetadataStore
+
+logger = logging.getLogger(__name__)
+
+# PDF/DOCX/XLSX are parsed with PyPDF2, python-docx and openpyxl in a
+# process pool (backend/rag/extractors.py); plain text formats are read here
+TEXT_FORMATS = {".txt", ".md", ".csv"}
+
+class MetadataExtractor:
+    """
+    Incremental metadata extraction over a stream of text pieces
+    
+    Produces the same result as scanning the full text at once: counts are
+    accumulated, and entity mentions are tagged by an automaton whose state
+    carries over piece boundaries.
+    """
+    
+    def __init__(self, tagger: Optional[EntityTagger] = None):
+        self.word_count = 0
+        self.character_count = 0
+        self.title = None
+        self.tagger = tagger or get_tagger()
+        self._scanner = self.tagger.scanner()
+        self._ends_in_word = False
+    
+    def feed(self, piece: str) -> None:
+        """Consume the next piece of document text"""
+        if not piece:
+            return
+        self.character_count += len(piece)
+        self.word_count += len(piece.split())
+        # A word cut in two by the piece boundary was counted twice
+        if self._ends_in_word and not piece[0].isspace():
+            self.word_count -= 1
+        self._ends_in_word = not piece[-1].isspace()
+        
+        if self.title is None:
+            title_match = re.search(r"^\s*#\s+(.+)$", piece, re.MULTILINE)
+            if title_match:
+                self.title = title_match.group(1)
+        
+        self._scanner.feed(piece)
+    
+    def result(self, file_ext: str, file_path: str) -> Dict[str, Any]:
+        """
+        Build the metadata dict
+        
+        Args:
+            file_ext: File extension
+            file_path: Path to the document (title fallback)
+            
+        Returns:
+            Document metadata; "industry"/"region" are the most frequently
+            mentioned ones, "tags" holds every entity with its mention count
+        """
+        tags = self._scanner.result()
+        metadata = {
+            "file_type": file_ext,
+            "word_count": self.word_count,
+            "character_count": self.character_count,
+            # Fallback to filename
+            "title": self.title if self.title is not None else os.path.basename(file_path),
+            "tags": tags
+        }
+        for field in ("industry", "region"):
+            primary = self.tagger.primary(tags.get(field, {}))
+            if primary is not None:
+                metadata[field] = primary
+        return metadata
 
 class DocumentProcessor:
-    def __init__(self):
+    def __init__(self, openai_handler=None, vector_store=None):
+        # Optional collaborators: real embeddings and live index updates
+        self.openai_handler = openai_handler
+        self.vector_store = vector_store
+
         # Setup directories
         self.docs_dir = "./data/documents"
         self.chunks_dir = "./data/chunks"
@@ -22,203 +98,390 @@ class DocumentProcessor:
         # Create directories if they don't exist
         for directory in [self.docs_dir, self.chunks_dir, self.embeddings_dir]:
             os.makedirs(directory, exist_ok=True)
+
+        # Binary embedding/text store shared with VectorStore
+        self.embedding_storage = EmbeddingStorage("./data/vectors")
+
+        # CPU-bound parsers run in a pre-warmed process pool (see start())
+        self.text_extractor = TextExtractor()
+        
+        # Streaming ingestion: text read block (chars) and chunks per embedding flush
+        self.read_block_size = int(os.getenv("INGEST_READ_BLOCK_SIZE", 65536))
+        self.embedding_flush_size = int(os.getenv("INGEST_EMBEDDING_BATCH", 64))
         
-        # Document metadata storage
-        self.document_metadata = {}
-        self.metadata_file = "./data/document_metadata.json"
-        self._load_metadata()
+        # Document metadata, in the store shared with VectorStore and other workers
+        self.metadata_store = getattr(vector_store, "metadata_store", None) or MetadataStore()
     
-    def _load_metadata(self):
-        """Load document metadata from file"""
-        if os.path.exists(self.metadata_file):
-            try:
-                with open(self.metadata_file, "r", encoding="utf-8") as f:
-                    self.document_metadata = json.load(f)
-            except json.JSONDecodeError:
-                self.document_metadata = {}
+    async def start(self):
+        """Pre-warm the extraction worker processes"""
+        await self.text_extractor.start()
     
-    def _save_metadata(self):
-        """Save document metadata to file"""
-        with open(self.metadata_file, "w", encoding="utf-8") as f:
-            json.dump(self.document_metadata, f, ensure_ascii=False, indent=2)
+    async def close(self):
+        """Shut down the extraction worker processes"""
+        await self.text_extractor.close()
     
-    async def process_document(self, file_path: str) -> str:
+    async def process_document(
+        self,
+        file_path: str,
+        doc_id: Optional[str] = None,
+        progress: Optional[Callable[[float, int], Awaitable[None]]] = None,
+        filename: Optional[str] = None,
+        source: Optional[str] = None
+    ) -> str:
         """
         Process a document for RAG
         
+        Documents are identified by content: a byte-identical file resolves
+        to the document that already holds it and nothing is recomputed. A
+        new version of a known document (same doc_id, or same explicit
+        source) is diffed chunk by chunk against the previous version: unchanged chunks
+        keep their embeddings, new or changed ones are embedded, and removed
+        ones are tombstoned. The outcome is recorded in the metadata as
+        chunks_reused / chunks_recomputed / chunks_removed.
+        
         Args:
             file_path: Path to the document file
+            doc_id: Document ID to update; by default resolved from content and source
+            progress: Optional async callback(fraction, chunks_done), awaited
+                after each embedding batch; raising from it aborts processing
+            filename: Original filename when file_path is a temporary upload
+            source: Stable source key of the document; a new upload with the same
+                source replaces the previous version. Without one the upload is a
+                new document, even if another document has the same filename
             
         Returns:
             Document ID
         """
-        # Generate document ID
-        doc_id = str(uuid.uuid4())
-        
         # Extract file details
-        file_name = os.path.basename(file_path)
+        file_name = filename or os.path.basename(file_path)
         file_ext = os.path.splitext(file_name)[1].lower()
+        content_hash = await asyncio.to_thread(self._file_hash, file_path)
         
-        # Copy file to documents directory
-        doc_path = os.path.join(self.docs_dir, f"{doc_id}{file_ext}")
-        
-        with open(file_path, "rb") as src, open(doc_path, "wb") as dst:
-            dst.write(src.read())
-        
-        # Extract text based on file type
-        text_content = await self._extract_text(doc_path, file_ext)
+        # Resolve document identity
+        if doc_id is not None:
+            previous = self.metadata_store.get(doc_id)
+            if previous is not None and previous.get("content_hash") == content_hash:
+                return await self._mark_unchanged(previous)
+        else:
+            identical = self._find_document(content_hash=content_hash)
+            if identical is not None:
+                # Byte-identical to a document we already have
+                return await self._mark_unchanged(identical)
+            # Only a caller-given source names an earlier version: unrelated
+            # uploads often share a filename such as "report.pdf"
+            previous = self._find_document(source=source) if source else None
+            # New documents get an ID derived from (source, content), so a retried ingestion reuses it
+            doc_id = previous["id"] if previous else str(uuid.uuid5(uuid.NAMESPACE_URL, f"{source or ''}\0{content_hash}"))
         
-        # Create chunks
-        chunks = await self._create_chunks(text_content)
+        # Copy file next to the current version; it replaces it only on success
+        doc_path = os.path.join(self.docs_dir, f"{doc_id}{file_ext}")
+        incoming_path = os.path.join(self.docs_dir, f"{doc_id}.incoming{file_ext}")
+        await asyncio.to_thread(self._store_file, file_path, incoming_path)
         
-        # Generate embeddings
-        await self._generate_embeddings(doc_id, chunks)
+        old_hashes = previous.get("chunk_hashes") if previous else None
+        stale_ids: List[int] = []
+        if previous is not None and old_hashes is None:
+            # Ingested before chunk hashes were recorded: nothing can be matched,
+            # so the new version gets fresh chunk IDs and every old row is removed
+            stale_ids = await self._chunk_ids(doc_id)
+        added: List[int] = []
+        try:
+            metadata_extractor, stats, chunk_hashes = await self._ingest(
+                doc_id, incoming_path, file_ext, progress, old_hashes, added, stale_ids
+            )
+        except Exception:
+            # Do not leave a half-indexed document behind; an update keeps the previous version
+            await self._discard_partial(doc_id, incoming_path, added if previous is not None else None)
+            raise
+        os.replace(incoming_path, doc_path)
+        if previous and previous.get("path") not in (None, doc_path) and os.path.exists(previous["path"]):
+            os.remove(previous["path"])
         
         # Extract metadata
-        metadata = await self._extract_metadata(doc_path, file_ext, text_content)
+        metadata = metadata_extractor.result(file_ext, doc_path)
         metadata["id"] = doc_id
         metadata["filename"] = file_name
+        metadata["source"] = source
         metadata["path"] = doc_path
+        metadata["content_hash"] = content_hash
+        metadata["chunk_count"] = sum(len(ids) for ids in chunk_hashes.values())
+        metadata["chunk_hashes"] = chunk_hashes
+        metadata.update(stats)
         metadata["processed_date"] = datetime.now().isoformat()
         
         # Store metadata
-        self.document_metadata[doc_id] = metadata
-        self._save_metadata()
+        self.metadata_store.upsert(doc_id, metadata)
+        if self.vector_store is not None:
+            await self.vector_store.set_document_metadata(doc_id, metadata)
         
+        logger.info(
+            f"Processed {file_name} as {doc_id}: {stats['chunks_reused']} chunks reused, "
+            f"{stats['chunks_recomputed']} recomputed, {stats['chunks_removed']} removed"
+        )
         return doc_id
     
-    async def _extract_text(self, file_path: str, file_ext: str) -> str:
+    def _find_document(self, content_hash: Optional[str] = None, source: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Most recently processed document with the given content hash or source"""
+        return self.metadata_store.find(content_hash=content_hash, source=source)
+    
+    async def _mark_unchanged(self, metadata: Dict[str, Any]) -> str:
+        """Record a no-op re-ingestion of an identical file"""
+        metadata.update(chunks_reused=metadata.get("chunk_count", 0), chunks_recomputed=0, chunks_removed=0)
+        self.metadata_store.upsert(metadata["id"], metadata)
+        logger.info(f"Document {metadata['id']} unchanged; all {metadata['chunks_reused']} chunks reused")
+        return metadata["id"]
+    
+    async def _chunk_ids(self, doc_id: str) -> List[int]:
+        """Chunk IDs of a document's rows in the index"""
+        if self.vector_store is not None:
+            return await self.vector_store.chunk_ids(doc_id)
+        return self.embedding_storage.chunk_ids(doc_id)
+    
+    @staticmethod
+    def _file_hash(path: str) -> str:
+        """SHA-256 of a file, read in blocks"""
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+    
+    @staticmethod
+    def _chunk_hash(chunk: str) -> str:
+        return hashlib.sha256(chunk.encode("utf-8")).hexdigest()[:16]
+    
+    async def _ingest(
+        self,
+        doc_id: str,
+        doc_path: str,
+        file_ext: str,
+        progress: Optional[Callable[[float, int], Awaitable[None]]],
+        old_hashes: Optional[Dict[str, List[int]]],
+        added: List[int],
+        stale_ids: Iterable[int] = ()
+    ) -> Tuple["MetadataExtractor", Dict[str, int], Dict[str, List[int]]]:
         """
-        Extract text from a document
+        Stream text -> chunks -> embedding batches
+        
+        Memory stays bounded by the read block size plus one embedding batch,
+        whatever the file size. Chunks whose hash appears in old_hashes keep
+        their existing rows; old chunks not seen again are tombstoned at the end.
         
         Args:
-            file_path: Path to the document
+            doc_id: Document ID
+            doc_path: Path to the stored document
             file_ext: File extension
-            
+            progress: Optional progress callback
+            old_hashes: chunk hash -> chunk IDs of the previous version, if any
+            added: Receives the IDs of chunks written, for rollback on failure
+            stale_ids: Chunk IDs of the previous version that cannot be matched
+                (no chunk hashes recorded); all of them are removed
+        
         Returns:
-            Extracted text
+            Tuple of (metadata extractor fed with the whole text, chunk stats,
+            chunk hash -> chunk IDs of the new version)
         """
-        # In a real implementation, use appropriate libraries based on file type
-        # For this example, we'll simulate text extraction
+        metadata_extractor = MetadataExtractor()
+        # Share of the document up to the start of the current piece
+        position = 0.0
         
-        if file_ext == ".pdf":
-            # Simulate PDF text extraction
-            return f"Simulated text extraction from PDF: {file_path}"
+        chunker = create_chunker()
+        # Unclaimed chunk IDs of the previous version, per hash
+        available = {h: list(ids) for h, ids in (old_hashes or {}).items()}
+        stale_ids = list(stale_ids)
+        next_id = max((i for ids in [*available.values(), stale_ids] for i in ids), default=-1) + 1
+        chunk_hashes: Dict[str, List[int]] = {}
+        reused = 0
         
-        elif file_ext in [".docx", ".doc"]:
-            # Simulate Word document text extraction
-            return f"Simulated text extraction from Word document: {file_path}"
+        batch: List[str] = []
         
-        elif file_ext in [".txt", ".md"]:
-            # Read text file directly
-            with open(file_path, "r", encoding="utf-8") as f:
-                return f.read()
+        async def flush():
+            nonlocal batch, next_id
+            await self._generate_embeddings(doc_id, batch, first_chunk_id=next_id)
+            added.extend(range(next_id, next_id + len(batch)))
+            next_id += len(batch)
+            batch = []
         
-        elif file_ext in [".csv", ".xlsx", ".xls"]:
-            # Simulate tabular data extraction
-            return f"Simulated data extraction from tabular file: {file_path}"
+        def take(chunk: str) -> bool:
+            """Record a chunk; returns True if it needs embedding"""
+            nonlocal reused, next_id
+            h = self._chunk_hash(chunk)
+            ids = available.get(h)
+            if ids:
+                chunk_hashes.setdefault(h, []).append(ids.pop(0))
+                reused += 1
+                return False
+            chunk_hashes.setdefault(h, []).append(next_id + len(batch))
+            return True
         
-        else:
-            # Default case
-            return f"Unsupported file format: {file_ext}"
+        async for piece, piece_end in self._aiter_text(doc_path, file_ext):
+            metadata_extractor.feed(piece)
+            # Within a piece (a whole DOCX is one), progress follows the text chunked so far
+            chunked = 0
+            for chunk in chunker.feed(piece):
+                chunked += len(chunk)
+                if take(chunk):
+                    batch.append(chunk)
+                if len(batch) >= self.embedding_flush_size:
+                    await flush()
+                    if progress is not None:
+                        fraction = position + (piece_end - position) * min(chunked / max(len(piece), 1), 1.0)
+                        await progress(min(fraction, 0.99), reused + len(added))
+            position = piece_end
+        # An empty document has no chunks: only its metadata is recorded
+        for chunk in chunker.finish():
+            if take(chunk):
+                batch.append(chunk)
+        if batch:
+            await flush()
+        
+        removed = [i for ids in available.values() for i in ids] + stale_ids
+        if removed:
+            if self.vector_store is not None:
+                await self.vector_store.delete_chunks(doc_id, removed)
+            else:
+                self.embedding_storage.delete(doc_id, removed)
+        
+        stats = {"chunks_reused": reused, "chunks_recomputed": len(added), "chunks_removed": len(removed)}
+        return metadata_extractor, stats, chunk_hashes
     
-    async def _create_chunks(self, text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
+    async def _discard_partial(self, doc_id: str, doc_path: str, chunk_ids: Optional[List[int]] = None) -> None:
         """
-        Create overlapping chunks from text
+        Remove the stored copy and the embedding batches already written for a failed document
+        
+        For an update (chunk_ids given) only the newly written chunks are
+        removed, so the previous version stays searchable.
+        """
+        try:
+            if chunk_ids is not None:
+                if self.vector_store is not None:
+                    await self.vector_store.delete_chunks(doc_id, chunk_ids)
+                elif chunk_ids:
+                    self.embedding_storage.delete(doc_id, chunk_ids)
+            elif self.vector_store is not None:
+                await self.vector_store.delete_document(doc_id)
+            elif self.embedding_storage.has_document(doc_id):
+                self.embedding_storage.delete(doc_id)
+            if os.path.exists(doc_path):
+                os.remove(doc_path)
+        except Exception as e:
+            logger.warning(f"Failed to clean up partially processed document {doc_id}: {e}")
+    
+    def _store_file(self, src_path: str, dst_path: str) -> None:
+        """
+        Place an upload in the documents directory
+        
+        Hardlinks when source and destination share a filesystem; otherwise
+        shutil.copyfile, which copies in fixed-size blocks (sendfile on Linux).
+        """
+        # A retried job finds its own copy from the previous attempt
+        if os.path.exists(dst_path):
+            os.remove(dst_path)
+        try:
+            os.link(src_path, dst_path)
+        except OSError:
+            shutil.copyfile(src_path, dst_path)
+    
+    async def _aiter_text(self, file_path: str, file_ext: str) -> AsyncIterator[Tuple[str, float]]:
+        """
+        Extract text from a document incrementally
         
         Args:
-            text: Text to chunk
-            chunk_size: Size of each chunk
-            overlap: Overlap between chunks
+            file_path: Path to the document
+            file_ext: File extension
             
-        Returns:
-            List of text chunks
+        Yields:
+            (piece of extracted text, share of the document up to its end):
+            bytes read for text files, pages extracted for PDFs
         """
-        # Simple chunking by character count
-        # In a real implementation, use a more sophisticated approach
-        chunks = []
-        
-        if len(text) <= chunk_size:
-            chunks.append(text)
+        if file_ext in TEXT_FORMATS:
+            file_size = max(os.path.getsize(file_path), 1)
+            bytes_read = 0
+            for piece in self._iter_text(file_path):
+                bytes_read += len(piece.encode("utf-8"))
+                yield piece, min(bytes_read / file_size, 1.0)
+        elif file_ext in POOL_FORMATS:
+            extracted = 0.0
+            
+            def record(fraction: float) -> None:
+                nonlocal extracted
+                extracted = fraction
+            
+            async for piece in self.text_extractor.iter_text(file_path, file_ext, progress=record):
+                yield piece, extracted
         else:
-            for i in range(0, len(text), chunk_size - overlap):
-                chunk = text[i:i + chunk_size]
-                chunks.append(chunk)
+            raise ValueError(f"Unsupported file format: {file_ext}")
+    
+    def _iter_text(self, file_path: str) -> Iterator[str]:
+        """
+        Read a plain text file incrementally
+        
+        Blocks are cut at line boundaries, so line-based metadata (titles)
+        never straddles two pieces.
         
-        return chunks
+        Args:
+            file_path: Path to the document
+            
+        Yields:
+            Pieces of text
+        """
+        with open(file_path, "r", encoding="utf-8") as f:
+            remainder = ""
+            while True:
+                block = f.read(self.read_block_size)
+                if not block:
+                    break
+                block = remainder + block
+                cut = block.rfind("\n") + 1
+                if cut == 0:
+                    remainder = block
+                    # A single very long line: flush it rather than grow without bound
+                    if len(remainder) >= self.read_block_size * 4:
+                        yield remainder
+                        remainder = ""
+                    continue
+                remainder = block[cut:]
+                yield block[:cut]
+            if remainder:
+                yield remainder
     
-    async def _generate_embeddings(self, doc_id: str, chunks: List[str]) -> None:
+    async def _generate_embeddings(self, doc_id: str, chunks: List[str], first_chunk_id: int = 0) -> None:
         """
         Generate embeddings for text chunks
         
+        Called once per batch while a document streams through; the first
+        batch replaces any previous rows of the document, later ones append.
+        
         Args:
             doc_id: Document ID
             chunks: List of text chunks
+            first_chunk_id: Chunk ID of chunks[0] within the document
         """
-        # In a real implementation, use a model like sentence-transformers
-        # For this example, we'll simulate embedding generation
-        
-        # Create a chunks file
-        chunks_path = os.path.join(self.chunks_dir, f"{doc_id}_chunks.json")
-        with open(chunks_path, "w", encoding="utf-8") as f:
-            json.dump(chunks, f, ensure_ascii=False, indent=2)
-        
-        # Simulate embeddings (random values)
-        # In a real implementation, generate actual embeddings
+        if self.openai_handler is not None:
+            vectors = await self.openai_handler.embeddings(chunks)
+        else:
+            # Simulate a 384-dimensional embedding when no embedding API is configured
+            vectors = [[0.1] * 384 for _ in chunks]  # Placeholder
+
+        # Each chunk carries the entities it mentions itself, not just its document's
+        tagger = get_tagger()
         embeddings = []
-        for i, chunk in enumerate(chunks):
-            # Simulate a 384-dimensional embedding with random values
-            embedding = [0.1] * 384  # Placeholder
+        for i, (chunk, embedding) in enumerate(zip(chunks, vectors), start=first_chunk_id):
             embeddings.append({
                 "chunk_id": i,
-                "text": chunk[:100] + "...",  # Store preview
-                "embedding": embedding  # Would be actual embedding vector
+                "text": chunk,
+                "embedding": embedding,
+                "tags": tagger.tag(chunk)
             })
         
-        # Save embeddings
-        embeddings_path = os.path.join(self.embeddings_dir, f"{doc_id}_embeddings.json")
-        with open(embeddings_path, "w", encoding="utf-8") as f:
-            json.dump(embeddings, f, ensure_ascii=False, indent=2)
-    
-    async def _extract_metadata(self, file_path: str, file_ext: str, text_content: str) -> Dict[str, Any]:
-        """
-        Extract metadata from document
-        
-        Args:
-            file_path: Path to the document
-            file_ext: File extension
-            text_content: Extracted text
-            
-        Returns:
-            Document metadata
-        """
-        metadata = {
-            "file_type": file_ext,
-            "word_count": len(text_content.split()),
-            "character_count": len(text_content)
-        }
-        
-        # Try to extract document title
-        title_match = re.search(r"^\s*#\s+(.+)$", text_content, re.MULTILINE)
-        if title_match:
-            metadata["title"] = title_match.group(1)
+        # Save embeddings to the binary store (through the search index when one is attached)
+        if self.vector_store is not None:
+            await self.vector_store.add_embeddings(embeddings, doc_id, replace=first_chunk_id == 0)
         else:
-            # Fallback to filename
-            metadata["title"] = os.path.basename(file_path)
-        
-        # Try to detect industry and region
-        # This is a simplified approach
-        industries = ["生物医药", "电子信息", "人工智能", "新能源", "先进制造", "集成电路", "汽车", "文创"]
-        regions = ["北京", "上海", "广州", "深圳", "杭州", "南京", "成都", "武汉", "西安"]
-        
-        for industry in industries:
-            if industry in text_content:
-                metadata["industry"] = industry
-                break
-        
-        for region in regions:
-            if region in text_content:
-                metadata["region"] = region
-                break
-        
-        return metadata
\ No newline at end of file
+            self.embedding_storage.append(
+                doc_id,
+                [item["chunk_id"] for item in embeddings],
+                np.asarray(vectors, dtype=np.float32),
+                chunks,
+                [item["tags"] for item in embeddings]
+            )
@@ -0,0 +1,313 @@
+import os
+import shutil
+import json
+import logging
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional, Set, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows development environments
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingStorage:
+    """
+    Append-only binary embedding store shared by ingestion and search
+
+    Layout under root_dir:
+        meta.json    - vector dimension and format version
+        vectors.f32  - raw little-endian float32 rows, L2-normalised
+        rows.jsonl   - append-only row log ("add" per row, "del" per document or chunk set)
+        texts.bin    - UTF-8 chunk texts, addressed by (offset, length) from the row log
+
+    Row i of vectors.f32 corresponds to the i-th "add" record of rows.jsonl.
+    Deletions are tombstones; compact() rewrites the live rows.
+    """
+
+    FORMAT_VERSION = 1
+
+    def __init__(self, root_dir: str = "./data/vectors"):
+        self.root_dir = root_dir
+        os.makedirs(self.root_dir, exist_ok=True)
+
+        self.meta_file = os.path.join(self.root_dir, "meta.json")
+        self.vectors_file = os.path.join(self.root_dir, "vectors.f32")
+        self.rows_file = os.path.join(self.root_dir, "rows.jsonl")
+        self.texts_file = os.path.join(self.root_dir, "texts.bin")
+        self.lock_file = os.path.join(self.root_dir, ".lock")
+
+        self.dim: Optional[int] = None
+        self._load_meta()
+
+        # Committed row count tailed from the log: (log inode, byte offset, rows)
+        self._row_count: Tuple[Optional[int], int, int] = (None, 0, 0)
+
+    def _load_meta(self):
+        """Load vector dimension from meta.json"""
+        if os.path.exists(self.meta_file):
+            with open(self.meta_file, "r", encoding="utf-8") as f:
+                self.dim = json.load(f).get("dim")
+
+    def _save_meta(self):
+        """Persist vector dimension"""
+        tmp_file = self.meta_file + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "format": self.FORMAT_VERSION}, f)
+        os.replace(tmp_file, self.meta_file)
+
+    @contextmanager
+    def _locked(self):
+        """Serialise writers across processes (uvicorn workers, migration CLI)"""
+        if fcntl is None:
+            yield
+            return
+        with open(self.lock_file, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    @property
+    def row_bytes(self) -> int:
+        return 4 * (self.dim or 0)
+
+    def log_size(self) -> int:
+        """Current size of the row log, used by readers to detect new writes"""
+        return os.path.getsize(self.rows_file) if os.path.exists(self.rows_file) else 0
+
+    def read_log(self, start: int = 0) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Read complete row log records from a byte offset
+
+        Args:
+            start: Byte offset to start reading from
+
+        Returns:
+            Tuple of (records, new offset)
+        """
+        if not os.path.exists(self.rows_file):
+            return [], start
+        with open(self.rows_file, "rb") as f:
+            f.seek(start)
+            data = f.read()
+        # Ignore a trailing partial line from an in-flight append
+        end = data.rfind(b"\n") + 1
+        records = [json.loads(line) for line in data[:end].splitlines() if line.strip()]
+        return records, start + end
+
+    def open_vectors(self, rows: int) -> np.ndarray:
+        """
+        Memory-map the first `rows` vectors read-only
+
+        The mapping is backed by the page cache, so it is shared between
+        worker processes and costs nothing to open.
+        """
+        if not self.dim or rows == 0:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        return np.memmap(self.vectors_file, dtype="<f4", mode="r", shape=(rows, self.dim))
+
+    def read_text(self, offset: int, length: int) -> str:
+        """Read one chunk text from the text store"""
+        with open(self.texts_file, "rb") as f:
+            f.seek(offset)
+            return f.read(length).decode("utf-8")
+
+    def read_texts(self, spans: List[Tuple[int, int]]) -> List[str]:
+        """Read several chunk texts, given as (offset, length), with one open file and in file order"""
+        texts = [""] * len(spans)
+        with open(self.texts_file, "rb") as f:
+            for i in sorted(range(len(spans)), key=lambda i: spans[i][0]):
+                offset, length = spans[i]
+                f.seek(offset)
+                texts[i] = f.read(length).decode("utf-8")
+        return texts
+
+    def _count_rows(self) -> int:
+        """Number of committed rows according to the row log"""
+        inode = os.stat(self.rows_file).st_ino if os.path.exists(self.rows_file) else None
+        cached_inode, offset, rows = self._row_count
+        # Compaction replaces the log file; start over
+        if inode != cached_inode or offset > self.log_size():
+            offset, rows = 0, 0
+        # Tail only what was appended since the last count (streaming ingestion appends per batch)
+        records, offset = self.read_log(offset)
+        rows += sum(1 for record in records if record["op"] == "add")
+        self._row_count = (inode, offset, rows)
+        return rows
+
+    def append(
+        self,
+        doc_id: str,
+        chunk_ids: List[int],
+        vectors: np.ndarray,
+        texts: List[str],
+        tags: Optional[List[Dict[str, Dict[str, int]]]] = None
+    ) -> None:
+        """
+        Append a document's chunks to the store
+
+        Args:
+            doc_id: Document ID
+            chunk_ids: Chunk IDs, parallel to vectors
+            vectors: (n, dim) array of embeddings; normalised before writing
+            texts: Full chunk texts, parallel to vectors
+            tags: Optional per-chunk entity tags, parallel to vectors
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(vectors) == 0:
+            return
+        if vectors.ndim != 2:
+            raise ValueError(f"Malformed embeddings for document {doc_id}")
+
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        vectors = np.ascontiguousarray(vectors / norms, dtype="<f4")
+
+        with self._locked():
+            self._load_meta()
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+                self._save_meta()
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(
+                    f"Embedding dimension {vectors.shape[1]} of document {doc_id} "
+                    f"does not match store dimension {self.dim}"
+                )
+
+            # Texts first, then vectors, then the log record that commits them
+            records = []
+            with open(self.texts_file, "ab") as f:
+                offset = f.tell()
+                for i, (chunk_id, text) in enumerate(zip(chunk_ids, texts)):
+                    encoded = text.encode("utf-8")
+                    f.write(encoded)
+                    record = {
+                        "op": "add",
+                        "doc_id": doc_id,
+                        "chunk_id": int(chunk_id),
+                        "offset": offset,
+                        "length": len(encoded)
+                    }
+                    if tags is not None and tags[i]:
+                        record["tags"] = tags[i]
+                    records.append(record)
+                    offset += len(encoded)
+
+            # Write at the committed end so a torn earlier append is overwritten
+            start_row = self._count_rows()
+            mode = "r+b" if os.path.exists(self.vectors_file) else "wb"
+            with open(self.vectors_file, mode) as f:
+                f.seek(start_row * self.row_bytes)
+                f.write(vectors.tobytes())
+                f.truncate()
+
+            with open(self.rows_file, "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records))
+
+    def delete(self, doc_id: str, chunk_ids: Optional[List[int]] = None) -> None:
+        """
+        Tombstone rows of a document
+
+        Args:
+            doc_id: Document ID
+            chunk_ids: Only these chunks (incremental re-ingestion); None for all rows
+        """
+        record = {"op": "del", "doc_id": doc_id}
+        if chunk_ids is not None:
+            record["chunk_ids"] = [int(chunk_id) for chunk_id in chunk_ids]
+        with self._locked():
+            with open(self.rows_file, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def has_document(self, doc_id: str) -> bool:
+        """Whether the document currently has live rows"""
+        return doc_id in self.live_documents()
+
+    def live_documents(self) -> Set[str]:
+        """
+        IDs of every document with live rows, from one pass over the row log
+
+        Callers checking many documents (e.g. the migration) should take this
+        set once instead of calling has_document() per document.
+        """
+        records, _ = self.read_log()
+        rows = [r for r in records if r["op"] == "add"]
+        alive = self.live_mask(records)
+        return {r["doc_id"] for i, r in enumerate(rows) if alive[i]}
+
+    def chunk_ids(self, doc_id: str) -> List[int]:
+        """Chunk IDs of a document's live rows"""
+        records, _ = self.read_log()
+        rows = [r for r in records if r["op"] == "add"]
+        alive = self.live_mask(records)
+        return sorted(r["chunk_id"] for i, r in enumerate(rows) if alive[i] and r["doc_id"] == doc_id)
+
+    def compact(self) -> None:
+        """Rewrite the store keeping only live rows"""
+        with self._locked():
+            records, _ = self.read_log()
+            rows = [r for r in records if r["op"] == "add"]
+            alive = self.live_mask(records)
+            vectors = self.open_vectors(len(rows))
+
+            tmp = {name: path + ".compact" for name, path in [
+                ("vectors", self.vectors_file), ("rows", self.rows_file), ("texts", self.texts_file)
+            ]}
+            with open(self.texts_file, "rb") as src_texts, \
+                    open(tmp["texts"], "wb") as texts_out, \
+                    open(tmp["vectors"], "wb") as vectors_out, \
+                    open(tmp["rows"], "w", encoding="utf-8") as rows_out:
+                for i, record in enumerate(rows):
+                    if not alive[i]:
+                        continue
+                    src_texts.seek(record["offset"])
+                    text = src_texts.read(record["length"])
+                    new_record = dict(record, offset=texts_out.tell())
+                    texts_out.write(text)
+                    vectors_out.write(np.asarray(vectors[i], dtype="<f4").tobytes())
+                    rows_out.write(json.dumps(new_record, ensure_ascii=False) + "\n")
+            del vectors
+
+            for name, path in [("vectors", self.vectors_file), ("texts", self.texts_file), ("rows", self.rows_file)]:
+                os.replace(tmp[name], path)
+
+            # Derived indexes address rows by number, which compaction changes
+            ann_file = os.path.join(self.root_dir, "ivf.npz")
+            if os.path.exists(ann_file):
+                os.remove(ann_file)
+            shutil.rmtree(os.path.join(self.root_dir, "bm25"), ignore_errors=True)
+            logger.info(f"Compacted embedding store: {int(alive.sum())}/{len(rows)} rows kept")
+
+    @staticmethod
+    def live_mask(records: List[Dict[str, Any]]) -> np.ndarray:
+        """
+        Compute which "add" rows are still live given a sequence of log records
+
+        A "del" record tombstones every earlier row of that document, or only
+        those with the listed chunk_ids; rows added after it stay live.
+        """
+        rows_by_doc: Dict[str, List[Tuple[int, int]]] = {}
+        alive = []
+        for record in records:
+            if record["op"] == "add":
+                rows_by_doc.setdefault(record["doc_id"], []).append((len(alive), record["chunk_id"]))
+                alive.append(True)
+            elif record["op"] == "del":
+                if "chunk_ids" in record:
+                    dropped = set(record["chunk_ids"])
+                    kept = []
+                    for row, chunk_id in rows_by_doc.get(record["doc_id"], []):
+                        if chunk_id in dropped:
+                            alive[row] = False
+                        else:
+                            kept.append((row, chunk_id))
+                    rows_by_doc[record["doc_id"]] = kept
+                else:
+                    for row, _ in rows_by_doc.pop(record["doc_id"], []):
+                        alive[row] = False
+        return np.asarray(alive, dtype=bool)
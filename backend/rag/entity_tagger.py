@@ -0,0 +1,225 @@
+import os
+import re
+import logging
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Default dictionary shipped with the repo; ENTITY_DICT_PATH points to a larger one
+DEFAULT_DICT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "entities.tsv")
+
+# (entity type, canonical name, surface forms)
+Entry = Tuple[str, str, List[str]]
+
+def load_dictionary(path: str) -> List[Entry]:
+    """
+    Read an entity dictionary
+
+    One entity per line: type, canonical name and optional aliases, separated
+    by tabs. The canonical name is itself a surface form. Blank lines and
+    lines starting with "#" are ignored; line order is the tie-break priority
+    when a document mentions two entities equally often.
+
+    Args:
+        path: Path to the TSV file
+
+    Returns:
+        List of (type, name, surface forms)
+    """
+    entries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            fields = [field.strip() for field in line.split("\t") if field.strip()]
+            if len(fields) < 2:
+                raise ValueError(f"{path}:{line_number}: expected 'type<TAB>name[<TAB>alias...]'")
+            entity_type, name, aliases = fields[0], fields[1], fields[2:]
+            entries.append((entity_type, name, [name] + aliases))
+    return entries
+
+class EntityTagger:
+    """
+    Multi-pattern entity tagger (Aho–Corasick automaton)
+
+    All surface forms of the dictionary are compiled once into one
+    automaton, so tagging is a single pass over the text whatever the
+    number of patterns. Overlapping matches are resolved leftmost-longest
+    ("杭州市" is one mention of 杭州, "新能源汽车" one of 新能源汽车 rather
+    than 新能源 + 汽车).
+    """
+
+    def __init__(self, entries: Iterable[Entry]):
+        # entity index -> (type, name); pattern index -> (entity index, length)
+        self.entities: List[Tuple[str, str]] = []
+        self._patterns: List[Tuple[int, int]] = []
+
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[int] = [-1]   # longest pattern ending at this state, or -1
+        seen = {}
+        for entity_type, name, forms in entries:
+            entity = len(self.entities)
+            self.entities.append((entity_type, name))
+            for form in forms:
+                if not form or form in seen:
+                    if form in seen and seen[form] != entity:
+                        logger.warning(f"Duplicate entity surface form ignored: {form}")
+                    continue
+                seen[form] = entity
+                self._insert(form, len(self._patterns))
+                self._patterns.append((entity, len(form)))
+        self._build_links()
+
+        self.max_length = max((length for _, length in self._patterns), default=0)
+        # Characters that can start a match: lets the scan skip text at the root state
+        first_chars = "".join(sorted(self._goto[0]))
+        self._first_char = re.compile(f"[{re.escape(first_chars)}]") if first_chars else None
+
+    @classmethod
+    def from_file(cls, path: Optional[str] = None) -> "EntityTagger":
+        """Compile the dictionary at path (default: ENTITY_DICT_PATH or the bundled entities.tsv)"""
+        path = path or os.getenv("ENTITY_DICT_PATH") or DEFAULT_DICT_PATH
+        tagger = cls(load_dictionary(path))
+        logger.info(f"Entity dictionary loaded: {len(tagger.entities)} entities, {len(tagger._patterns)} patterns ({path})")
+        return tagger
+
+    def _insert(self, form: str, pattern: int) -> None:
+        state = 0
+        for ch in form:
+            next_state = self._goto[state].get(ch)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][ch] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(-1)
+            state = next_state
+        self._output[state] = pattern
+
+    def _build_links(self) -> None:
+        """Breadth-first failure links; states without a pattern inherit their fail state's output"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, child in self._goto[state].items():
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(ch, 0)
+                self._fail[child] = target if target != child else 0
+                if self._output[child] < 0:
+                    self._output[child] = self._output[self._fail[child]]
+                queue.append(child)
+
+    def scanner(self) -> "EntityScanner":
+        """Incremental scanner for a document that arrives in pieces"""
+        return EntityScanner(self)
+
+    def tag(self, text: str) -> Dict[str, Dict[str, int]]:
+        """
+        Tag a text in one pass
+
+        Args:
+            text: Text to scan
+
+        Returns:
+            {entity type: {name: mention count}}, e.g. {"region": {"杭州": 3}}
+        """
+        scanner = EntityScanner(self)
+        scanner.feed(text)
+        return scanner.result()
+
+    def primary(self, counts: Dict[str, int]) -> Optional[str]:
+        """Most frequent name among counts; ties go to the entity listed first in the dictionary"""
+        if not counts:
+            return None
+        order = {name: i for i, (_, name) in enumerate(self.entities)}
+        return min(counts, key=lambda name: (-counts[name], order.get(name, len(order))))
+
+class EntityScanner:
+    """
+    Automaton state carried across pieces, so a mention split over a piece
+    boundary is still found without re-scanning any text.
+    """
+
+    def __init__(self, tagger: EntityTagger):
+        self.tagger = tagger
+        self._state = 0
+        self._position = 0
+        self._candidates: List[Tuple[int, int, int]] = []  # (start, end, pattern) not yet resolved
+        self._last_end = 0
+        self._counts: Dict[int, int] = {}
+
+    def feed(self, text: str) -> None:
+        """Consume the next piece of text"""
+        tagger = self.tagger
+        goto, fail, output = tagger._goto, tagger._fail, tagger._output
+        patterns = tagger._patterns
+        root = goto[0]
+        first_char = tagger._first_char
+        if first_char is None:
+            self._position += len(text)
+            return
+
+        state = self._state
+        base = self._position
+        i, n = 0, len(text)
+        while i < n:
+            if state == 0:
+                # Nothing partially matched: jump to the next character that can start a pattern
+                match = first_char.search(text, i)
+                if match is None:
+                    break
+                i = match.start()
+                state = root[text[i]]
+            else:
+                ch = text[i]
+                while state and ch not in goto[state]:
+                    state = fail[state]
+                state = goto[state].get(ch, 0)
+            pattern = output[state]
+            if pattern >= 0:
+                end = base + i + 1
+                self._candidates.append((end - patterns[pattern][1], end, pattern))
+                self._resolve(end - tagger.max_length)
+            i += 1
+        self._state = state
+        self._position = base + n
+
+    def _resolve(self, limit: Optional[int] = None) -> None:
+        """Settle candidates starting before limit (no later match can start earlier), leftmost-longest"""
+        candidates = self._candidates
+        if not candidates:
+            return
+        candidates.sort(key=lambda c: (c[0], -c[1]))
+        settled = 0
+        for start, end, pattern in candidates:
+            if limit is not None and start >= limit:
+                break
+            settled += 1
+            if start >= self._last_end:
+                entity = self.tagger._patterns[pattern][0]
+                self._counts[entity] = self._counts.get(entity, 0) + 1
+                self._last_end = end
+        del candidates[:settled]
+
+    def result(self) -> Dict[str, Dict[str, int]]:
+        """{entity type: {name: mention count}} for everything fed so far"""
+        self._resolve()
+        tags: Dict[str, Dict[str, int]] = {}
+        for entity, count in sorted(self._counts.items()):
+            entity_type, name = self.tagger.entities[entity]
+            tags.setdefault(entity_type, {})[name] = count
+        return tags
+
+_default_tagger: Optional[EntityTagger] = None
+
+def get_tagger() -> EntityTagger:
+    """Process-wide tagger compiled from the configured dictionary on first use"""
+    global _default_tagger
+    if _default_tagger is None:
+        _default_tagger = EntityTagger.from_file()
+    return _default_tagger
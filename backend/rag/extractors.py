@@ -0,0 +1,238 @@
+import os
+import asyncio
+import logging
+import multiprocessing
+import concurrent.futures
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Formats parsed in the process pool
+POOL_FORMATS = {".pdf", ".docx", ".xlsx"}
+
+# ---------------------------------------------------------------------------
+# Worker-side functions. They run inside pool processes, so they must be
+# module-level (picklable) and must not touch the event loop.
+# ---------------------------------------------------------------------------
+
+def _warm_up() -> int:
+    """Pool initializer: pay the parser import cost once per worker process"""
+    import PyPDF2  # noqa: F401
+    import docx  # noqa: F401
+    import openpyxl  # noqa: F401
+    return os.getpid()
+
+def _pdf_page_count(path: str) -> int:
+    from PyPDF2 import PdfReader
+    return len(PdfReader(path).pages)
+
+def _pdf_pages_text(path: str, start: int, end: int) -> str:
+    """Text of pages [start, end) of a PDF"""
+    from PyPDF2 import PdfReader
+    reader = PdfReader(path)
+    return "\n".join((reader.pages[i].extract_text() or "") for i in range(start, end)) + "\n"
+
+def _docx_text(path: str) -> str:
+    """Paragraph and table text of a Word document, headings as markdown titles"""
+    import docx
+    document = docx.Document(path)
+    lines = []
+    for paragraph in document.paragraphs:
+        text = paragraph.text.strip()
+        if not text:
+            continue
+        style = paragraph.style.name if paragraph.style is not None else ""
+        if style.startswith("Heading") or style == "Title":
+            level = style.rsplit(" ", 1)[-1]
+            lines.append("#" * (int(level) if level.isdigit() else 1) + " " + text)
+        else:
+            lines.append(text)
+    for table in document.tables:
+        for row in table.rows:
+            lines.append("\t".join(cell.text.strip() for cell in row.cells))
+    return "\n".join(lines) + "\n"
+
+def _xlsx_text(path: str) -> str:
+    """Sheet rows as tab-separated lines"""
+    import openpyxl
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    lines = []
+    try:
+        for sheet in workbook.worksheets:
+            lines.append(f"# {sheet.title}")
+            for row in sheet.iter_rows(values_only=True):
+                if any(value is not None for value in row):
+                    lines.append("\t".join("" if value is None else str(value) for value in row))
+    finally:
+        workbook.close()
+    return "\n".join(lines) + "\n"
+
+# ---------------------------------------------------------------------------
+
+class TextExtractor:
+    """
+    Text extraction for PDF/DOCX/XLSX in a pre-warmed process pool
+
+    Parsing is CPU-bound, so it runs outside the event loop. Large PDFs are
+    split into page ranges that are extracted in parallel and yielded in
+    page order. Every pool task (a page range, or a whole DOCX/XLSX) has its
+    own timeout, counted from its submission to its result, so time the
+    consumer spends on earlier pieces does not count. A task over the
+    timeout retires its pool: new work goes to a fresh pool, the tasks of
+    other files already in the old one finish, and then its processes,
+    including the stuck one, are terminated.
+    """
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        pages_per_task: Optional[int] = None,
+        timeout: Optional[float] = None
+    ):
+        self.max_workers = max_workers or int(os.getenv("EXTRACT_WORKERS", 0)) or (os.cpu_count() or 1)
+        self.pages_per_task = pages_per_task or int(os.getenv("EXTRACT_PAGES_PER_TASK", 8))
+        self.timeout = timeout or float(os.getenv("EXTRACT_TIMEOUT", 120))
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._start_lock = asyncio.Lock()
+        # Unfinished tasks per pool, and retired pools still draining
+        self._tasks: Dict[ProcessPoolExecutor, Set[concurrent.futures.Future]] = {}
+        self._retired: Dict[ProcessPoolExecutor, asyncio.Task] = {}
+
+    def _create_pool(self) -> ProcessPoolExecutor:
+        # spawn: forking a process that already runs threads (to_thread, SQLite) is unsafe
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_warm_up
+        )
+
+    async def start(self) -> None:
+        """Create the pool and bring every worker up with the parsers imported"""
+        async with self._start_lock:
+            if self._pool is not None:
+                return
+            self._pool = self._create_pool()
+            loop = asyncio.get_running_loop()
+            pids = await asyncio.gather(*[
+                loop.run_in_executor(self._pool, _warm_up) for _ in range(self.max_workers)
+            ])
+            logger.info(f"Text extraction pool ready: {len(set(pids))} worker processes")
+
+    def _retire(self, pool: ProcessPoolExecutor, stuck: concurrent.futures.Future) -> None:
+        """Stop sending work to a pool with a stuck task and terminate it once its other tasks are done"""
+        if self._pool is pool:
+            self._pool = None
+        if pool in self._retired:
+            return
+        pool.shutdown(wait=False)
+        self._retired[pool] = asyncio.create_task(self._reap(pool, stuck))
+
+    async def _reap(self, pool: ProcessPoolExecutor, stuck: concurrent.futures.Future) -> None:
+        # Copied first: done callbacks remove tasks from the executor's thread
+        others = [future for future in list(self._tasks.get(pool, ())) if future is not stuck]
+        # Each of them is bounded by its own timeout
+        if others:
+            await asyncio.to_thread(concurrent.futures.wait, others, self.timeout)
+        self._terminate(pool)
+        self._retired.pop(pool, None)
+        logger.info("Retired text extraction pool terminated")
+
+    def _terminate(self, pool: ProcessPoolExecutor) -> None:
+        # ProcessPoolExecutor has no public way to stop a running task
+        for process in list((getattr(pool, "_processes", None) or {}).values()):
+            process.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
+        self._tasks.pop(pool, None)
+
+    async def close(self) -> None:
+        for pool, reaper in list(self._retired.items()):
+            reaper.cancel()
+            self._terminate(pool)
+        self._retired.clear()
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            await asyncio.to_thread(pool.shutdown, True, cancel_futures=True)
+            self._tasks.pop(pool, None)
+
+    async def _run(self, func, *args):
+        """Run func(*args) in the pool, within the timeout; a task over it retires the pool"""
+        if self._pool is None:
+            await self.start()
+        pool = self._pool
+        future = pool.submit(func, *args)
+        tasks = self._tasks.setdefault(pool, set())
+        tasks.add(future)
+        future.add_done_callback(tasks.discard)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            if not future.done():
+                self._retire(pool, future)
+            raise
+
+    async def iter_text(
+        self,
+        path: str,
+        file_ext: str,
+        progress: Optional[Callable[[float], None]] = None
+    ) -> AsyncIterator[str]:
+        """
+        Extract a document's text without blocking the event loop
+
+        Args:
+            path: Path to the document
+            file_ext: File extension (.pdf, .docx or .xlsx)
+            progress: Optional callback(fraction), called before each piece is
+                yielded with the share of the document up to the end of that
+                piece (pages for PDFs; DOCX/XLSX are a single piece)
+
+        Yields:
+            Text pieces in document order (page ranges for PDFs)
+        """
+        # Worker processes do not follow this process's working directory
+        path = os.path.abspath(path)
+        try:
+            if file_ext == ".pdf":
+                pages = await self._run(_pdf_page_count, path)
+                ranges = [
+                    (start, min(start + self.pages_per_task, pages))
+                    for start in range(0, pages, self.pages_per_task)
+                ]
+                async for (_, end), piece in self._ordered(ranges, path):
+                    if progress is not None:
+                        progress(end / pages)
+                    yield piece
+            elif file_ext in (".docx", ".xlsx"):
+                text = await self._run(_docx_text if file_ext == ".docx" else _xlsx_text, path)
+                if progress is not None:
+                    progress(1.0)
+                yield text
+            else:
+                raise ValueError(f"Unsupported file format: {file_ext}")
+        except asyncio.TimeoutError:
+            logger.error(f"Text extraction task timed out after {self.timeout}s: {path}")
+            raise
+
+    async def _ordered(self, ranges: List[Tuple[int, int]], path: str) -> AsyncIterator[Tuple[Tuple[int, int], str]]:
+        """Run page ranges in parallel, at most max_workers ahead of the consumer, yielding (range, text) in order"""
+        pending: List[asyncio.Task] = []
+        next_range = 0
+        # Index of the range at the head of `pending`
+        head = 0
+        try:
+            while next_range < len(ranges) or pending:
+                while next_range < len(ranges) and len(pending) < self.max_workers:
+                    start, end = ranges[next_range]
+                    pending.append(asyncio.ensure_future(self._run(_pdf_pages_text, path, start, end)))
+                    next_range += 1
+                # Keep the head in `pending` until it resolves so cleanup sees it on failure
+                text = await asyncio.shield(pending[0])
+                pending.pop(0)
+                yield ranges[head], text
+                head += 1
+        finally:
+            for future in pending:
+                future.cancel()
+                # Consume the error (e.g. a timeout of a range behind the head) so it is not logged as unhandled
+                future.add_done_callback(lambda f: f.cancelled() or f.exception())
@@ -0,0 +1,544 @@
+import os
+import sys
+import json
+import time
+import uuid
+import signal
+import asyncio
+import logging
+import sqlite3
+import argparse
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from backend.models.retry import RetryPolicy
+
+logger = logging.getLogger(__name__)
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINAL_STATES = {SUCCEEDED, FAILED, CANCELLED}
+
+class JobCancelled(Exception):
+    """Raised inside a running job once cancellation has been requested"""
+
+def _new_job(job_id: str, file_path: str, filename: str, max_attempts: int) -> Dict[str, Any]:
+    now = time.time()
+    return {
+        "id": job_id,
+        "file_path": file_path,
+        "filename": filename,
+        "status": QUEUED,
+        "progress": 0.0,
+        "chunks_done": 0,
+        "attempts": 0,
+        "max_attempts": max_attempts,
+        "doc_id": None,
+        "chunks_reused": 0,
+        "chunks_recomputed": 0,
+        "error": None,
+        "cancel_requested": False,
+        "worker": None,
+        "available_at": now,
+        "lease_expires_at": None,
+        "created_at": now,
+        "updated_at": now
+    }
+
+def public_view(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Job fields exposed through the progress API"""
+    return {
+        key: job[key] for key in [
+            "id", "filename", "status", "progress", "chunks_done", "attempts",
+            "max_attempts", "doc_id", "chunks_reused", "chunks_recomputed", "error",
+            "created_at", "updated_at"
+        ]
+    }
+
+class SQLiteJobStore:
+    """
+    Local persistent job store (SQLite, WAL)
+
+    Safe to share between the API process and separate worker processes on
+    the same host: a claim is a single UPDATE ... RETURNING statement.
+    """
+
+    COLUMNS = [
+        "id", "file_path", "filename", "status", "progress", "chunks_done", "attempts",
+        "max_attempts", "doc_id", "chunks_reused", "chunks_recomputed", "error", "cancel_requested",
+        "worker", "available_at", "lease_expires_at", "created_at", "updated_at"
+    ]
+
+    def __init__(self, path: str = "./data/ingestion_jobs.sqlite"):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS ingestion_jobs ("
+            "id TEXT PRIMARY KEY, file_path TEXT NOT NULL, filename TEXT NOT NULL, "
+            "status TEXT NOT NULL, progress REAL NOT NULL, chunks_done INTEGER NOT NULL, "
+            "attempts INTEGER NOT NULL, max_attempts INTEGER NOT NULL, doc_id TEXT, "
+            "chunks_reused INTEGER NOT NULL DEFAULT 0, chunks_recomputed INTEGER NOT NULL DEFAULT 0, error TEXT, "
+            "cancel_requested INTEGER NOT NULL, worker TEXT, available_at REAL NOT NULL, "
+            "lease_expires_at REAL, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        # Queues created before the chunk counters existed
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(ingestion_jobs)")}
+        for column in ["chunks_reused", "chunks_recomputed"]:
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE ingestion_jobs ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_ingestion_jobs_ready ON ingestion_jobs(status, available_at)"
+        )
+        self._conn.commit()
+
+    def _row(self, row: Optional[sqlite3.Row]) -> Optional[Dict[str, Any]]:
+        if row is None:
+            return None
+        job = dict(row)
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        return job
+
+    def _enqueue(self, job: Dict[str, Any]) -> Tuple[Dict[str, Any], bool]:
+        with self._lock:
+            cursor = self._conn.execute(
+                f"INSERT OR IGNORE INTO ingestion_jobs ({', '.join(self.COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(self.COLUMNS))})",
+                [int(job[c]) if c == "cancel_requested" else job[c] for c in self.COLUMNS]
+            )
+            self._conn.commit()
+            created = cursor.rowcount == 1
+            row = self._conn.execute("SELECT * FROM ingestion_jobs WHERE id = ?", (job["id"],)).fetchone()
+        return self._row(row), created
+
+    def _get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM ingestion_jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row(row)
+
+    def _claim(self, worker: str, lease: float) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            # Queued jobs that are due, or running jobs whose worker stopped renewing its lease
+            row = self._conn.execute(
+                "UPDATE ingestion_jobs SET status = ?, worker = ?, attempts = attempts + 1, "
+                "lease_expires_at = ?, updated_at = ? "
+                "WHERE id = (SELECT id FROM ingestion_jobs WHERE "
+                "(status = ? AND available_at <= ?) OR (status = ? AND lease_expires_at < ?) "
+                "ORDER BY available_at LIMIT 1) RETURNING *",
+                (RUNNING, worker, now + lease, now, QUEUED, now, RUNNING, now)
+            ).fetchone()
+            self._conn.commit()
+        return self._row(row)
+
+    def _update(self, job_id: str, fields: Dict[str, Any], worker: Optional[str]) -> Optional[Dict[str, Any]]:
+        fields = dict(fields, updated_at=time.time())
+        if "cancel_requested" in fields:
+            fields["cancel_requested"] = int(fields["cancel_requested"])
+        assignments = ", ".join(f"{key} = ?" for key in fields)
+        params = list(fields.values()) + [job_id]
+        condition = "id = ?"
+        if worker is not None:
+            # Only the worker holding the lease may write; a stale worker's update is dropped
+            condition += " AND worker = ? AND status = ?"
+            params += [worker, RUNNING]
+        with self._lock:
+            row = self._conn.execute(
+                f"UPDATE ingestion_jobs SET {assignments} WHERE {condition} RETURNING *", params
+            ).fetchone()
+            self._conn.commit()
+        return self._row(row)
+
+    def _cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE ingestion_jobs SET status = ?, updated_at = ? WHERE id = ? AND status = ?",
+                (CANCELLED, now, job_id, QUEUED)
+            )
+            self._conn.execute(
+                "UPDATE ingestion_jobs SET cancel_requested = 1, updated_at = ? WHERE id = ? AND status = ?",
+                (now, job_id, RUNNING)
+            )
+            self._conn.commit()
+            row = self._conn.execute("SELECT * FROM ingestion_jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row(row)
+
+    async def enqueue(self, job: Dict[str, Any]) -> Tuple[Dict[str, Any], bool]:
+        """Insert a job unless one with the same ID exists; returns (job, created)"""
+        return await asyncio.to_thread(self._enqueue, job)
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self._get, job_id)
+
+    async def claim(self, worker: str, lease: float) -> Optional[Dict[str, Any]]:
+        """Atomically take the next due job and lease it to a worker"""
+        return await asyncio.to_thread(self._claim, worker, lease)
+
+    async def update(self, job_id: str, worker: Optional[str] = None, **fields) -> Optional[Dict[str, Any]]:
+        """Update job fields; with worker set, only while that worker holds the job"""
+        return await asyncio.to_thread(self._update, job_id, fields, worker)
+
+    async def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Cancel a queued job, or flag a running one for its worker to stop"""
+        return await asyncio.to_thread(self._cancel, job_id)
+
+    async def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+class RedisJobStore:
+    """
+    Redis-backed job store for workers spread over several hosts
+
+    Jobs are hashes under {prefix}:job:{id}. Due and leased jobs live in one
+    sorted set scored by the time they become claimable; ZREM decides which
+    worker wins a claim.
+    """
+
+    # Claim the lowest-scored due member and lease it, atomically (hash values are JSON)
+    CLAIM_SCRIPT = """
+    local ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, 1)
+    if #ids == 0 then return nil end
+    local key = ARGV[4] .. ids[1]
+    local status = redis.call('HGET', key, 'status')
+    if status ~= '"queued"' and status ~= '"running"' then
+        redis.call('ZREM', KEYS[1], ids[1])
+        return nil
+    end
+    redis.call('ZADD', KEYS[1], ARGV[2], ids[1])
+    redis.call('HSET', key, 'status', '"running"', 'worker', ARGV[3], 'lease_expires_at', ARGV[2], 'updated_at', ARGV[1])
+    redis.call('HINCRBY', key, 'attempts', 1)
+    return ids[1]
+    """
+
+    def __init__(self, url: Optional[str] = None, prefix: str = "ingest"):
+        import redis.asyncio as redis
+
+        self.redis = redis.from_url(url or os.getenv("REDIS_URL", "redis://localhost:6379/0"), decode_responses=True)
+        self.prefix = prefix
+        self.ready_key = f"{prefix}:ready"
+        self._claim_script = self.redis.register_script(self.CLAIM_SCRIPT)
+
+    def _key(self, job_id: str) -> str:
+        return f"{self.prefix}:job:{job_id}"
+
+    @staticmethod
+    def _encode(fields: Dict[str, Any]) -> Dict[str, str]:
+        return {key: json.dumps(value, ensure_ascii=False) for key, value in fields.items()}
+
+    @staticmethod
+    def _decode(data: Dict[str, str]) -> Optional[Dict[str, Any]]:
+        if not data:
+            return None
+        return {key: json.loads(value) for key, value in data.items()}
+
+    async def enqueue(self, job: Dict[str, Any]) -> Tuple[Dict[str, Any], bool]:
+        key = self._key(job["id"])
+        created = await self.redis.hsetnx(key, "id", json.dumps(job["id"]))
+        if created:
+            await self.redis.hset(key, mapping=self._encode(job))
+            await self.redis.zadd(self.ready_key, {job["id"]: job["available_at"]})
+        return await self.get(job["id"]), bool(created)
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self._decode(await self.redis.hgetall(self._key(job_id)))
+
+    async def claim(self, worker: str, lease: float) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        job_id = await self._claim_script(
+            keys=[self.ready_key], args=[repr(now), repr(now + lease), json.dumps(worker), f"{self.prefix}:job:"]
+        )
+        return await self.get(job_id) if job_id else None
+
+    async def update(self, job_id: str, worker: Optional[str] = None, **fields) -> Optional[Dict[str, Any]]:
+        job = await self.get(job_id)
+        if job is None or (worker is not None and (job.get("worker") != worker or job.get("status") != RUNNING)):
+            return None
+        fields["updated_at"] = time.time()
+        await self.redis.hset(self._key(job_id), mapping=self._encode(fields))
+        status = fields.get("status")
+        if status in FINAL_STATES:
+            await self.redis.zrem(self.ready_key, job_id)
+        elif status == QUEUED:
+            await self.redis.zadd(self.ready_key, {job_id: fields.get("available_at", time.time())})
+        elif "lease_expires_at" in fields:
+            await self.redis.zadd(self.ready_key, {job_id: fields["lease_expires_at"]})
+        return await self.get(job_id)
+
+    async def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = await self.get(job_id)
+        if job is None:
+            return None
+        if job["status"] == QUEUED:
+            return await self.update(job_id, status=CANCELLED)
+        if job["status"] == RUNNING:
+            return await self.update(job_id, cancel_requested=True)
+        return job
+
+    async def close(self) -> None:
+        await self.redis.close()
+
+def create_job_store(backend: Optional[str] = None):
+    """Job store selected by INGEST_QUEUE (sqlite | redis)"""
+    backend = (backend or os.getenv("INGEST_QUEUE", "sqlite")).lower()
+    if backend == "redis":
+        return RedisJobStore()
+    return SQLiteJobStore(os.getenv("INGEST_QUEUE_PATH", "./data/ingestion_jobs.sqlite"))
+
+class IngestionQueue:
+    """
+    Background ingestion: uploads are enqueued and processed by a worker pool
+
+    Each worker claims one job at a time under a lease that a heartbeat
+    renews every lease/3 seconds for as long as the job runs, however long
+    extraction or a rate-limited embedding call takes; a job whose worker
+    dies is picked up again after the lease expires, and a worker that
+    finds its lease taken over stops without touching the document.
+    DocumentProcessor derives the document ID from the upload's content,
+    so a retried or re-run job updates the same document instead of
+    duplicating it.
+    """
+
+    def __init__(
+        self,
+        document_processor,
+        store=None,
+        workers: Optional[int] = None,
+        max_attempts: Optional[int] = None,
+        lease: float = 60.0,
+        poll_interval: float = 0.5
+    ):
+        self.document_processor = document_processor
+        self.store = store or create_job_store()
+        self.workers = workers if workers is not None else int(os.getenv("INGEST_WORKERS", 2))
+        self.max_attempts = max_attempts or int(os.getenv("INGEST_MAX_ATTEMPTS", 3))
+        self.lease = lease
+        self.poll_interval = poll_interval
+        # Backoff between attempts reuses the LLM retry policy shape (INGEST_RETRY_* env)
+        self.retry_policy = RetryPolicy.from_env("INGEST")
+        self.worker_prefix = f"{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+
+    async def submit(self, file_path: str, filename: Optional[str] = None, job_id: Optional[str] = None) -> Tuple[Dict[str, Any], bool]:
+        """
+        Enqueue a document for ingestion
+
+        Args:
+            file_path: Path of the uploaded file; owned by the queue from now on
+            filename: Original filename (its extension selects the extractor)
+            job_id: Idempotency key; submitting an existing ID returns that job,
+                unless it failed, was cancelled, or its document has since been deleted
+
+        Returns:
+            Tuple of (job, created); created is False when the ID was already known
+        """
+        job = _new_job(job_id or str(uuid.uuid4()), file_path, filename or os.path.basename(file_path), self.max_attempts)
+        job, created = await self.store.enqueue(job)
+        if not created and (
+            job["status"] in (FAILED, CANCELLED)
+            or (job["status"] == SUCCEEDED and not await self._document_exists(job["doc_id"]))
+        ):
+            # Resubmitting a failed or cancelled job, or one whose document is gone, runs it again with the new upload
+            job = await self.store.update(
+                job["id"], status=QUEUED, file_path=file_path, attempts=0, progress=0.0, chunks_done=0,
+                doc_id=None, error=None, cancel_requested=False, available_at=time.time()
+            )
+            created = True
+        if created:
+            self._wakeup.set()
+        return job, created
+
+    async def _document_exists(self, doc_id: Optional[str]) -> bool:
+        if doc_id is None:
+            return False
+        return await asyncio.to_thread(self.document_processor.metadata_store.get, doc_id) is not None
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await self.store.get(job_id)
+
+    async def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Cancel a job; a running job stops at its next progress report"""
+        job = await self.store.cancel(job_id)
+        if job is not None and job["status"] == CANCELLED and os.path.exists(job["file_path"]):
+            os.remove(job["file_path"])
+        return job
+
+    def start(self) -> None:
+        """Start the in-process worker pool (no-op with INGEST_WORKERS=0)"""
+        for i in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker(f"{self.worker_prefix}-{i}")))
+        if self._tasks:
+            logger.info(f"文档入库队列已启动: {len(self._tasks)} 个worker")
+
+    async def stop(self) -> None:
+        """Stop workers; jobs they were running are re-claimed after their lease expires"""
+        self._stopping = True
+        self._wakeup.set()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self, name: str) -> None:
+        while not self._stopping:
+            try:
+                job = await self.store.claim(name, self.lease)
+            except Exception as e:
+                logger.error(f"入库任务领取失败: {e}")
+                job = None
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(name, job)
+
+    async def _run(self, worker: str, job: Dict[str, Any]) -> None:
+        job_id = job["id"]
+        started = time.perf_counter()
+        processing: Optional[asyncio.Task] = None
+        lease_lost = False
+
+        def lose_lease() -> None:
+            # Another worker owns the job now: stop without the rollback a
+            # JobCancelled triggers, which would delete the document it is writing
+            nonlocal lease_lost
+            if not lease_lost:
+                lease_lost = True
+                logger.warning(f"入库任务租约已被其他worker接管，停止处理: {job_id}")
+                processing.cancel()
+
+        async def heartbeat() -> None:
+            while True:
+                await asyncio.sleep(self.lease / 3)
+                try:
+                    current = await self.store.update(
+                        job_id, worker=worker, lease_expires_at=time.time() + self.lease
+                    )
+                except Exception as e:
+                    logger.warning(f"入库任务租约续期失败: {job_id}: {e}")
+                    continue
+                if current is None:
+                    lose_lease()
+                    return
+
+        async def report(fraction: float, chunks_done: int) -> None:
+            current = await self.store.update(job_id, worker=worker, progress=fraction, chunks_done=chunks_done)
+            if current is None:
+                lose_lease()
+                # The cancellation lands here
+                await asyncio.sleep(0)
+            if current["cancel_requested"]:
+                raise JobCancelled(job_id)
+
+        # Re-claimed after its workers kept dying mid-job
+        if job["attempts"] > job["max_attempts"]:
+            await self._finish(job, worker, status=FAILED, error=job["error"] or "worker lost")
+            return
+
+        try:
+            if job["cancel_requested"]:
+                raise JobCancelled(job_id)
+            # Document identity comes from content, so a retry resolves to the same document
+            processing = asyncio.create_task(self.document_processor.process_document(
+                job["file_path"], progress=report, filename=job["filename"]
+            ))
+            renewer = asyncio.create_task(heartbeat())
+            try:
+                doc_id = await processing
+            except asyncio.CancelledError:
+                if lease_lost:
+                    return
+                # Worker shutdown: leave the job leased so another worker resumes it
+                raise
+            finally:
+                renewer.cancel()
+        except JobCancelled:
+            await self._finish(job, worker, status=CANCELLED)
+            logger.info(f"入库任务已取消: {job_id}")
+            return
+        except Exception as e:
+            if job["attempts"] < job["max_attempts"]:
+                delay = self.retry_policy.backoff(job["attempts"] - 1)
+                await self.store.update(
+                    job_id, worker=worker, status=QUEUED, error=str(e), progress=0.0,
+                    chunks_done=0, available_at=time.time() + delay, lease_expires_at=None
+                )
+                logger.warning(f"入库任务失败，{delay:.1f}秒后重试 ({job['attempts']}/{job['max_attempts']}): {job_id}: {e}")
+            else:
+                await self._finish(job, worker, status=FAILED, error=str(e))
+                logger.error(f"入库任务失败: {job_id}: {e}")
+            return
+
+        metadata = self.document_processor.metadata_store.get(doc_id) or {}
+        await self._finish(
+            job, worker, status=SUCCEEDED, progress=1.0, doc_id=doc_id, error=None,
+            chunks_reused=metadata.get("chunks_reused", 0),
+            chunks_recomputed=metadata.get("chunks_recomputed", 0)
+        )
+        logger.info(f"入库任务完成: {job_id} ({time.perf_counter() - started:.2f}s)")
+
+    async def _finish(self, job: Dict[str, Any], worker: str, **fields) -> None:
+        """Move a job to a final state and drop its upload (the processor keeps its own copy)"""
+        if await self.store.update(job["id"], worker=worker, lease_expires_at=None, **fields) is None:
+            return
+        try:
+            os.remove(job["file_path"])
+        except OSError:
+            pass
+
+async def run_workers(workers: int) -> None:
+    """Standalone worker process: consume the shared queue until SIGINT/SIGTERM"""
+    from backend.models.openai_handler import OpenAIHandler
+    from backend.rag.document_processor import DocumentProcessor
+    from backend.rag.vector_store import VectorStore
+    from backend.rag.pg_vector_store import PgVectorStore
+
+    openai_handler = OpenAIHandler()
+    await openai_handler.start()
+    if os.getenv("VECTOR_STORE", "file").lower() == "pgvector":
+        vector_store = PgVectorStore(openai_handler)
+        await vector_store.connect()
+    else:
+        vector_store = VectorStore(openai_handler)
+    document_processor = DocumentProcessor(openai_handler, vector_store)
+    await document_processor.start()
+    queue = IngestionQueue(document_processor, workers=workers)
+    queue.start()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+    await queue.stop()
+    await queue.store.close()
+    await document_processor.close()
+    if isinstance(vector_store, PgVectorStore):
+        await vector_store.close()
+    await openai_handler.close()
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Run ingestion workers against the shared job queue")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("INGEST_WORKERS", 2)))
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    asyncio.run(run_workers(args.workers))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
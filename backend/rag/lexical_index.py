@@ -0,0 +1,511 @@
+import os
+import re
+import glob
+import zlib
+import logging
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+from backend.rag.ann_index import top_k_rows
+
+logger = logging.getLogger(__name__)
+
+# Rows tokenised per vectorised batch when catching up with the store
+SYNC_BATCH = 20000
+# Segments are not merged beyond this many rows, which bounds merge time and memory
+MAX_MERGE_ROWS = 1 << 16
+
+# BM25 parameters; they are baked into the stored impacts
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Impact quantisation: weights lie in (0, k1 + 1)
+IMPACT_SCALE = 255 / (BM25_K1 + 1.0)
+
+_ASCII_WORD = re.compile(r"[a-z0-9]+")
+# ASCII word ids live above every CJK bigram id ((0x10FFFF << 21) | 0x10FFFF < 2**42)
+_WORD_ID_BASE = 1 << 42
+
+def _is_cjk(codes: np.ndarray) -> np.ndarray:
+    return (
+        ((codes >= 0x3400) & (codes <= 0x4DBF))
+        | ((codes >= 0x4E00) & (codes <= 0x9FFF))
+        | ((codes >= 0xF900) & (codes <= 0xFAFF))
+    )
+
+def tokenize_batch(texts: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Term ids of a batch of texts, vectorised over the whole batch
+
+    CJK runs give overlapping character bigrams (a single-character run
+    gives that character); ASCII letters/digits give lower-cased words.
+    Terms are integers: (code << 21 | next code) for bigrams, the code point
+    for lone characters, and a CRC above _WORD_ID_BASE for ASCII words, so
+    no vocabulary has to be kept.
+
+    Args:
+        texts: Texts to tokenise
+
+    Returns:
+        Tuple of (term ids, index of the text each term came from)
+    """
+    if not texts:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    joined = "\n".join(texts)
+    codes = np.frombuffer(joined.encode("utf-32-le"), dtype=np.uint32).astype(np.int64)
+    lengths = np.fromiter((len(text) + 1 for text in texts), dtype=np.int64, count=len(texts))
+    starts = np.cumsum(lengths) - lengths
+
+    cjk = _is_cjk(codes)
+    pair = cjk[:-1] & cjk[1:]
+    bigram_pos = np.flatnonzero(pair)
+    lone = cjk.copy()
+    lone[:-1] &= ~pair
+    lone[1:] &= ~pair
+    lone_pos = np.flatnonzero(lone)
+
+    terms = [(codes[bigram_pos] << 21) | codes[bigram_pos + 1], codes[lone_pos]]
+    positions = [bigram_pos, lone_pos]
+
+    word_terms, word_rows = [], []
+    for row, text in enumerate(texts):
+        for word in _ASCII_WORD.findall(text.lower()):
+            word_terms.append(_WORD_ID_BASE + zlib.crc32(word.encode("ascii")))
+            word_rows.append(row)
+
+    rows = np.searchsorted(starts, np.concatenate(positions), side="right") - 1
+    return (
+        np.concatenate(terms + [np.asarray(word_terms, dtype=np.int64)]),
+        np.concatenate([rows, np.asarray(word_rows, dtype=np.int64)])
+    )
+
+def _gap_widths(gaps: np.ndarray, term_starts: np.ndarray) -> np.ndarray:
+    """Bytes per gap for each term: the smallest of 1, 2, 4 that fits its largest gap"""
+    largest = np.maximum.reduceat(gaps, term_starts) if len(gaps) else np.empty(0, dtype=np.int64)
+    return np.where(largest < 1 << 8, 1, np.where(largest < 1 << 16, 2, 4)).astype(np.uint8)
+
+class Segment:
+    """
+    Immutable block of postings for a contiguous range of rows
+
+    Each row of a term's postings carries its BM25 term weight
+    tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl)), quantised to
+    uint8 when the row is indexed (an "impact"), so a query only multiplies
+    by the term's idf. Rows are stored per term in one of two forms:
+
+    - sparse: row gaps (the first relative to the segment's first row) in
+      the narrowest of 1, 2 or 4 bytes that fits the term's largest gap,
+      decoded with a single view and cumsum, plus the impacts alongside
+    - dense: terms found in at least half the rows store one impact byte
+      per row of the segment (0 where absent), which is no larger and lets
+      a query add or look up the term without decoding anything
+    """
+
+    def __init__(self, base: int, lengths, terms, df, widths, offsets, postings, impacts, max_impacts):
+        self.base = base
+        self.lengths = lengths          # tokens per row
+        self.terms = terms              # sorted unique term ids
+        self.df = df                    # rows per term
+        self.widths = widths            # bytes per gap, per term; 0 for dense terms
+        self.offsets = offsets          # byte offset of each term's postings, len(terms) + 1
+        self.postings = postings        # row gaps, or per-row impacts for dense terms
+        self.impacts = impacts          # impacts of sparse terms, in posting order
+        self.max_impacts = max_impacts  # largest impact per term: its score upper bound
+        self.impact_offsets = np.concatenate([[0], np.cumsum(np.where(widths > 0, df, 0))]).astype(np.int64)
+
+    @property
+    def size(self) -> int:
+        return len(self.lengths)
+
+    @classmethod
+    def build(
+        cls,
+        base: int,
+        lengths: np.ndarray,
+        terms: np.ndarray,
+        rows: np.ndarray,
+        avg_length: float = 0.0,
+        impacts: Optional[np.ndarray] = None
+    ) -> "Segment":
+        """
+        Encode postings
+
+        Args:
+            base: First row of the segment
+            lengths: Tokens per row of the segment
+            terms: Term id per token occurrence
+            rows: Absolute row per occurrence
+            avg_length: Average row length used for the impacts
+            impacts: Impacts of already aggregated, (term, row)-sorted pairs
+                (merging); terms/rows are then taken as they are
+        """
+        if impacts is None:
+            order = np.lexsort((rows, terms))
+            terms, rows = terms[order], rows[order]
+            new_pair = np.ones(len(terms), dtype=bool)
+            new_pair[1:] = (terms[1:] != terms[:-1]) | (rows[1:] != rows[:-1])
+            first = np.flatnonzero(new_pair)
+            tfs = np.diff(np.append(first, len(terms))).astype(np.float32)
+            terms, rows = terms[first], rows[first]
+            norm = BM25_K1 * (1.0 - BM25_B + BM25_B * lengths[rows - base] / max(avg_length, 1.0))
+            weights = tfs * (BM25_K1 + 1.0) / (tfs + norm)
+            impacts = np.clip(np.rint(weights * IMPACT_SCALE), 1, 255).astype(np.uint8)
+
+        size = len(lengths)
+        new_term = np.ones(len(terms), dtype=bool)
+        new_term[1:] = terms[1:] != terms[:-1]
+        term_starts = np.flatnonzero(new_term)
+        df = np.diff(np.append(term_starts, len(terms)))
+        gaps = np.diff(rows, prepend=base)
+        gaps[term_starts] = rows[term_starts] - base
+
+        dense = df * 2 >= size
+        widths = _gap_widths(gaps, term_starts)
+        widths[dense] = 0
+        offsets = np.concatenate([[0], np.cumsum(np.where(dense, size, widths * df))]).astype(np.int64)
+
+        term_of = np.repeat(np.arange(len(df)), df)
+        posting_widths = widths[term_of].astype(np.int64)
+        positions = offsets[term_of] + (np.arange(len(terms)) - term_starts[term_of]) * posting_widths
+        postings = np.zeros(int(offsets[-1]), dtype=np.uint8)
+        for j in range(4):
+            sel = posting_widths > j
+            postings[positions[sel] + j] = (gaps[sel] >> (8 * j)) & 0xFF
+        in_dense = posting_widths == 0
+        postings[offsets[term_of[in_dense]] + rows[in_dense] - base] = impacts[in_dense]
+
+        return cls(
+            base,
+            np.minimum(lengths, 65535).astype(np.uint16),
+            terms[term_starts],
+            df.astype(np.int32),
+            widths,
+            offsets,
+            postings,
+            impacts[~in_dense],
+            np.maximum.reduceat(impacts, term_starts) if len(terms) else np.empty(0, dtype=np.uint8)
+        )
+
+    @classmethod
+    def merge(cls, left: "Segment", right: "Segment") -> "Segment":
+        """One segment covering two adjacent ones"""
+        terms, rows, impacts = (np.concatenate(pair) for pair in zip(left.decode_all(), right.decode_all()))
+        # Both halves are (term, row)-sorted and every right row follows every
+        # left row, so a stable sort on the term alone restores the order
+        order = np.argsort(terms, kind="stable")
+        return cls.build(
+            left.base,
+            np.concatenate([left.lengths, right.lengths]),
+            terms[order], rows[order],
+            impacts=impacts[order]
+        )
+
+    def find(self, term: int) -> int:
+        """Index of a term in the segment, or -1"""
+        i = int(np.searchsorted(self.terms, term))
+        return i if i < len(self.terms) and self.terms[i] == term else -1
+
+    def dense(self, i: int) -> Optional[np.ndarray]:
+        """Per-row impacts of the i-th term if it is stored dense, else None"""
+        if self.widths[i]:
+            return None
+        return self.postings[self.offsets[i]:self.offsets[i + 1]]
+
+    def rows(self, i: int) -> np.ndarray:
+        """Absolute rows of the i-th term"""
+        data = self.postings[self.offsets[i]:self.offsets[i + 1]]
+        if not self.widths[i]:
+            return np.flatnonzero(data) + self.base
+        rows = np.cumsum(data.view(f"<u{int(self.widths[i])}"), dtype=np.int64)
+        rows += self.base
+        return rows
+
+    def impacts_of(self, i: int) -> np.ndarray:
+        """Impacts of the i-th term, in row order"""
+        dense = self.dense(i)
+        if dense is not None:
+            return dense[dense > 0]
+        return self.impacts[self.impact_offsets[i]:self.impact_offsets[i + 1]]
+
+    def lookup(self, term: int) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """Absolute rows and impacts of a term, or None"""
+        i = self.find(term)
+        if i < 0:
+            return None
+        return self.rows(i), self.impacts_of(i)
+
+    def decode_all(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(term, row, impact) for every posting"""
+        term_starts = np.concatenate([[0], np.cumsum(self.df)]).astype(np.int64)
+        term_of = np.repeat(np.arange(len(self.terms)), self.df)
+        posting_widths = self.widths[term_of].astype(np.int64)
+        positions = self.offsets[term_of] + (np.arange(len(term_of)) - term_starts[term_of]) * posting_widths
+        gaps = np.zeros(len(term_of), dtype=np.int64)
+        for j in range(4):
+            sel = posting_widths > j
+            gaps[sel] |= self.postings[positions[sel] + j].astype(np.int64) << (8 * j)
+        totals = np.cumsum(gaps)
+        # Gaps restart at every term: subtract the running total before each term's first posting
+        before = np.concatenate([[0], totals[term_starts[1:-1] - 1]]) if len(self.terms) else totals
+        rows = totals - before[term_of] + self.base
+
+        impacts = np.empty(len(term_of), dtype=np.uint8)
+        impacts[posting_widths > 0] = self.impacts
+        for i in np.flatnonzero(self.widths == 0):
+            dense = self.dense(i)
+            present = np.flatnonzero(dense)
+            rows[term_starts[i]:term_starts[i + 1]] = present + self.base
+            impacts[term_starts[i]:term_starts[i + 1]] = dense[present]
+        return self.terms[term_of], rows, impacts
+
+    def save(self, path: str) -> None:
+        tmp_path = path + ".tmp.npz"
+        np.savez(
+            tmp_path, base=self.base, lengths=self.lengths, terms=self.terms, df=self.df,
+            widths=self.widths, offsets=self.offsets, postings=self.postings, impacts=self.impacts,
+            max_impacts=self.max_impacts
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "Segment":
+        with np.load(path) as data:
+            return cls(
+                int(data["base"]), data["lengths"], data["terms"], data["df"], data["widths"],
+                data["offsets"], data["postings"], data["impacts"], data["max_impacts"]
+            )
+
+class BM25Index:
+    """
+    Lexical BM25 index over the chunk rows of the embedding store
+
+    Row numbers are shared with VectorStore, so liveness and metadata
+    filters are applied with the same masks as dense search. New rows are
+    tokenised into a segment; segments are merged log-structured (a new
+    segment is folded into the previous one while it is at least half its
+    size, up to MAX_MERGE_ROWS rows), which keeps the segment count small.
+    Segments are persisted next to the vectors, so a restart does not
+    re-tokenise the corpus.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.segments: List[Segment] = []
+        self._lengths = np.empty(0, dtype=np.uint16)  # tokens per row, all segments
+        self._total_length = 0
+        self._dirty = False
+        if self.path:
+            self.load()
+
+    @property
+    def ntotal(self) -> int:
+        return len(self._lengths)
+
+    def reset(self) -> None:
+        """Forget everything (the store was compacted and row numbers changed)"""
+        self.segments = []
+        self._lengths = np.empty(0, dtype=np.uint16)
+        self._total_length = 0
+        self._dirty = True
+
+    def sync(self, size: int, read_texts: Callable[[int, int], List[str]]) -> None:
+        """
+        Index rows [ntotal, size)
+
+        Args:
+            size: Number of rows in the store
+            read_texts: Returns the texts of rows [start, end)
+        """
+        if size < self.ntotal:
+            self.reset()
+        while self.ntotal < size:
+            start = self.ntotal
+            end = min(size, start + SYNC_BATCH)
+            terms, rows = tokenize_batch(read_texts(start, end))
+            lengths = np.bincount(rows, minlength=end - start)
+            avg_length = (self._total_length + int(lengths.sum())) / end
+            self._add_segment(Segment.build(start, lengths, terms, rows + start, avg_length))
+
+    def _add_segment(self, segment: Segment) -> None:
+        self.segments.append(segment)
+        while (
+            len(self.segments) >= 2
+            and self.segments[-1].size * 2 >= self.segments[-2].size
+            and self.segments[-1].size + self.segments[-2].size <= MAX_MERGE_ROWS
+        ):
+            right = self.segments.pop()
+            self.segments[-1] = Segment.merge(self.segments[-1], right)
+        self._lengths = np.concatenate([self._lengths, segment.lengths])
+        self._total_length += int(segment.lengths.sum(dtype=np.int64))
+        self._dirty = True
+
+    def _segment_file(self, segment: Segment) -> str:
+        return os.path.join(self.path, f"segment_{segment.base:012d}_{segment.size:012d}.npz")
+
+    def save(self) -> None:
+        """Persist the segments; files of merged-away segments are removed"""
+        if not self.path or not self._dirty:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        current = set()
+        for segment in self.segments:
+            path = self._segment_file(segment)
+            current.add(path)
+            if not os.path.exists(path):
+                segment.save(path)
+        for path in glob.glob(os.path.join(self.path, "segment_*.npz")):
+            if path not in current:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        self._dirty = False
+
+    def load(self) -> None:
+        """
+        Load persisted segments
+
+        Takes the longest contiguous chain of segments from row 0 (several
+        processes may have saved different segmentations); rows beyond it are
+        re-tokenised by the next sync().
+        """
+        by_base = {}
+        for path in glob.glob(os.path.join(self.path, "segment_*.npz")):
+            base, size = (int(part) for part in os.path.basename(path)[len("segment_"):-len(".npz")].split("_"))
+            if size > by_base.get(base, ("", 0))[1]:
+                by_base[base] = (path, size)
+        segments = []
+        expected = 0
+        while expected in by_base:
+            try:
+                segment = Segment.load(by_base[expected][0])
+            except (OSError, ValueError, KeyError):
+                break
+            segments.append(segment)
+            expected += segment.size
+        self.segments = segments
+        self._lengths = np.concatenate([s.lengths for s in segments]) if segments else np.empty(0, dtype=np.uint16)
+        self._total_length = int(self._lengths.sum(dtype=np.int64))
+
+    def search(self, query: str, k: int, mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Top-k rows by BM25
+
+        Args:
+            query: Query text
+            k: Number of results
+            mask: Optional boolean array of eligible rows
+
+        Returns:
+            Tuple of (row indices, scores)
+        """
+        n = self.ntotal
+        query_terms, _ = tokenize_batch([query])
+        query_terms = np.unique(query_terms)
+        if n == 0 or len(query_terms) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        # Per term: its (segment, term index) pairs, idf and score upper bound
+        postings, idfs, bounds = [], [], []
+        for term in query_terms:
+            found = [(segment, i) for segment in self.segments for i in [segment.find(int(term))] if i >= 0]
+            if not found:
+                continue
+            df = sum(int(segment.df[i]) for segment, i in found)
+            idf = float(np.log(1.0 + (n - df + 0.5) / (df + 0.5)))
+            postings.append(found)
+            idfs.append(idf)
+            bounds.append(idf * max(int(segment.max_impacts[i]) for segment, i in found) / IMPACT_SCALE)
+        if not postings:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        # MaxScore: terms are scored in decreasing upper bound order. Once the
+        # bounds of the remaining terms add up to no more than the k-th best
+        # score seen so far, a row matching only those terms cannot reach the
+        # top k, so they are only looked up for rows already found; terms that
+        # occur in most rows, whose idf is close to zero, usually end up there.
+        order = np.argsort(bounds, kind="stable")[::-1]
+        remaining = np.concatenate([np.cumsum(np.asarray(bounds)[order][::-1])[::-1], [0.0]])
+        scores = np.zeros(n, dtype=np.float32)
+        threshold = 0.0
+        essential = len(order)
+        for position, t in enumerate(order):
+            if remaining[position] <= threshold:
+                essential = position
+                break
+            table = np.arange(256, dtype=np.float32) * np.float32(idfs[t] / IMPACT_SCALE)
+            for segment, i in postings[t]:
+                dense = segment.dense(i)
+                if dense is not None:
+                    block = scores[segment.base:segment.base + segment.size]
+                    block += table[dense]
+                    eligible = block if mask is None else block[mask[segment.base:segment.base + segment.size]]
+                else:
+                    rows = segment.rows(i)
+                    scores[rows] += table[segment.impacts_of(i)]
+                    eligible = scores[rows if mask is None else rows[mask[rows]]]
+                if len(eligible) >= k:
+                    # k rows already score at least this much, so the k-th best does too
+                    threshold = max(threshold, float(np.partition(eligible, len(eligible) - k)[len(eligible) - k]))
+
+        matched = scores > 0
+        if mask is not None:
+            matched &= mask
+        candidates = np.flatnonzero(matched)
+        candidate_scores = scores[candidates]
+        # From here on scores is scratch space for one posting list at a time
+        scores[:] = 0
+        for position in range(essential, len(order)):
+            # Candidates only gain score, so the threshold rises as terms are added
+            if len(candidates) >= k:
+                threshold = max(threshold, float(np.partition(candidate_scores, len(candidates) - k)[len(candidates) - k]))
+            keep = candidate_scores + remaining[position] >= threshold
+            candidates, candidate_scores = candidates[keep], candidate_scores[keep]
+            t = order[position]
+            table = np.arange(256, dtype=np.float32) * np.float32(idfs[t] / IMPACT_SCALE)
+            for segment, i in postings[t]:
+                # Candidates are sorted: only those in the segment's row range are looked up
+                lo, hi = np.searchsorted(candidates, [segment.base, segment.base + segment.size])
+                if lo == hi:
+                    continue
+                in_segment = candidates[lo:hi]
+                dense = segment.dense(i)
+                if dense is not None:
+                    candidate_scores[lo:hi] += table[dense[in_segment - segment.base]]
+                elif len(in_segment) * 16 < segment.df[i]:
+                    rows = segment.rows(i)
+                    at = np.minimum(np.searchsorted(rows, in_segment), len(rows) - 1)
+                    hit = np.flatnonzero(rows[at] == in_segment)
+                    candidate_scores[lo + hit] += table[segment.impacts_of(i)[at[hit]]]
+                else:
+                    # Many candidates: scattering the list is cheaper than searching it
+                    rows = segment.rows(i)
+                    scores[rows] = table[segment.impacts_of(i)]
+                    candidate_scores[lo:hi] += scores[in_segment]
+                    scores[rows] = 0
+
+        best = top_k_rows(candidate_scores, k)
+        return candidates[best], candidate_scores[best]
+
+def reciprocal_rank_fusion(rankings: List[np.ndarray], k: int, rrf_k: int = 60) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Merge ranked row lists: score(row) = sum over lists of 1 / (rrf_k + rank)
+
+    Args:
+        rankings: Row arrays, best first
+        k: Number of results
+        rrf_k: Rank offset; larger values flatten the contribution of top ranks
+
+    Returns:
+        Tuple of (rows, fused scores), best first
+    """
+    rankings = [np.asarray(r, dtype=np.int64) for r in rankings if len(r)]
+    if not rankings:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+    rows = np.concatenate(rankings)
+    contributions = np.concatenate([1.0 / (rrf_k + np.arange(1, len(r) + 1)) for r in rankings])
+    fused_rows, inverse = np.unique(rows, return_inverse=True)
+    scores = np.bincount(inverse, weights=contributions)
+    # Ties are broken by row number so results are deterministic
+    order = np.lexsort((fused_rows, -scores))[:k]
+    return fused_rows[order], scores[order]
@@ -0,0 +1,54 @@
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+
+# Document metadata fields that search filters on
+FILTER_FIELDS = ("industry", "region")
+
+class MetadataIndex:
+    """
+    Inverted index from filter values to document IDs
+
+    Maintained incrementally as documents are added, updated and deleted,
+    so a filtered search looks its candidates up instead of walking every
+    document's metadata.
+    """
+
+    def __init__(self, fields: Iterable[str] = FILTER_FIELDS):
+        self.fields = tuple(fields)
+        self._postings: Dict[Tuple[str, Any], Set[str]] = {}
+        self._values: Dict[str, Dict[str, Any]] = {}  # doc_id -> indexed field values
+
+    def add(self, doc_id: str, metadata: Dict[str, Any]) -> None:
+        """Index (or re-index) a document's metadata"""
+        self.remove(doc_id)
+        values = {field: metadata[field] for field in self.fields if metadata.get(field) is not None}
+        for field, value in values.items():
+            self._postings.setdefault((field, value), set()).add(doc_id)
+        self._values[doc_id] = values
+
+    def remove(self, doc_id: str) -> None:
+        """Drop a document from the index"""
+        for field, value in self._values.pop(doc_id, {}).items():
+            docs = self._postings.get((field, value))
+            if docs is not None:
+                docs.discard(doc_id)
+                if not docs:
+                    del self._postings[(field, value)]
+
+    def lookup(self, **filters: Optional[str]) -> Optional[Set[str]]:
+        """
+        Documents matching every given filter
+
+        Args:
+            **filters: field=value pairs; None values are ignored
+
+        Returns:
+            Set of document IDs (possibly empty), or None if no filter was given
+        """
+        postings = [
+            self._postings.get((field, value), set())
+            for field, value in filters.items() if value
+        ]
+        if not postings:
+            return None
+        postings.sort(key=len)
+        return set(postings[0]).intersection(*postings[1:])
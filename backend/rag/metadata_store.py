@@ -0,0 +1,170 @@
+import os
+import json
+import logging
+import sqlite3
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = "./data/document_metadata.sqlite"
+# Whole-corpus JSON file used before this store; imported once, then renamed
+LEGACY_JSON_PATH = "./data/document_metadata.json"
+
+class MetadataStore:
+    """
+    Shared document metadata store (SQLite, WAL)
+
+    One row per document, so an upsert or delete is a single-row write
+    whatever the corpus size, and every API worker and ingestion process on
+    the host reads the same data. Each write bumps a global change version
+    and stamps it on the document's row (deletions leave a tombstone row);
+    readers that mirror the metadata in memory poll `version`, a single-row
+    read, and pull only the documents changed since with changes().
+    """
+
+    def __init__(self, path: Optional[str] = None, legacy_json_path: Optional[str] = LEGACY_JSON_PATH):
+        self.path = path or os.getenv("METADATA_DB_PATH", DEFAULT_PATH)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "id TEXT PRIMARY KEY, metadata TEXT, content_hash TEXT, source TEXT, "
+            "processed_date TEXT, version INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_version ON documents(version)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_content_hash ON documents(content_hash)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_source ON documents(source)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS store_state (id INTEGER PRIMARY KEY CHECK (id = 0), version INTEGER NOT NULL)"
+        )
+        self._conn.execute("INSERT OR IGNORE INTO store_state (id, version) VALUES (0, 0)")
+        self._conn.commit()
+        if legacy_json_path and os.path.exists(legacy_json_path):
+            self._import_legacy(legacy_json_path)
+
+    def _import_legacy(self, path: str) -> None:
+        """Import the old JSON metadata file into an empty store, then rename it"""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                documents = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"旧版元数据文件无法读取，已跳过导入: {path}: {e}")
+            return
+        with self._lock:
+            # The write lock is taken up front so concurrent workers import only once
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if self._conn.execute("SELECT 1 FROM documents LIMIT 1").fetchone() is None:
+                    version = self._conn.execute("SELECT version FROM store_state WHERE id = 0").fetchone()[0]
+                    self._conn.executemany(
+                        "INSERT INTO documents (id, metadata, content_hash, source, processed_date, version) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        [self._row(doc_id, metadata, version + i + 1) for i, (doc_id, metadata) in enumerate(documents.items())]
+                    )
+                    self._conn.execute(
+                        "UPDATE store_state SET version = ? WHERE id = 0", (version + len(documents),)
+                    )
+                    logger.info(f"已从 {path} 导入 {len(documents)} 条文档元数据")
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+        try:
+            os.replace(path, path + ".imported")
+        except OSError:
+            pass
+
+    @staticmethod
+    def _row(doc_id: str, metadata: Optional[Dict[str, Any]], version: int) -> Tuple:
+        if metadata is None:
+            return (doc_id, None, None, None, None, version)
+        return (
+            doc_id,
+            json.dumps(metadata, ensure_ascii=False),
+            metadata.get("content_hash"),
+            metadata.get("source"),
+            metadata.get("processed_date"),
+            version
+        )
+
+    def _write(self, doc_id: str, metadata: Optional[Dict[str, Any]]) -> int:
+        with self._lock:
+            # The version bump and the row write commit together
+            version = self._conn.execute(
+                "UPDATE store_state SET version = version + 1 WHERE id = 0 RETURNING version"
+            ).fetchone()[0]
+            self._conn.execute(
+                "INSERT INTO documents (id, metadata, content_hash, source, processed_date, version) "
+                "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(id) DO UPDATE SET "
+                "metadata = excluded.metadata, content_hash = excluded.content_hash, source = excluded.source, "
+                "processed_date = excluded.processed_date, version = excluded.version",
+                self._row(doc_id, metadata, version)
+            )
+            self._conn.commit()
+        return version
+
+    def upsert(self, doc_id: str, metadata: Dict[str, Any]) -> int:
+        """
+        Insert or replace a document's metadata
+
+        Args:
+            doc_id: Document ID
+            metadata: Document metadata
+
+        Returns:
+            New store version
+        """
+        return self._write(doc_id, metadata)
+
+    def delete(self, doc_id: str) -> int:
+        """Delete a document's metadata; returns the new store version"""
+        return self._write(doc_id, None)
+
+    @property
+    def version(self) -> int:
+        """Change version: increases with every write by any process"""
+        with self._lock:
+            return self._conn.execute("SELECT version FROM store_state WHERE id = 0").fetchone()[0]
+
+    def get(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        """Metadata of a document, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT metadata FROM documents WHERE id = ? AND metadata IS NOT NULL", (doc_id,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def find(self, content_hash: Optional[str] = None, source: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Most recently processed document with the given content hash or source"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT metadata FROM documents WHERE metadata IS NOT NULL AND (content_hash = ? OR source = ?) "
+                "ORDER BY processed_date DESC LIMIT 1",
+                (content_hash, source)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def changes(self, since: int = 0) -> Tuple[int, Dict[str, Optional[Dict[str, Any]]]]:
+        """
+        Documents written after a version
+
+        Args:
+            since: Version the caller has already seen (0 for everything)
+
+        Returns:
+            Tuple of (version now seen, {doc_id: metadata, or None if deleted})
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, metadata, version FROM documents WHERE version > ? ORDER BY version", (since,)
+            ).fetchall()
+        changed = {doc_id: json.loads(metadata) if metadata is not None else None for doc_id, metadata, _ in rows}
+        return (rows[-1][2] if rows else since), changed
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
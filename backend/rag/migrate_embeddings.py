@@ -0,0 +1,90 @@
+"""
+One-shot migration of legacy JSON embeddings into the binary embedding store
+
+Usage:
+    python -m backend.rag.migrate_embeddings [--data-dir ./data] [--delete] [--compact]
+"""
+import os
+import sys
+import json
+import glob
+import argparse
+import logging
+
+import numpy as np
+
+from backend.rag.embedding_storage import EmbeddingStorage
+
+logger = logging.getLogger(__name__)
+
+def migrate(data_dir: str = "./data", delete: bool = False) -> int:
+    """
+    Import every data/embeddings/*_embeddings.json into data/vectors
+
+    Args:
+        data_dir: Data root containing embeddings/, chunks/ and vectors/
+        delete: Remove the JSON files once a document has been imported
+
+    Returns:
+        Number of documents migrated
+    """
+    embeddings_dir = os.path.join(data_dir, "embeddings")
+    chunks_dir = os.path.join(data_dir, "chunks")
+    storage = EmbeddingStorage(os.path.join(data_dir, "vectors"))
+    # Read the row log once, not once per file
+    imported = storage.live_documents()
+
+    migrated = 0
+    for embedding_file in sorted(glob.glob(os.path.join(embeddings_dir, "*_embeddings.json"))):
+        doc_id = os.path.basename(embedding_file)[:-len("_embeddings.json")]
+        chunks_file = os.path.join(chunks_dir, f"{doc_id}_chunks.json")
+
+        if doc_id in imported:
+            logger.info(f"Skipping {doc_id}: already migrated")
+        else:
+            with open(embedding_file, "r", encoding="utf-8") as f:
+                embeddings = json.load(f)
+            chunks = []
+            if os.path.exists(chunks_file):
+                with open(chunks_file, "r", encoding="utf-8") as f:
+                    chunks = json.load(f)
+
+            # Prefer full chunk text; old embedding files only carry a preview
+            texts = [
+                chunks[item["chunk_id"]] if item["chunk_id"] < len(chunks) else item.get("text", "")
+                for item in embeddings
+            ]
+            storage.append(
+                doc_id,
+                [item["chunk_id"] for item in embeddings],
+                np.asarray([item["embedding"] for item in embeddings], dtype=np.float32),
+                texts
+            )
+            imported.add(doc_id)
+            migrated += 1
+            logger.info(f"Migrated {doc_id}: {len(embeddings)} chunks")
+
+        if delete:
+            os.remove(embedding_file)
+            if os.path.exists(chunks_file):
+                os.remove(chunks_file)
+
+    return migrated
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Migrate JSON embeddings to the binary embedding store")
+    parser.add_argument("--data-dir", default="./data", help="Data directory (default: ./data)")
+    parser.add_argument("--delete", action="store_true", help="Delete JSON files after migration")
+    parser.add_argument("--compact", action="store_true", help="Compact the store after migration")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    count = migrate(args.data_dir, delete=args.delete)
+    if args.compact:
+        EmbeddingStorage(os.path.join(args.data_dir, "vectors")).compact()
+    logger.info(f"Migration finished: {count} documents imported")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,34 +1,202 @@
 import os
-import json
 import asyncio
-import math
-from typing import List, Dict, Any, Optional, Tuple
+import logging
+from typing import List, Dict, Any, Optional, Tuple, Union
 import glob
 
+import numpy as np
+
+from backend.rag.embedding_storage import EmbeddingStorage
+from backend.rag.ann_index import create_index, top_k_rows
+from backend.rag.metadata_index import MetadataIndex
+from backend.rag.metadata_store import MetadataStore
+from backend.rag.lexical_index import BM25Index, reciprocal_rank_fusion
+
+logger = logging.getLogger(__name__)
+
 class VectorStore:
-    def __init__(self):
+    def __init__(self, openai_handler=None):
+        # Handler used to embed queries; must match the model used at ingestion
+        self.openai_handler = openai_handler
+
         # Setup directories
         self.chunks_dir = "./data/chunks"
         self.embeddings_dir = "./data/embeddings"
-        self.metadata_file = "./data/document_metadata.json"
         
         # Create directories if they don't exist
         for directory in [self.chunks_dir, self.embeddings_dir]:
             os.makedirs(directory, exist_ok=True)
         
-        # Load document metadata
+        # Document metadata: shared store, mirrored in memory with an inverted
+        # index over the filter fields and refreshed when its version changes
+        self.metadata_store = MetadataStore()
         self.document_metadata = {}
-        self._load_metadata()
-    
-    def _load_metadata(self):
-        """Load document metadata from file"""
-        if os.path.exists(self.metadata_file):
-            try:
-                with open(self.metadata_file, "r", encoding="utf-8") as f:
-                    self.document_metadata = json.load(f)
-            except json.JSONDecodeError:
-                self.document_metadata = {}
+        self.metadata_index = MetadataIndex()
+        self._metadata_version = 0
+        self._refresh_metadata()
+
+        # Filters matching at most this share of rows are scored directly on
+        # their rows (pre-filtering); broader ones search the index and drop
+        # non-matching hits (post-filtering)
+        self.prefilter_selectivity = float(os.getenv("VECTOR_PREFILTER_SELECTIVITY", 0.3))
+
+        # Binary embedding store; vectors are memory-mapped, not parsed
+        self.storage = EmbeddingStorage("./data/vectors")
+
+        # Pluggable search backend over the matrix (VECTOR_INDEX=exact|ivf)
+        self.index = create_index(path=os.path.join(self.storage.root_dir, "ivf.npz"))
+
+        # SEARCH_MODE=hybrid adds a BM25 index over the same rows, fused with
+        # the dense ranking by reciprocal rank; dense uses the vectors only
+        self.search_mode = os.getenv("SEARCH_MODE", "hybrid").lower()
+        self.lexical = BM25Index(os.path.join(self.storage.root_dir, "bm25")) if self.search_mode == "hybrid" else None
+        self.rrf_k = int(os.getenv("RRF_K", 60))
+        # Candidates taken from each ranking before fusion
+        self.fusion_depth = int(os.getenv("FUSION_DEPTH", 50))
+
+        # Resident index: memory-mapped L2-normalised float32 rows plus parallel row arrays
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._doc_ids = np.empty(0, dtype=object)
+        self._chunk_ids = np.empty(0, dtype=np.int32)
+        self._text_offsets = np.empty(0, dtype=np.int64)
+        self._text_lengths = np.empty(0, dtype=np.int32)
+        self._tags = np.empty(0, dtype=object)
+        self._alive = np.empty(0, dtype=bool)
+        self._rows_by_doc: Dict[str, List[int]] = {}
+        self._size = 0
+        self._log_offset = 0
+        self._log_inode = None
+        self._load_index()
     
+    def _refresh_metadata(self) -> None:
+        """Apply metadata written since the last refresh (by this or another worker)"""
+        if self.metadata_store.version == self._metadata_version:
+            return
+        self._metadata_version, changed = self.metadata_store.changes(self._metadata_version)
+        for doc_id, metadata in changed.items():
+            if metadata is None:
+                self.document_metadata.pop(doc_id, None)
+                self.metadata_index.remove(doc_id)
+            else:
+                self.document_metadata[doc_id] = metadata
+                self.metadata_index.add(doc_id, metadata)
+
+    def _load_index(self):
+        """Map the embedding store and build the row arrays from its log"""
+        self._doc_ids = np.empty(0, dtype=object)
+        self._chunk_ids = np.empty(0, dtype=np.int32)
+        self._text_offsets = np.empty(0, dtype=np.int64)
+        self._text_lengths = np.empty(0, dtype=np.int32)
+        self._tags = np.empty(0, dtype=object)
+        self._alive = np.empty(0, dtype=bool)
+        self._rows_by_doc = {}
+        self._size = 0
+        self._log_offset = 0
+        self._sync()
+
+        legacy_files = glob.glob(os.path.join(self.embeddings_dir, "*_embeddings.json"))
+        if legacy_files:
+            logger.warning(
+                f"{len(legacy_files)} legacy JSON embedding files found; "
+                f"run `python -m backend.rag.migrate_embeddings` to import them"
+            )
+        self.index.sync(self._matrix)
+        self.index.save()
+        if self.lexical is not None:
+            self.lexical.save()
+        logger.info(
+            f"Vector index loaded: {int(self._alive.sum())} chunks from {len(self._rows_by_doc)} documents "
+            f"({self.index.name})"
+        )
+
+    def _sync(self) -> None:
+        """
+        Pick up rows written since the last sync (by this or another worker)
+
+        Only the tail of the row log is read; the vector file is re-mapped,
+        which does not copy any data.
+        """
+        try:
+            stat = os.stat(self.storage.rows_file)
+        except FileNotFoundError:
+            return
+        if self._log_inode is not None and stat.st_ino != self._log_inode:
+            # Store was compacted: row numbers changed, rebuild from scratch
+            self._log_inode = None
+            self.index.reset()
+            if self.lexical is not None:
+                self.lexical.reset()
+            self._load_index()
+            return
+        self._log_inode = stat.st_ino
+        if stat.st_size == self._log_offset:
+            return
+
+        records, self._log_offset = self.storage.read_log(self._log_offset)
+        added = [record for record in records if record["op"] == "add"]
+
+        if added:
+            self._doc_ids = np.concatenate([self._doc_ids, np.array([r["doc_id"] for r in added], dtype=object)])
+            self._chunk_ids = np.concatenate([self._chunk_ids, np.array([r["chunk_id"] for r in added], dtype=np.int32)])
+            self._text_offsets = np.concatenate([self._text_offsets, np.array([r["offset"] for r in added], dtype=np.int64)])
+            self._text_lengths = np.concatenate([self._text_lengths, np.array([r["length"] for r in added], dtype=np.int32)])
+            tags = np.empty(len(added), dtype=object)
+            tags[:] = [r.get("tags") for r in added]
+            self._tags = np.concatenate([self._tags, tags])
+            self._alive = np.concatenate([self._alive, np.ones(len(added), dtype=bool)])
+
+        row = self._size
+        for record in records:
+            if record["op"] == "add":
+                self._rows_by_doc.setdefault(record["doc_id"], []).append(row)
+                row += 1
+            elif record["op"] == "del" and "chunk_ids" in record:
+                rows = np.asarray(self._rows_by_doc.get(record["doc_id"], []), dtype=np.int64)
+                dropped = np.isin(self._chunk_ids[rows], record["chunk_ids"])
+                self._alive[rows[dropped]] = False
+                if dropped.all():
+                    self._rows_by_doc.pop(record["doc_id"], None)
+                else:
+                    self._rows_by_doc[record["doc_id"]] = rows[~dropped].tolist()
+            elif record["op"] == "del":
+                self._alive[self._rows_by_doc.pop(record["doc_id"], [])] = False
+        self._size = row
+
+        self.storage._load_meta()
+        self._matrix = self.storage.open_vectors(self._size)
+        if self.lexical is not None:
+            self.lexical.sync(self._size, self._read_texts)
+
+    def _read_texts(self, start: int, end: int) -> List[str]:
+        """Texts of rows [start, end), read with one sequential pass over the text store"""
+        offsets = self._text_offsets[start:end]
+        lengths = self._text_lengths[start:end]
+        if len(offsets) == 0:
+            return []
+        first = int(offsets.min())
+        with open(self.storage.texts_file, "rb") as f:
+            f.seek(first)
+            data = f.read(int((offsets + lengths).max()) - first)
+        return [
+            data[offset - first:offset - first + length].decode("utf-8")
+            for offset, length in zip(offsets.tolist(), lengths.tolist())
+        ]
+
+    async def _embed_queries(self, queries: List[str]) -> Optional[np.ndarray]:
+        """Embed and normalise queries in one request, or return None if no embedder is configured"""
+        if self.openai_handler is None:
+            logger.warning("VectorStore has no embedding handler; cannot embed query")
+            return None
+        # Repeated texts (same query under different filters) are embedded once
+        unique = list(dict.fromkeys(queries))
+        vectors = np.asarray(await self.openai_handler.embeddings(unique), dtype=np.float32)
+        if len(unique) < len(queries):
+            position = {query: i for i, query in enumerate(unique)}
+            vectors = vectors[[position[query] for query in queries]]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
     async def search(
         self, 
         query: str, 
@@ -48,72 +216,123 @@ class VectorStore:
         Returns:
             Tuple of (context, sources)
         """
-        # In a real implementation, generate query embedding and do similarity search
-        # For this example, we'll simulate the search process
-        
-        # Get all embeddings files
-        embedding_files = glob.glob(os.path.join(self.embeddings_dir, "*_embeddings.json"))
-        
-        # Get document IDs that match filters
-        filtered_doc_ids = []
-        for doc_id, metadata in self.document_metadata.items():
-            if industry and metadata.get("industry") != industry:
-                continue
-            if region and metadata.get("region") != region:
-                continue
-            filtered_doc_ids.append(doc_id)
-        
-        # Collect all chunks from filtered documents
-        all_chunks = []
-        for embedding_file in embedding_files:
-            doc_id = os.path.basename(embedding_file).split("_")[0]
-            if not filtered_doc_ids or doc_id in filtered_doc_ids:
-                try:
-                    with open(embedding_file, "r", encoding="utf-8") as f:
-                        embeddings = json.load(f)
-                        
-                        # Load corresponding chunks file to get full text
-                        chunks_file = os.path.join(self.chunks_dir, f"{doc_id}_chunks.json")
-                        if os.path.exists(chunks_file):
-                            with open(chunks_file, "r", encoding="utf-8") as cf:
-                                chunks = json.load(cf)
-                                
-                                for i, embedding in enumerate(embeddings):
-                                    if i < len(chunks):
-                                        all_chunks.append({
-                                            "doc_id": doc_id,
-                                            "chunk_id": embedding["chunk_id"],
-                                            "text": chunks[i],
-                                            "metadata": self.document_metadata.get(doc_id, {})
-                                        })
-                except Exception as e:
-                    print(f"Error loading embeddings: {str(e)}")
-        
-        # Simulate semantic search
-        # In a real implementation, compute similarity between query embedding and all chunk embeddings
-        # For now, use simple keyword matching
-        results = []
-        query_keywords = set(query.lower().split())
-        
-        for chunk in all_chunks:
-            # Count matching keywords
-            chunk_text = chunk["text"].lower()
-            matching_keywords = sum(1 for keyword in query_keywords if keyword in chunk_text)
-            
-            # Calculate a simple relevance score
-            if matching_keywords > 0:
-                score = matching_keywords / len(query_keywords)
-                results.append({
-                    "doc_id": chunk["doc_id"],
-                    "chunk_id": chunk["chunk_id"],
-                    "text": chunk["text"],
-                    "score": score,
-                    "metadata": chunk["metadata"]
-                })
-        
-        # Sort by score and take top k
-        results.sort(key=lambda x: x["score"], reverse=True)
-        top_results = results[:top_k]
+        results = await self.search_many([query], {"industry": industry, "region": region}, top_k)
+        return results[0]
+
+    async def search_many(
+        self,
+        queries: List[str],
+        filters: Optional[Union[Dict[str, Optional[str]], List[Optional[Dict[str, Optional[str]]]]]] = None,
+        top_k: int = 5
+    ) -> List[Tuple[str, List[Dict[str, Any]]]]:
+        """
+        Search for several queries at once (e.g. one per report section)
+
+        All queries are embedded in one request, and queries sharing a filter
+        are scored together with one matrix product over the index, so a
+        batch costs about as much as a single search. Result texts are read
+        in one pass over the text store.
+
+        Args:
+            queries: Search queries
+            filters: industry/region filter dict applied to every query, or a
+                list with one dict (or None) per query
+            top_k: Number of top results to return per query
+
+        Returns:
+            List of (context, sources) tuples, in query order
+        """
+        if filters is None or isinstance(filters, dict):
+            filters = [filters] * len(queries)
+        if len(filters) != len(queries):
+            raise ValueError(f"Expected one filter per query, got {len(filters)} for {len(queries)} queries")
+
+        results = [("", []) for _ in queries]
+        self._sync()
+        self._refresh_metadata()
+        if self._size == 0 or top_k <= 0 or not queries:
+            return results
+
+        # Resolve each distinct filter once; None means unfiltered
+        keys = [((f or {}).get("industry") or None, (f or {}).get("region") or None) for f in filters]
+        candidates = {}
+        for key in set(keys):
+            candidates[key] = (
+                self._candidate_rows(self.metadata_index.lookup(industry=key[0], region=key[1]))
+                if any(key) else None
+            )
+        # Queries whose filter matches nothing get an empty result, not an unfiltered one
+        active = [i for i, key in enumerate(keys) if candidates[key] is None or len(candidates[key])]
+        if not active:
+            return results
+
+        vectors = await self._embed_queries([queries[i] for i in active])
+        if vectors is None:
+            return results
+        if vectors.shape[1] != self._matrix.shape[1]:
+            logger.warning(
+                f"Query embedding dimension {vectors.shape[1]} does not match "
+                f"index dimension {self._matrix.shape[1]}"
+            )
+            return results
+
+        groups: Dict[Tuple[Optional[str], Optional[str]], List[int]] = {}
+        for position, i in enumerate(active):
+            groups.setdefault(keys[i], []).append(position)
+
+        depth = top_k if self.lexical is None else max(top_k, self.fusion_depth)
+        ranked = {}
+        for key, positions in groups.items():
+            group_candidates = candidates[key]
+            if group_candidates is not None:
+                hits = self._filtered_search_many(vectors[positions], depth, group_candidates)
+                mask = np.zeros(self._size, dtype=bool)
+                mask[group_candidates] = True
+            else:
+                # Cosine similarity via the configured index (exact scan or IVF)
+                hits = self.index.search_many(self._matrix, vectors[positions], depth, self._alive)
+                mask = self._alive
+
+            for position, (rows, scores) in zip(positions, hits):
+                i = active[position]
+                dense_scores = dict(zip(rows.tolist(), scores.tolist()))
+                lexical_scores = {}
+                if self.lexical is not None:
+                    lexical_rows, lexical_hits = self.lexical.search(queries[i], depth, mask)
+                    lexical_scores = dict(zip(lexical_rows.tolist(), lexical_hits.tolist()))
+                    rows, scores = reciprocal_rank_fusion([rows, lexical_rows], top_k, self.rrf_k)
+                ranked[i] = (rows.tolist(), scores.tolist(), dense_scores, lexical_scores)
+
+        result_rows = sorted({row for rows, _, _, _ in ranked.values() for row in rows})
+        texts = dict(zip(result_rows, self.storage.read_texts(
+            [(int(self._text_offsets[row]), int(self._text_lengths[row])) for row in result_rows]
+        )))
+        for i, (rows, scores, dense_scores, lexical_scores) in ranked.items():
+            results[i] = self._format_results(rows, scores, dense_scores, lexical_scores, texts)
+        return results
+
+    def _format_results(
+        self,
+        rows: List[int],
+        scores: List[float],
+        dense_scores: Dict[int, float],
+        lexical_scores: Dict[int, float],
+        texts: Dict[int, str]
+    ) -> Tuple[str, List[Dict[str, Any]]]:
+        """Context string and source list for ranked rows"""
+        top_results = []
+        for row, score in zip(rows, scores):
+            doc_id = self._doc_ids[row]
+            top_results.append({
+                "doc_id": doc_id,
+                "chunk_id": int(self._chunk_ids[row]),
+                "text": texts[row],
+                "score": float(score),
+                "dense_score": dense_scores.get(row),
+                "bm25_score": lexical_scores.get(row),
+                "tags": self._tags[row] or {},
+                "metadata": self.document_metadata.get(doc_id, {})
+            })
         
         # Build context string from top results
         context = "\n\n".join([result["text"] for result in top_results])
@@ -124,24 +343,131 @@ class VectorStore:
             source = {
                 "title": result["metadata"].get("title", "Unknown"),
                 "score": result["score"],
+                # Component scores in hybrid mode (None if that ranking did not return the chunk)
+                "dense_score": result["dense_score"],
+                "bm25_score": result["bm25_score"],
                 "industry": result["metadata"].get("industry", "Unknown"),
-                "region": result["metadata"].get("region", "Unknown")
+                "region": result["metadata"].get("region", "Unknown"),
+                # Entities mentioned in the retrieved chunk itself
+                "tags": result["tags"]
             }
             sources.append(source)
         
         return context, sources
     
-    async def add_embeddings(self, embeddings: List[Dict[str, Any]], doc_id: str) -> None:
+    def _candidate_rows(self, doc_ids) -> np.ndarray:
+        """Sorted live rows of the given documents"""
+        rows = [self._rows_by_doc[doc_id] for doc_id in doc_ids if doc_id in self._rows_by_doc]
+        if not rows:
+            return np.empty(0, dtype=np.int64)
+        return np.sort(np.concatenate([np.asarray(r, dtype=np.int64) for r in rows]))
+    
+    def _filtered_search_many(
+        self,
+        query_vectors: np.ndarray,
+        top_k: int,
+        candidates: np.ndarray
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Top-k among candidate rows for each query, pre- or post-filtering by selectivity
+        
+        Args:
+            query_vectors: (q, dim) normalised queries
+            top_k: Number of results
+            candidates: Sorted live rows that pass the filter
+            
+        Returns:
+            List of (row indices, scores), one per query
+        """
+        results: List[Optional[Tuple[np.ndarray, np.ndarray]]] = [None] * len(query_vectors)
+        alive = max(int(np.count_nonzero(self._alive)), 1)
+        selectivity = len(candidates) / alive
+        if selectivity > self.prefilter_selectivity:
+            # Broad filter: over-fetch from the index and keep matching hits
+            fetch = min(alive, int(np.ceil(2 * top_k / selectivity)))
+            hits = self.index.search_many(self._matrix, query_vectors, fetch, self._alive)
+            for j, (rows, scores) in enumerate(hits):
+                keep = np.isin(rows, candidates, assume_unique=True)
+                if np.count_nonzero(keep) >= min(top_k, len(candidates)):
+                    results[j] = (rows[keep][:top_k], scores[keep][:top_k])
+        # Selective filter, or too few matching hits among the fetched ones: score only the candidate rows
+        pending = [j for j, result in enumerate(results) if result is None]
+        if pending:
+            scores = (np.asarray(self._matrix[candidates]) @ query_vectors[pending].T).T
+            for j, query_scores in zip(pending, scores):
+                best = top_k_rows(query_scores, top_k)
+                results[j] = (candidates[best], query_scores[best])
+        return results
+    
+    async def add_embeddings(self, embeddings: List[Dict[str, Any]], doc_id: str, replace: bool = True) -> None:
         """
         Add embeddings to the vector store
         
         Args:
-            embeddings: List of embedding dictionaries
+            embeddings: List of embedding dictionaries (chunk_id, full chunk text,
+                embedding, optional entity tags)
             doc_id: Document ID
+            replace: Drop the document's existing rows first; False appends
+                another batch of a document that is still streaming in
         """
-        embeddings_path = os.path.join(self.embeddings_dir, f"{doc_id}_embeddings.json")
-        with open(embeddings_path, "w", encoding="utf-8") as f:
-            json.dump(embeddings, f, ensure_ascii=False, indent=2)
+        self._sync()
+        # Replace any previous rows for this document
+        if replace and doc_id in self._rows_by_doc:
+            self.storage.delete(doc_id)
+        self.storage.append(
+            doc_id,
+            [item["chunk_id"] for item in embeddings],
+            np.asarray([item["embedding"] for item in embeddings], dtype=np.float32),
+            [item["text"] for item in embeddings],
+            [item.get("tags") for item in embeddings]
+        )
+        self._sync()
+        self.index.sync(self._matrix)
+        self.index.save()
+        if self.lexical is not None:
+            self.lexical.save()
+    
+    async def delete_chunks(self, doc_id: str, chunk_ids: List[int]) -> None:
+        """
+        Tombstone individual chunks of a document (incremental re-ingestion)
+        
+        Args:
+            doc_id: Document ID
+            chunk_ids: Chunk IDs to remove
+        """
+        if not chunk_ids:
+            return
+        self._sync()
+        self.storage.delete(doc_id, chunk_ids)
+        self._sync()
+    
+    async def chunk_ids(self, doc_id: str) -> List[int]:
+        """
+        Chunk IDs of a document's live rows
+        
+        Args:
+            doc_id: Document ID
+            
+        Returns:
+            Sorted chunk IDs
+        """
+        self._sync()
+        return sorted(self._chunk_ids[self._rows_by_doc.get(doc_id, [])].tolist())
+    
+    async def set_document_metadata(self, doc_id: str, metadata: Dict[str, Any]) -> None:
+        """
+        Record a document's metadata and make it visible to filters
+        
+        DocumentProcessor writes to the same store first, in which case
+        nothing is written again.
+        
+        Args:
+            doc_id: Document ID
+            metadata: Document metadata
+        """
+        if self.metadata_store.get(doc_id) != metadata:
+            self.metadata_store.upsert(doc_id, metadata)
+        self._refresh_metadata()
     
     async def delete_document(self, doc_id: str) -> None:
         """
@@ -150,7 +476,13 @@ class VectorStore:
         Args:
             doc_id: Document ID
         """
-        # Delete embeddings
+        # Tombstone in the embedding store and the resident index
+        self._sync()
+        if doc_id in self._rows_by_doc:
+            self.storage.delete(doc_id)
+            self._sync()
+
+        # Delete legacy JSON embeddings
         embeddings_path = os.path.join(self.embeddings_dir, f"{doc_id}_embeddings.json")
         if os.path.exists(embeddings_path):
             os.remove(embeddings_path)
@@ -161,9 +493,6 @@ class VectorStore:
             os.remove(chunks_path)
         
         # Update metadata
-        if doc_id in self.document_metadata:
-            del self.document_metadata[doc_id]
-            
-            # Save updated metadata
-            with open(self.metadata_file, "w", encoding="utf-8") as f:
-                json.dump(self.document_metadata, f, ensure_ascii=False, indent=2)
\ No newline at end of file
+        if self.metadata_store.get(doc_id) is not None:
+            self.metadata_store.delete(doc_id)
+        self._refresh_metadata()
@@ -0,0 +1,198 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+from backend.models.embedding_cache import normalize_text
+
+logger = logging.getLogger(__name__)
+
+# Bump when the generated output changes for the same inputs (prompts, layout)
+CACHE_VERSION = 1
+
+# "Format" of the file holding the finished sections of a report still being generated
+PARTIAL_SECTIONS = "sections.jsonl"
+
+def report_key(
+    messages: Sequence[Dict[str, str]],
+    report_type: str,
+    title: str,
+    industry: Optional[str],
+    region: Optional[str],
+    language: str,
+    include_charts: bool,
+    formats: Sequence[str],
+    template: str = ""
+) -> str:
+    """
+    Report ID derived from the report's inputs
+
+    Messages are normalised like cache keys elsewhere (NFKC, collapsed
+    whitespace), so requests differing only in formatting share a report.
+    template is the digest of the report type's template, so editing a
+    template does not serve reports built from the old one.
+    """
+    payload = json.dumps({
+        "version": CACHE_VERSION,
+        "messages": [[m.get("role", ""), normalize_text(m.get("content") or "")] for m in messages],
+        "report_type": report_type,
+        "title": title,
+        "industry": industry,
+        "region": region,
+        "language": language,
+        "include_charts": include_charts,
+        "formats": sorted(formats),
+        "template": template
+    }, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+def file_etag(path: str) -> str:
+    """Strong ETag: hash of the file's bytes"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(1024 * 1024):
+            digest.update(block)
+    return f'"{digest.hexdigest()[:32]}"'
+
+class ReportArtifactCache:
+    """
+    Index of generated report files, with LRU eviction (SQLite)
+
+    Report files live under <root>/<id[:2]>/<id>.<format>; the index records
+    each report's files with their size and ETag and when it was last
+    served. When the total size or the number of reports is over its limit,
+    the least recently used reports are deleted from disk. Only reports
+    flagged complete (every section generated) count as cache hits.
+    """
+
+    def __init__(
+        self,
+        root: str = "./data/reports/objects",
+        max_bytes: Optional[int] = None,
+        max_entries: Optional[int] = None
+    ):
+        self.root = root
+        self.max_bytes = max_bytes or int(float(os.getenv("REPORT_CACHE_MAX_MB", 2048)) * 1024 * 1024)
+        self.max_entries = max_entries or int(os.getenv("REPORT_CACHE_MAX_ENTRIES", 10000))
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(root, "index.sqlite"), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS reports ("
+            "id TEXT PRIMARY KEY, files TEXT NOT NULL, size INTEGER NOT NULL, "
+            "complete INTEGER NOT NULL, created REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_reports_last_access ON reports(last_access)")
+        self._conn.commit()
+
+    def directory(self, report_id: str) -> str:
+        """Directory holding a report's files (created on demand)"""
+        path = os.path.join(self.root, report_id[:2])
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def path(self, report_id: str, fmt: str) -> str:
+        return os.path.join(self.root, report_id[:2], f"{report_id}.{fmt}")
+
+    def get(self, report_id: str, complete_only: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Index entry of a report, marking it as used
+
+        Args:
+            report_id: Report ID
+            complete_only: Ignore reports with failed sections (for cache hits)
+
+        Returns:
+            {"id", "files": {format: {"path", "etag", "size"}}, "complete"}, or
+            None if unknown or its files are gone
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT files, complete FROM reports WHERE id = ?", (report_id,)
+            ).fetchone()
+            if row is None or (complete_only and not row[1]):
+                return None
+            files = json.loads(row[0])
+            if not all(os.path.exists(self.path(report_id, fmt)) for fmt in files):
+                self._conn.execute("DELETE FROM reports WHERE id = ?", (report_id,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE reports SET last_access = ? WHERE id = ?", (time.time(), report_id))
+            self._conn.commit()
+        for fmt, info in files.items():
+            info["path"] = self.path(report_id, fmt)
+        return {"id": report_id, "files": files, "complete": bool(row[1])}
+
+    def put(self, report_id: str, formats: List[str], complete: bool = True) -> Dict[str, Any]:
+        """
+        Index a report's files (already written under path()) and evict if over the limits
+
+        Args:
+            report_id: Report ID
+            formats: Formats written, e.g. ["json", "docx"]
+            complete: Whether every section was generated
+
+        Returns:
+            Index entry, as from get()
+        """
+        files = {}
+        for fmt in formats:
+            path = self.path(report_id, fmt)
+            files[fmt] = {"etag": file_etag(path), "size": os.path.getsize(path)}
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO reports (id, files, size, complete, created, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (report_id, json.dumps(files), sum(f["size"] for f in files.values()), int(complete), now, now)
+            )
+            self._conn.commit()
+            self._evict(keep=report_id)
+        for fmt, info in files.items():
+            info["path"] = self.path(report_id, fmt)
+        return {"id": report_id, "files": files, "complete": complete}
+
+    def _evict(self, keep: str) -> None:
+        """Delete least recently used reports until under both limits (caller holds the lock)"""
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM reports").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        evicted = []
+        for report_id, files, size in self._conn.execute(
+            "SELECT id, files, size FROM reports WHERE id != ? ORDER BY last_access", (keep,)
+        ).fetchall():
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            self._delete_files(report_id, json.loads(files))
+            evicted.append((report_id,))
+            count -= 1
+            total -= size
+        self._conn.executemany("DELETE FROM reports WHERE id = ?", evicted)
+        self._conn.commit()
+        logger.info(f"报告缓存淘汰 {len(evicted)} 份（剩余 {count} 份，{total / 1024 / 1024:.1f}MB）")
+
+    def remove(self, report_id: str) -> None:
+        """Delete a report and its files"""
+        with self._lock:
+            row = self._conn.execute("SELECT files FROM reports WHERE id = ?", (report_id,)).fetchone()
+            self._conn.execute("DELETE FROM reports WHERE id = ?", (report_id,))
+            self._conn.commit()
+        self._delete_files(report_id, json.loads(row[0]) if row else [])
+
+    def _delete_files(self, report_id: str, formats: List[str]) -> None:
+        """Delete a report's files, and the sections kept from an unfinished run of it"""
+        for fmt in list(formats) + [PARTIAL_SECTIONS]:
+            try:
+                os.remove(self.path(report_id, fmt))
+            except FileNotFoundError:
+                pass
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,249 @@
+"""
+Batch report generation over a (region, industry, report_type) matrix
+
+A batch is described by a manifest file (data/reports/batches/<id>.json)
+that records every job and its status and is rewritten atomically after
+each change, so an interrupted batch resumes where it stopped: finished
+jobs are skipped and a job cut off mid-report, or whose report has
+failed sections, reuses the sections it had already written, unless its
+template changed in the meantime.
+
+Usage:
+    python -m backend.reports.batch_reports --province 浙江 --industries 新能源 --types comprehensive
+    python -m backend.reports.batch_reports --resume <batch_id>
+"""
+import os
+import sys
+import json
+import uuid
+import asyncio
+import logging
+import argparse
+import itertools
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from backend.reports.report_generator import PROVINCE_MAP
+
+logger = logging.getLogger(__name__)
+
+def expand_regions(regions: List[str], province: Optional[str] = None) -> List[str]:
+    """Regions plus every city of a province in PROVINCE_MAP"""
+    regions = list(regions)
+    if province:
+        regions += [city for city, p in PROVINCE_MAP.items() if p == province and city not in regions]
+    return regions
+
+class BatchReportRunner:
+    """
+    Runs report batches with one ReportGenerator
+
+    Jobs share the generator's section skeletons, chart data and LLM
+    budget (REPORT_SECTION_CONCURRENCY / REPORT_LLM_RPM across all jobs);
+    the section retrievals of every job are fetched up front in one
+    batched search, with queries shared between jobs wherever they match.
+    """
+
+    def __init__(self, report_generator, batches_dir: Optional[str] = None, concurrency: Optional[int] = None):
+        self.report_generator = report_generator
+        self.batches_dir = batches_dir or os.path.join(report_generator.reports_dir, "batches")
+        os.makedirs(self.batches_dir, exist_ok=True)
+        # Reports in progress at once; LLM calls are bounded separately
+        self.concurrency = concurrency or int(os.getenv("REPORT_BATCH_CONCURRENCY", 4))
+
+    def _path(self, batch_id: str) -> str:
+        return os.path.join(self.batches_dir, f"{batch_id}.json")
+
+    def _save(self, manifest: Dict[str, Any]) -> None:
+        manifest["updated"] = datetime.now().isoformat()
+        path = self._path(manifest["id"])
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(path + ".tmp", path)
+
+    def create(
+        self,
+        regions: List[Optional[str]],
+        industries: List[Optional[str]],
+        report_types: List[str],
+        language: str = "zh",
+        include_charts: bool = True
+    ) -> Dict[str, Any]:
+        """
+        Create the manifest of a batch
+
+        Args:
+            regions: Region names (an empty list means no region)
+            industries: Industry names (an empty list means no industry)
+            report_types: Report types
+            language: Report language
+            include_charts: Whether to include charts
+
+        Returns:
+            Batch manifest, one pending job per (region, industry, report_type)
+        """
+        now = datetime.now().isoformat()
+        manifest = {
+            "id": str(uuid.uuid4()),
+            "status": "pending",
+            "language": language,
+            "include_charts": include_charts,
+            "created": now,
+            "updated": now,
+            "jobs": [
+                {
+                    "region": region,
+                    "industry": industry,
+                    "report_type": report_type,
+                    "status": "pending",
+                    "report_id": None,
+                    "download_url": None,
+                    "error": None
+                }
+                for region, industry, report_type in itertools.product(regions or [None], industries or [None], report_types)
+            ]
+        }
+        self._save(manifest)
+        return manifest
+
+    def load(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        """Manifest of a batch, or None"""
+        try:
+            with open(self._path(batch_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    async def run(self, batch_id: str) -> Dict[str, Any]:
+        """
+        Run (or resume) every unfinished job of a batch
+
+        Args:
+            batch_id: Batch ID
+
+        Returns:
+            Final manifest; status is "done", or "partial" if any job failed
+        """
+        manifest = self.load(batch_id)
+        if manifest is None:
+            raise ValueError(f"Batch not found: {batch_id}")
+        generator = self.report_generator
+        # A job is finished only once its report is complete: reports with failed
+        # sections are generated again, reusing the sections that did succeed
+        jobs = [
+            job for job in manifest["jobs"]
+            if job["status"] != "done" or generator.artifact_cache.get(job["report_id"], complete_only=True) is None
+        ]
+
+        # IDs are recorded before any work so that a restart finds the partial sections;
+        # they are the content-addressed IDs, so reports already generated are reused.
+        # They are recomputed on resume: a template edited in between gives a new ID,
+        # and the sections written from the old template are discarded
+        for job in jobs:
+            report_id = generator.report_key(
+                [], job["report_type"], "", job["industry"], job["region"], manifest["include_charts"], manifest["language"]
+            )
+            if job["report_id"] and job["report_id"] != report_id:
+                logger.warning(
+                    f"批量报告 {batch_id}：{job['report_type']} 模板已变更，"
+                    f"({job['region']}, {job['industry']}) 丢弃旧报告 {job['report_id']} 的已生成章节，重新生成"
+                )
+                generator.discard_partial(job["report_id"])
+            job["report_id"] = report_id
+            if generator.artifact_cache.get(job["report_id"], complete_only=True) is not None:
+                # Finished before the manifest recorded it, or by another request
+                job.update(status="done", download_url=f"/api/download/report/{job['report_id']}", error=None)
+        jobs = [job for job in jobs if job["status"] != "done"]
+        manifest["status"] = "running"
+        self._save(manifest)
+        logger.info(f"批量报告 {batch_id}：待生成 {len(jobs)} / {len(manifest['jobs'])} 份")
+
+        contexts = await generator.prefetch_contexts(
+            [(job["report_type"], job["industry"], job["region"]) for job in jobs], manifest["language"]
+        )
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run_job(job: Dict[str, Any]) -> None:
+            async with semaphore:
+                job.update(status="running", error=None)
+                self._save(manifest)
+                try:
+                    _, download_url = await generator.generate_report(
+                        None,
+                        job["report_type"],
+                        title="",
+                        industry=job["industry"],
+                        region=job["region"],
+                        include_charts=manifest["include_charts"],
+                        language=manifest["language"],
+                        report_id=job["report_id"],
+                        contexts=contexts
+                    )
+                    entry = generator.artifact_cache.get(job["report_id"])
+                    if entry is not None and entry["complete"]:
+                        job.update(status="done", download_url=download_url)
+                    else:
+                        # Served as is, but retried when the batch is resumed
+                        logger.warning(f"批量报告 {batch_id} 部分章节生成失败 ({job['region']}, {job['industry']}, {job['report_type']})")
+                        job.update(status="failed", download_url=download_url, error="部分章节或文档生成失败")
+                except Exception as e:
+                    logger.error(f"批量报告 {batch_id} 生成失败 ({job['region']}, {job['industry']}, {job['report_type']}): {e}")
+                    job.update(status="failed", error=str(e))
+                self._save(manifest)
+
+        await asyncio.gather(*(run_job(job) for job in jobs))
+        manifest["status"] = "done" if all(job["status"] == "done" for job in manifest["jobs"]) else "partial"
+        self._save(manifest)
+        return manifest
+
+async def run_batch(args) -> Dict[str, Any]:
+    """CLI entry: build the services, then create or resume a batch"""
+    from backend.models.openai_handler import OpenAIHandler
+    from backend.rag.vector_store import VectorStore
+    from backend.rag.pg_vector_store import PgVectorStore
+    from backend.reports.report_generator import ReportGenerator
+
+    openai_handler = OpenAIHandler()
+    await openai_handler.start()
+    if os.getenv("VECTOR_STORE", "file").lower() == "pgvector":
+        vector_store = PgVectorStore(openai_handler)
+        await vector_store.connect()
+    else:
+        vector_store = VectorStore(openai_handler)
+    report_generator = ReportGenerator(openai_handler, vector_store)
+    await report_generator.renderer.start()
+    await report_generator.templates.start()
+    runner = BatchReportRunner(report_generator)
+    try:
+        if args.resume:
+            batch_id = args.resume
+        else:
+            regions = expand_regions(args.regions, args.province)
+            batch_id = runner.create(regions, args.industries, args.types, args.language, not args.no_charts)["id"]
+            print(f"batch {batch_id}")
+        return await runner.run(batch_id)
+    finally:
+        await report_generator.renderer.close()
+        await report_generator.templates.close()
+        if isinstance(vector_store, PgVectorStore):
+            await vector_store.close()
+        await openai_handler.close()
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Generate reports for every (region, industry, report type) combination")
+    parser.add_argument("--regions", nargs="*", default=[])
+    parser.add_argument("--province", default=None, help="add every city of this province in PROVINCE_MAP")
+    parser.add_argument("--industries", nargs="*", default=[])
+    parser.add_argument("--types", nargs="+", default=["comprehensive"])
+    parser.add_argument("--language", default="zh")
+    parser.add_argument("--no-charts", action="store_true")
+    parser.add_argument("--resume", default=None, metavar="BATCH_ID", help="resume an interrupted batch")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    manifest = asyncio.run(run_batch(args))
+    for job in manifest["jobs"]:
+        print(f"{job['status']:<8} {job['region'] or '-'} {job['industry'] or '-'} {job['report_type']} {job['report_id']} {job['error'] or ''}")
+    return 0 if manifest["status"] == "done" else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
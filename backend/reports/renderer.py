@@ -0,0 +1,378 @@
+import io
+import os
+import shutil
+import asyncio
+import logging
+import warnings
+import subprocess
+import multiprocessing
+import concurrent.futures
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Set
+
+logger = logging.getLogger(__name__)
+
+# Output formats; PDF is converted from the DOCX by LibreOffice
+RENDER_FORMATS = ("docx", "pdf")
+# Fonts tried, in order, for the Chinese text in charts
+CJK_FONTS = ["Noto Sans CJK SC", "Source Han Sans SC", "WenQuanYi Zen Hei", "SimHei", "Microsoft YaHei", "PingFang SC"]
+# Section type -> chart type placed under that section
+SECTION_CHARTS = {"assessment": "radar", "forecast": "trend", "comparison": "heatmap"}
+
+# ---------------------------------------------------------------------------
+# Worker-side functions. They run inside pool processes, so they must be
+# module-level (picklable) and must not touch the event loop.
+# ---------------------------------------------------------------------------
+
+# Compiled DOCX skeletons of this worker, by language
+_skeletons: Dict[str, bytes] = {}
+_templates_dir = "./data/templates"
+
+def _warm_up(templates_dir: str = "./data/templates") -> int:
+    """Pool initializer: import docx/matplotlib, pick the chart font and compile the skeletons"""
+    global _templates_dir
+    _templates_dir = templates_dir
+    import docx  # noqa: F401
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    from matplotlib import font_manager
+
+    installed = {font.name for font in font_manager.fontManager.ttflist}
+    fonts = [name for name in CJK_FONTS if name in installed]
+    plt.rcParams["font.sans-serif"] = fonts + list(plt.rcParams["font.sans-serif"])
+    plt.rcParams["axes.unicode_minus"] = False
+    # Without a CJK font the labels render as boxes; do not warn per glyph
+    warnings.filterwarnings("ignore", message="Glyph .* missing from")
+    for language in ("zh", "en"):
+        _skeleton(language)
+    return os.getpid()
+
+def _compile_skeleton(language: str) -> bytes:
+    """
+    Styled empty document: fonts, heading styles, margins
+
+    A customised template at <templates_dir>/report_<language>.docx is used
+    as is; otherwise the styling is applied to python-docx's default template.
+    """
+    import docx
+    from docx.oxml.ns import qn
+    from docx.shared import Cm, Pt, RGBColor
+
+    custom = os.path.join(_templates_dir, f"report_{language}.docx")
+    if os.path.exists(custom):
+        with open(custom, "rb") as f:
+            return f.read()
+
+    document = docx.Document()
+    latin, east_asian = ("Calibri", "微软雅黑") if language == "en" else ("Times New Roman", "宋体")
+    for name, size, bold, color in [
+        ("Normal", 10.5, False, None),
+        ("Title", 22, True, (0x1F, 0x3A, 0x5F)),
+        ("Heading 1", 16, True, (0x1F, 0x3A, 0x5F)),
+        ("Heading 2", 13, True, (0x2E, 0x54, 0x8A)),
+        ("Caption", 9, False, (0x59, 0x59, 0x59))
+    ]:
+        style = document.styles[name]
+        style.font.name = latin
+        style.font.size = Pt(size)
+        style.font.bold = bold
+        if color is not None:
+            style.font.color.rgb = RGBColor(*color)
+        style.element.get_or_add_rPr().get_or_add_rFonts().set(qn("w:eastAsia"), east_asian)
+    document.styles["Normal"].paragraph_format.line_spacing = 1.5
+    document.styles["Normal"].paragraph_format.space_after = Pt(6)
+    for section in document.sections:
+        section.page_height, section.page_width = Cm(29.7), Cm(21.0)
+        section.top_margin = section.bottom_margin = Cm(2.54)
+        section.left_margin = section.right_margin = Cm(3.18)
+
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+def _skeleton(language: str) -> bytes:
+    if language not in _skeletons:
+        _skeletons[language] = _compile_skeleton(language)
+    return _skeletons[language]
+
+def _render_chart(chart: Dict[str, Any], path: str) -> str:
+    """Render one chart dict (radar/trend/heatmap) to a PNG file"""
+    import numpy as np
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    data = chart.get("data") or []
+    if chart.get("type") == "radar":
+        figure = plt.figure(figsize=(6, 6), dpi=150)
+        axes = figure.add_subplot(polar=True)
+        angles = np.linspace(0, 2 * np.pi, len(data), endpoint=False).tolist()
+        values = [item["value"] for item in data]
+        axes.plot(angles + angles[:1], values + values[:1], color="#2E548A", linewidth=2)
+        axes.fill(angles + angles[:1], values + values[:1], color="#2E548A", alpha=0.25)
+        axes.set_xticks(angles)
+        axes.set_xticklabels([item["subject"] for item in data])
+        axes.set_ylim(0, max([item.get("fullMark", 100) for item in data] or [100]))
+    elif chart.get("type") == "trend":
+        figure, axes = plt.subplots(figsize=(8, 4.5), dpi=150)
+        names = [item["name"] for item in data]
+        actual = [item.get("actual") for item in data]
+        forecast = [item.get("forecast") for item in data]
+        # The forecast line starts at the last actual point
+        last = max((i for i, value in enumerate(actual) if value is not None), default=None)
+        if last is not None:
+            forecast[last] = actual[last]
+        axes.plot(names, [np.nan if v is None else v for v in actual], marker="o", color="#2E548A", label="实际")
+        axes.plot(names, [np.nan if v is None else v for v in forecast], marker="o", linestyle="--", color="#C0504D", label="预测")
+        axes.legend()
+        axes.grid(alpha=0.3)
+    else:
+        ranked = sorted(data, key=lambda item: item["value"])
+        figure, axes = plt.subplots(figsize=(8, max(3, 0.35 * len(ranked))), dpi=150)
+        values = [item["value"] for item in ranked]
+        axes.barh([item["name"] for item in ranked], values, color=plt.cm.YlOrRd(np.asarray(values) / 100))
+        axes.set_xlim(0, 100)
+    axes.set_title(chart.get("title", ""))
+    figure.tight_layout()
+    figure.savefig(path, format="png")
+    plt.close(figure)
+    return path
+
+def _add_content(document, text: str) -> None:
+    """Section text as paragraphs; markdown-style list lines become list paragraphs"""
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith(("- ", "* ", "• ")):
+            document.add_paragraph(line[2:].strip(), style="List Bullet")
+        elif line[:1].isdigit() and line.split(" ", 1)[0].rstrip(".、)").isdigit() and " " in line:
+            document.add_paragraph(line.split(" ", 1)[1].strip(), style="List Number")
+        elif line.startswith("#"):
+            document.add_heading(line.lstrip("#").strip(), level=2)
+        else:
+            document.add_paragraph(line.replace("**", ""))
+
+def _render_docx(report: Dict[str, Any], chart_paths: List[Optional[str]], language: str, path: str) -> int:
+    """
+    Write the report as a Word document
+
+    Args:
+        report: Report data (as in the report JSON)
+        chart_paths: PNG file of each chart in report["charts"] (None if it failed)
+        language: Skeleton language
+        path: Output file; written to a temporary file first, then renamed
+
+    Returns:
+        Size of the written file in bytes
+    """
+    import docx
+    from docx.shared import Cm
+
+    document = docx.Document(io.BytesIO(_skeleton(language)))
+    document.add_paragraph(report["structure"]["title"], style="Title")
+    meta = " | ".join(value for value in (report.get("region"), report.get("industry"), report.get("date", "")[:10]) if value)
+    if meta:
+        document.add_paragraph(meta, style="Caption")
+
+    charts = [(chart, chart_path) for chart, chart_path in zip(report.get("charts") or [], chart_paths) if chart_path]
+    def place(chart_type: Optional[str]) -> None:
+        for i, (chart, chart_path) in enumerate(charts):
+            if chart_type is None or chart.get("type") == chart_type:
+                document.add_picture(chart_path, width=Cm(14))
+                document.add_paragraph(chart.get("title", ""), style="Caption")
+                charts.pop(i)
+                return
+
+    for section in report["structure"]["sections"]:
+        document.add_heading(section["title"], level=1)
+        _add_content(document, section.get("content") or "")
+        if section.get("includes_chart"):
+            place(SECTION_CHARTS.get(section.get("type")))
+    # Charts no section claimed go at the end
+    while charts:
+        place(None)
+
+    document.save(path + ".tmp")
+    os.replace(path + ".tmp", path)
+    return os.path.getsize(path)
+
+def _convert_pdf(docx_path: str, timeout: float) -> str:
+    """Convert a DOCX to PDF next to it with headless LibreOffice"""
+    office = shutil.which("soffice") or shutil.which("libreoffice")
+    if office is None:
+        raise RuntimeError("PDF output needs LibreOffice (soffice) on PATH")
+    out_dir = os.path.dirname(os.path.abspath(docx_path))
+    # A private profile per worker: concurrent soffice runs cannot share one
+    profile = f"file:///tmp/report_render_lo_{os.getpid()}"
+    subprocess.run(
+        [office, f"-env:UserInstallation={profile}", "--headless", "--convert-to", "pdf", "--outdir", out_dir, docx_path],
+        check=True, capture_output=True, timeout=timeout
+    )
+    return os.path.splitext(docx_path)[0] + ".pdf"
+
+# ---------------------------------------------------------------------------
+
+class ReportRenderer:
+    """
+    DOCX/PDF rendering of finished reports in a pre-warmed process pool
+
+    Rendering is CPU-bound, so none of it runs on the event loop. Each
+    worker compiles the styled DOCX skeletons once at start-up and loads
+    every report from the in-memory skeleton; the charts of a report are
+    rendered in parallel, one pool task each, and files are written to disk
+    by the workers, never passed back through the pool.
+
+    Every pool task (a chart, the DOCX, the PDF conversion) has its own
+    timeout. A task over it retires its pool: new work goes to a fresh pool,
+    the other reports' tasks already in the old one finish, and then its
+    processes are terminated.
+    """
+
+    def __init__(
+        self,
+        output_dir: str = "./data/reports",
+        templates_dir: str = "./data/templates",
+        max_workers: Optional[int] = None,
+        timeout: Optional[float] = None
+    ):
+        self.output_dir = output_dir
+        self.templates_dir = os.path.abspath(templates_dir)
+        self.max_workers = max_workers or int(os.getenv("REPORT_RENDER_WORKERS", 0)) or (os.cpu_count() or 1)
+        self.timeout = timeout or float(os.getenv("REPORT_RENDER_TIMEOUT", 120))
+        # soffice is killed before its pool task times out, so a slow
+        # conversion fails that report alone instead of retiring the pool
+        self.pdf_timeout = self.timeout * 0.8
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._start_lock = asyncio.Lock()
+        # Unfinished tasks per pool, and retired pools still draining
+        self._tasks: Dict[ProcessPoolExecutor, Set[concurrent.futures.Future]] = {}
+        self._retired: Dict[ProcessPoolExecutor, asyncio.Task] = {}
+
+    def _create_pool(self) -> ProcessPoolExecutor:
+        # spawn: forking a process that already runs threads (to_thread, SQLite) is unsafe
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_warm_up,
+            initargs=(self.templates_dir,)
+        )
+
+    async def start(self) -> None:
+        """Create the pool and bring every worker up with its skeletons compiled"""
+        async with self._start_lock:
+            if self._pool is not None:
+                return
+            self._pool = self._create_pool()
+            loop = asyncio.get_running_loop()
+            pids = await asyncio.gather(*[
+                loop.run_in_executor(self._pool, _warm_up, self.templates_dir) for _ in range(self.max_workers)
+            ])
+            logger.info(f"Report render pool ready: {len(set(pids))} worker processes")
+
+    def _retire(self, pool: ProcessPoolExecutor, stuck: concurrent.futures.Future) -> None:
+        """Stop sending work to a pool with a stuck task and terminate it once its other tasks are done"""
+        if self._pool is pool:
+            self._pool = None
+        if pool in self._retired:
+            return
+        pool.shutdown(wait=False)
+        self._retired[pool] = asyncio.create_task(self._reap(pool, stuck))
+
+    async def _reap(self, pool: ProcessPoolExecutor, stuck: concurrent.futures.Future) -> None:
+        # Copied first: done callbacks remove tasks from the executor's thread
+        others = [future for future in list(self._tasks.get(pool, ())) if future is not stuck]
+        # Each of them is bounded by its own timeout
+        if others:
+            await asyncio.to_thread(concurrent.futures.wait, others, self.timeout)
+        self._terminate(pool)
+        self._retired.pop(pool, None)
+        logger.info("Retired report render pool terminated")
+
+    def _terminate(self, pool: ProcessPoolExecutor) -> None:
+        for process in list((getattr(pool, "_processes", None) or {}).values()):
+            process.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
+        self._tasks.pop(pool, None)
+
+    async def close(self) -> None:
+        for pool, reaper in list(self._retired.items()):
+            reaper.cancel()
+            self._terminate(pool)
+        self._retired.clear()
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            await asyncio.to_thread(pool.shutdown, True, cancel_futures=True)
+            self._tasks.pop(pool, None)
+
+    async def _run(self, func, *args):
+        """Run func(*args) in the pool, within the timeout; a task over it retires the pool"""
+        if self._pool is None:
+            await self.start()
+        pool = self._pool
+        future = pool.submit(func, *args)
+        tasks = self._tasks.setdefault(pool, set())
+        tasks.add(future)
+        future.add_done_callback(tasks.discard)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            if not future.done():
+                self._retire(pool, future)
+            raise TimeoutError(f"{func.__name__} timed out after {self.timeout}s")
+
+    async def render(
+        self,
+        report: Dict[str, Any],
+        formats: Sequence[str] = ("docx",),
+        language: str = "zh",
+        output_dir: Optional[str] = None
+    ) -> Dict[str, str]:
+        """
+        Render a report to files
+
+        Args:
+            report: Report data (as in the report JSON)
+            formats: Output formats ("docx", "pdf")
+            language: Report language, selects the skeleton
+            output_dir: Directory for the files (default: the renderer's output_dir)
+
+        Returns:
+            Dict of {format: file path}
+        """
+        unknown = set(formats) - set(RENDER_FORMATS)
+        if unknown:
+            raise ValueError(f"Unsupported report formats: {sorted(unknown)}")
+        if not formats:
+            return {}
+        report_id = report["id"]
+        # Absolute: workers need not share the caller's working directory
+        output_dir = os.path.abspath(output_dir or self.output_dir)
+        # Scratch files: chart PNGs, and the DOCX a PDF-only render converts from
+        work_dir = os.path.join(output_dir, f"{report_id}_render")
+        os.makedirs(work_dir, exist_ok=True)
+        charts = report.get("charts") or []
+
+        async def chart(i: int, data: Dict[str, Any]) -> Optional[str]:
+            try:
+                return await self._run(_render_chart, data, os.path.join(work_dir, f"chart_{i}.png"))
+            except Exception as e:
+                logger.warning(f"报告 {report_id} 图表渲染失败 ({data.get('type')}): {e}")
+                return None
+
+        try:
+            chart_paths = await asyncio.gather(*(chart(i, data) for i, data in enumerate(charts)))
+            docx_path = os.path.join(output_dir if "docx" in formats else work_dir, f"{report_id}.docx")
+            await self._run(_render_docx, report, chart_paths, language, docx_path)
+            paths = {}
+            if "docx" in formats:
+                paths["docx"] = docx_path
+            if "pdf" in formats:
+                pdf_path = await self._run(_convert_pdf, docx_path, self.pdf_timeout)
+                paths["pdf"] = os.path.join(output_dir, os.path.basename(pdf_path))
+                if pdf_path != paths["pdf"]:
+                    os.replace(pdf_path, paths["pdf"])
+            return paths
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
@@ -1,18 +1,47 @@
 import os
+import copy
 import json
 import asyncio
+import logging
 import uuid
 from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime
 import base64
 
+from backend.reports.section_generator import SectionGenerator
+from backend.reports.renderer import ReportRenderer
+from backend.reports.artifact_cache import PARTIAL_SECTIONS, ReportArtifactCache, report_key
+from backend.reports.template_registry import TemplateRegistry
+
+logger = logging.getLogger(__name__)
+
+# City -> province, for regional comparison charts and province-wide batches
+PROVINCE_MAP = {
+    "杭州": "浙江",
+    "宁波": "浙江",
+    "温州": "浙江",
+    "苏州": "江苏",
+    "南京": "江苏",
+    "无锡": "江苏",
+    "广州": "广东",
+    "深圳": "广东",
+    "东莞": "广东",
+    "成都": "四川",
+    "重庆": "重庆",
+    "武汉": "湖北",
+    "西安": "陕西"
+}
+
 # For a real implementation, you would use:
 # - python-docx for Word document generation
 # - matplotlib or other libraries for chart generation
 # - document template engines
 
 class ReportGenerator:
-    def __init__(self):
+    def __init__(self, openai_handler=None, vector_store=None):
+        # Section content comes from the LLM; without a handler only the skeleton is written
+        self.section_generator = SectionGenerator(openai_handler, vector_store) if openai_handler else None
+
         # Setup directories
         self.reports_dir = "./data/reports"
         self.templates_dir = "./data/templates"
@@ -21,14 +50,22 @@ class ReportGenerator:
         for directory in [self.reports_dir, self.templates_dir]:
             os.makedirs(directory, exist_ok=True)
         
-        # Report types
-        self.report_types = {
-            "comprehensive": "综合评估报告",
-            "executive": "决策者摘要",
-            "trend": "趋势预测报告",
-            "policy": "政策建议报告",
-            "comparison": "对标分析报告"
-        }
+        # Word/PDF documents are rendered in a worker process pool (REPORT_FORMATS=docx,pdf)
+        self.renderer = ReportRenderer(self.reports_dir, self.templates_dir)
+        self.render_formats = [fmt.strip() for fmt in os.getenv("REPORT_FORMATS", "docx").split(",") if fmt.strip()]
+        
+        # Finished reports by ID, with LRU eviction; IDs are hashes of the
+        # inputs unless REPORT_CACHE=false
+        self.artifact_cache = ReportArtifactCache(os.path.join(self.reports_dir, "objects"))
+        self.cache_reports = os.getenv("REPORT_CACHE", "true").lower() == "true"
+        self._inflight: Dict[str, asyncio.Task] = {}
+        
+        # Report types and their section skeletons, compiled per language and
+        # reloaded when the template file or the report_templates table changes
+        self.templates = TemplateRegistry()
+        
+        # Charts by (report_type, industry, region); they do not depend on the chat
+        self._chart_cache: Dict[Tuple[str, Optional[str], Optional[str]], List[Dict[str, Any]]] = {}
     
     async def generate_report(
         self,
@@ -38,47 +75,95 @@ class ReportGenerator:
         industry: Optional[str] = None,
         region: Optional[str] = None,
         include_charts: bool = True,
-        language: str = "zh"
+        language: str = "zh",
+        report_id: Optional[str] = None,
+        contexts: Optional[Dict[Tuple[str, Optional[str], Optional[str]], Tuple[str, List[Dict[str, Any]]]]] = None
     ) -> Tuple[str, str]:
         """
         Generate a report based on chat session
         
+        The report ID is a hash of the inputs (see report_key()), so a
+        request identical to an earlier one returns the stored report at
+        once, and identical requests in flight share one generation.
+        
         Args:
-            session: Chat session object
+            session: Chat session object (None for reports not based on a chat, e.g. batches)
             report_type: Type of report to generate
             title: Report title
             industry: Industry name
             region: Region name
             include_charts: Whether to include charts
             language: Report language
+            report_id: ID to generate under; sections an interrupted run
+                already wrote for this ID are reused
+            contexts: Section retrieval results fetched in advance
             
         Returns:
             Tuple of (report_id, download_url)
         """
-        # Generate report ID
-        report_id = str(uuid.uuid4())
-        
-        # Get report type display name
-        report_type_name = self.report_types.get(report_type, "评估报告")
-        
-        # Create full report title
-        if industry and region:
-            full_title = f"{region}{industry}{report_type_name}"
-        elif industry:
-            full_title = f"{industry}{report_type_name}"
-        elif region:
-            full_title = f"{region}产业{report_type_name}"
-        else:
-            full_title = title
-        
         # Extract session messages
         messages = []
-        for msg in session.messages:
+        for msg in (session.messages if session is not None else []):
             messages.append({
                 "role": msg.role,
                 "content": msg.content
             })
         
+        # Generate report ID
+        if report_id is None:
+            if self.cache_reports:
+                report_id = self.report_key(messages, report_type, title, industry, region, include_charts, language)
+            else:
+                report_id = str(uuid.uuid4())
+        download_url = f"/api/download/report/{report_id}"
+        
+        if await asyncio.to_thread(self.artifact_cache.get, report_id, True) is not None:
+            logger.info(f"报告 {report_id} 命中缓存")
+            return report_id, download_url
+        
+        task = self._inflight.get(report_id)
+        if task is None:
+            task = asyncio.create_task(self._generate_report(
+                report_id, messages, report_type, title, industry, region, include_charts, language, contexts
+            ))
+            self._inflight[report_id] = task
+            task.add_done_callback(lambda _: self._inflight.pop(report_id, None))
+        # Shielded: a caller that goes away does not cancel the others' report
+        await asyncio.shield(task)
+        return report_id, download_url
+    
+    def report_key(
+        self,
+        messages: List[Dict[str, str]],
+        report_type: str,
+        title: str,
+        industry: Optional[str],
+        region: Optional[str],
+        include_charts: bool,
+        language: str
+    ) -> str:
+        """Content-addressed report ID for a set of inputs"""
+        return report_key(
+            messages, report_type, title, industry, region, language, include_charts, self.render_formats,
+            self.templates.get(report_type, language).digest
+        )
+    
+    async def _generate_report(
+        self,
+        report_id: str,
+        messages: List[Dict[str, str]],
+        report_type: str,
+        title: str,
+        industry: Optional[str],
+        region: Optional[str],
+        include_charts: bool,
+        language: str,
+        contexts: Optional[Dict[Tuple[str, Optional[str], Optional[str]], Tuple[str, List[Dict[str, Any]]]]]
+    ) -> None:
+        """Generate, render and store a report under report_id"""
+        # Create full report title
+        full_title = self.report_title(report_type, title, industry, region, language)
+        
         # Generate report structure
         report_structure = await self._generate_report_structure(
             report_type=report_type,
@@ -89,21 +174,27 @@ class ReportGenerator:
             language=language
         )
         
-        # Generate report content
-        # In a real implementation, use the LLM to generate detailed content for each section
-        
-        # Generate charts if requested
-        charts = []
+        # Generate section content (and charts alongside it)
+        chart_task = None
         if include_charts:
-            charts = await self._generate_charts(
+            chart_task = asyncio.create_task(self._generate_charts(
                 report_type=report_type,
                 industry=industry,
                 region=region
+            ))
+        if self.section_generator is not None:
+            report_structure["sections"] = await self._generate_sections(
+                report_id=report_id,
+                structure=report_structure,
+                industry=industry,
+                region=region,
+                messages=messages,
+                language=language,
+                contexts=contexts
             )
-        
-        # Create report file
-        # In a real implementation, use proper document generation
-        # For this example, we'll create a JSON file with the report structure
+        else:
+            report_structure["sections"] = [dict(section) for section in report_structure["sections"]]
+        charts = await chart_task if chart_task is not None else []
         
         report_data = {
             "id": report_id,
@@ -116,15 +207,148 @@ class ReportGenerator:
             "charts": charts
         }
         
-        report_path = os.path.join(self.reports_dir, f"{report_id}.json")
-        with open(report_path, "w", encoding="utf-8") as f:
-            json.dump(report_data, f, ensure_ascii=False, indent=2)
+        # Render the documents first; the files go next to the JSON in the report's directory
+        formats = []
+        if self.render_formats:
+            try:
+                files = await self.renderer.render(
+                    report_data, self.render_formats, language, output_dir=self.artifact_cache.directory(report_id)
+                )
+                formats = list(files)
+            except Exception as e:
+                logger.error(f"报告 {report_id} 文档渲染失败: {e}")
         
-        # In a real implementation, generate the actual document
-        # For this example, we'll just return the file path as the download URL
-        download_url = f"/api/download/report/{report_id}"
+        report_path = os.path.join(self.artifact_cache.directory(report_id), f"{report_id}.json")
+        with open(report_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(report_data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(report_path + ".tmp", report_path)
         
-        return report_id, download_url
+        # A report with failed sections (or documents) is served but not
+        # reused; its next request regenerates only what is missing
+        complete = len(formats) == len(self.render_formats) and not any(
+            section.get("error") for section in report_structure["sections"]
+        )
+        if complete and os.path.exists(self._partial_path(report_id)):
+            os.remove(self._partial_path(report_id))
+        await asyncio.to_thread(self.artifact_cache.put, report_id, ["json"] + formats, complete)
+    
+    def report_title(
+        self,
+        report_type: str,
+        title: str,
+        industry: Optional[str],
+        region: Optional[str],
+        language: str = "zh"
+    ) -> str:
+        """Full report title in the report language; the given title is used only without industry and region"""
+        return self.templates.title(report_type, title, industry, region, language)
+    
+    async def prefetch_contexts(
+        self,
+        reports: List[Tuple[str, Optional[str], Optional[str]]],
+        language: str = "zh"
+    ) -> Dict[Tuple[str, Optional[str], Optional[str]], Tuple[str, List[Dict[str, Any]]]]:
+        """
+        Section retrievals of several reports, fetched in one batched search
+        
+        Args:
+            reports: (report_type, industry, region) of each report
+            language: Report language
+            
+        Returns:
+            Retrieval results to pass to generate_report(contexts=...)
+        """
+        if self.section_generator is None:
+            return {}
+        keys = []
+        for report_type, industry, region in reports:
+            title = self.report_title(report_type, "", industry, region, language)
+            structure = await self._generate_report_structure(report_type, title, industry, region, [], language)
+            keys.extend(
+                self.section_generator.context_key(structure["title"], section, industry, region)
+                for section in structure["sections"] if not section.get("summary")
+            )
+        return await self.section_generator.retrieve(keys)
+    
+    def _partial_path(self, report_id: str) -> str:
+        """Sections of a report still being generated, one JSON line per finished section"""
+        return os.path.join(self.artifact_cache.directory(report_id), f"{report_id}.{PARTIAL_SECTIONS}")
+    
+    async def _generate_sections(
+        self,
+        report_id: str,
+        structure: Dict[str, Any],
+        industry: Optional[str],
+        region: Optional[str],
+        messages: List[Dict[str, str]],
+        language: str,
+        contexts: Optional[Dict[Tuple[str, Optional[str], Optional[str]], Tuple[str, List[Dict[str, Any]]]]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Generate section content, appending each section to disk as it finishes
+        
+        Sections already in the partial file (from an interrupted run with the
+        same report ID) are kept if they still match the structure.
+        
+        Args:
+            report_id: Report ID
+            structure: Report structure
+            industry: Industry name
+            region: Region name
+            messages: Chat messages
+            language: Report language
+            contexts: Section retrieval results fetched in advance
+            
+        Returns:
+            Sections with content, in structure order
+        """
+        completed = self._load_partial(report_id, structure)
+        with open(self._partial_path(report_id), "a", encoding="utf-8") as partial:
+            async def on_section(index: int, section: Dict[str, Any]) -> None:
+                partial.write(json.dumps({"index": index, **section}, ensure_ascii=False) + "\n")
+                partial.flush()
+            
+            return await self.section_generator.generate(
+                structure,
+                industry=industry,
+                region=region,
+                messages=messages,
+                language=language,
+                on_section=on_section,
+                completed=completed,
+                contexts=contexts
+            )
+    
+    def discard_partial(self, report_id: str) -> None:
+        """Delete the sections an interrupted run wrote for a report ID that is no longer used"""
+        try:
+            os.remove(self._partial_path(report_id))
+        except FileNotFoundError:
+            pass
+    
+    def _load_partial(self, report_id: str, structure: Dict[str, Any]) -> Dict[int, Dict[str, Any]]:
+        """Successfully generated sections from the partial file, by index"""
+        completed = {}
+        try:
+            with open(self._partial_path(report_id), "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        section = json.loads(line)
+                    except json.JSONDecodeError:
+                        # The last line may be cut off by the interruption
+                        continue
+                    index = section.pop("index", None)
+                    if (
+                        isinstance(index, int) and 0 <= index < len(structure["sections"])
+                        and section.get("title") == structure["sections"][index]["title"]
+                        and section.get("content") and not section.get("error")
+                    ):
+                        completed[index] = section
+        except FileNotFoundError:
+            pass
+        if completed:
+            logger.info(f"报告 {report_id} 续写：复用 {len(completed)} 个已生成章节")
+        return completed
     
     async def _generate_report_structure(
         self,
@@ -149,159 +373,10 @@ class ReportGenerator:
         Returns:
             Report structure dictionary
         """
-        # Basic structure based on report type
-        if report_type == "comprehensive":
-            structure = {
-                "title": title,
-                "sections": [
-                    {"title": "摘要", "type": "text"},
-                    {"title": "1. 引言", "type": "text"},
-                    {"title": "2. 产业发展现状", "type": "text"},
-                    {"title": "3. 潜力评估", "type": "assessment", "includes_chart": True},
-                    {"title": "4. 优势分析", "type": "text"},
-                    {"title": "5. 挑战与不足", "type": "text"},
-                    {"title": "6. 发展趋势预测", "type": "forecast", "includes_chart": True},
-                    {"title": "7. 政策建议", "type": "text"},
-                    {"title": "8. 结论", "type": "text"},
-                    {"title": "附录：评估方法", "type": "text"}
-                ]
-            }
-        
-        elif report_type == "executive":
-            structure = {
-                "title": title,
-                "sections": [
-                    {"title": "决策摘要", "type": "text"},
-                    {"title": "关键发现", "type": "bullet_points"},
-                    {"title": "潜力评分", "type": "assessment", "includes_chart": True},
-                    {"title": "主要优势", "type": "bullet_points"},
-                    {"title": "主要挑战", "type": "bullet_points"},
-                    {"title": "建议行动方案", "type": "bullet_points"}
-                ]
-            }
-        
-        elif report_type == "trend":
-            structure = {
-                "title": title,
-                "sections": [
-                    {"title": "趋势概述", "type": "text"},
-                    {"title": "历史发展轨迹", "type": "text", "includes_chart": True},
-                    {"title": "未来3年预测", "type": "forecast", "includes_chart": True},
-                    {"title": "未来5年预测", "type": "forecast", "includes_chart": True},
-                    {"title": "影响因素分析", "type": "text"},
-                    {"title": "风险因素", "type": "bullet_points"},
-                    {"title": "机遇分析", "type": "bullet_points"}
-                ]
-            }
-        
-        elif report_type == "policy":
-            structure = {
-                "title": title,
-                "sections": [
-                    {"title": "政策背景", "type": "text"},
-                    {"title": "现有政策评估", "type": "text"},
-                    {"title": "政策效果分析", "type": "assessment", "includes_chart": True},
-                    {"title": "政策建议", "type": "text"},
-                    {"title": "短期行动方案", "type": "bullet_points"},
-                    {"title": "中长期规划建议", "type": "bullet_points"},
-                    {"title": "预期效果评估", "type": "text"}
-                ]
-            }
-        
-        elif report_type == "comparison":
-            structure = {
-                "title": title,
-                "sections": [
-                    {"title": "对标概述", "type": "text"},
-                    {"title": "标杆产业集群介绍", "type": "text"},
-                    {"title": "对比分析", "type": "comparison", "includes_chart": True},
-                    {"title": "差距分析", "type": "text"},
-                    {"title": "借鉴经验", "type": "bullet_points"},
-                    {"title": "改进方案", "type": "text"}
-                ]
-            }
-        
-        else:
-            # Default structure
-            structure = {
-                "title": title,
-                "sections": [
-                    {"title": "概述", "type": "text"},
-                    {"title": "分析", "type": "text"},
-                    {"title": "结论", "type": "text"}
-                ]
-            }
-        
-        # Translate section titles if language is English
-        if language == "en":
-            # Simple translation mapping
-            translations = {
-                "摘要": "Executive Summary",
-                "引言": "Introduction",
-                "产业发展现状": "Current Industry Status",
-                "潜力评估": "Potential Assessment",
-                "优势分析": "Strengths Analysis",
-                "挑战与不足": "Challenges and Weaknesses",
-                "发展趋势预测": "Development Trend Forecast",
-                "政策建议": "Policy Recommendations",
-                "结论": "Conclusion",
-                "附录：评估方法": "Appendix: Assessment Methodology",
-                "决策摘要": "Executive Summary",
-                "关键发现": "Key Findings",
-                "潜力评分": "Potential Score",
-                "主要优势": "Main Strengths",
-                "主要挑战": "Main Challenges",
-                "建议行动方案": "Recommended Action Plan",
-                "趋势概述": "Trend Overview",
-                "历史发展轨迹": "Historical Development",
-                "未来3年预测": "3-Year Forecast",
-                "未来5年预测": "5-Year Forecast",
-                "影响因素分析": "Factor Analysis",
-                "风险因素": "Risk Factors",
-                "机遇分析": "Opportunity Analysis",
-                "政策背景": "Policy Background",
-                "现有政策评估": "Existing Policy Assessment",
-                "政策效果分析": "Policy Impact Analysis",
-                "短期行动方案": "Short-term Action Plan",
-                "中长期规划建议": "Medium-Long Term Planning",
-                "预期效果评估": "Expected Impact Assessment",
-                "对标概述": "Benchmarking Overview",
-                "标杆产业集群介绍": "Benchmark Cluster Introduction",
-                "对比分析": "Comparative Analysis",
-                "差距分析": "Gap Analysis",
-                "借鉴经验": "Lessons Learned",
-                "改进方案": "Improvement Plan",
-                "概述": "Overview",
-                "分析": "Analysis",
-                "结论": "Conclusion"
-            }
-            
-            # Translate title
-            if "产业" in structure["title"]:
-                structure["title"] = structure["title"].replace("产业", " Industry ")
-            if "综合评估报告" in structure["title"]:
-                structure["title"] = structure["title"].replace("综合评估报告", "Comprehensive Assessment Report")
-            elif "决策者摘要" in structure["title"]:
-                structure["title"] = structure["title"].replace("决策者摘要", "Executive Summary")
-            elif "趋势预测报告" in structure["title"]:
-                structure["title"] = structure["title"].replace("趋势预测报告", "Trend Forecast Report")
-            elif "政策建议报告" in structure["title"]:
-                structure["title"] = structure["title"].replace("政策建议报告", "Policy Recommendation Report")
-            elif "对标分析报告" in structure["title"]:
-                structure["title"] = structure["title"].replace("对标分析报告", "Benchmarking Analysis Report")
-            
-            # Translate section titles
-            for section in structure["sections"]:
-                # Handle numbered titles
-                if ". " in section["title"]:
-                    number, title = section["title"].split(". ", 1)
-                    if title in translations:
-                        section["title"] = f"{number}. {translations[title]}"
-                else:
-                    if section["title"] in translations:
-                        section["title"] = translations[section["title"]]
-        
-        return structure
+        template = self.templates.get(report_type, language)
+        # The sections are the registry's shared read-only mappings; section
+        # generation copies each one before filling it in
+        return {"title": title, "sections": list(template.sections)}
     
     async def _generate_charts(
         self,
@@ -320,6 +395,18 @@ class ReportGenerator:
         Returns:
             List of chart dictionaries
         """
+        key = (report_type, industry, region)
+        if key not in self._chart_cache:
+            self._chart_cache[key] = self._build_charts(report_type, industry, region)
+        return copy.deepcopy(self._chart_cache[key])
+    
+    def _build_charts(
+        self,
+        report_type: str,
+        industry: Optional[str],
+        region: Optional[str]
+    ) -> List[Dict[str, Any]]:
+        """Chart data for a report type, industry and region"""
         charts = []
         
         # Generate appropriate charts based on report type
@@ -359,23 +446,7 @@ class ReportGenerator:
             # Heat map for regional comparison
             if region:
                 # If region is a city, compare with other cities in the province
-                province_map = {
-                    "杭州": "浙江",
-                    "宁波": "浙江",
-                    "温州": "浙江",
-                    "苏州": "江苏",
-                    "南京": "江苏",
-                    "无锡": "江苏",
-                    "广州": "广东",
-                    "深圳": "广东",
-                    "东莞": "广东",
-                    "成都": "四川",
-                    "重庆": "重庆",
-                    "武汉": "湖北",
-                    "西安": "陕西"
-                }
-                
-                province = province_map.get(region, "全国")
+                province = PROVINCE_MAP.get(region, "全国")
                 
                 if province == "浙江":
                     heat_data = [
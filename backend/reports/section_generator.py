@@ -0,0 +1,280 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from backend.models.embedding_batcher import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Writing instructions per section type
+TYPE_GUIDANCE = {
+    "zh": {
+        "text": "以连贯的段落撰写，500-800字。",
+        "bullet_points": "以5-8条要点列出，每条一到两句话。",
+        "assessment": "从创新、政策、人才、市场、基础设施、资金等维度逐项评估并给出评分依据，最后给出总体潜力等级。",
+        "forecast": "给出有依据的定量或定性预测，并说明主要假设与不确定性。",
+        "comparison": "与标杆产业集群逐项对比，指出差距及其成因。"
+    },
+    "en": {
+        "text": "Write coherent paragraphs, 300-500 words.",
+        "bullet_points": "Give 5-8 bullet points of one or two sentences each.",
+        "assessment": "Assess innovation, policy, talent, market, infrastructure and funding one by one with the basis for each score, then give an overall potential rating.",
+        "forecast": "Give a reasoned quantitative or qualitative forecast and state the main assumptions and uncertainties.",
+        "comparison": "Compare item by item with the benchmark clusters and explain the gaps and their causes."
+    }
+}
+
+SYSTEM_PROMPTS = {
+    "zh": "你是产业集群发展潜力评估专家，为政府和企业撰写专业、客观、有数据支撑的研究报告。只输出本节正文，不要重复节标题。",
+    "en": "You are an expert in industry cluster potential assessment writing professional, objective, evidence-based reports for governments and companies. Output only the body of the section, without repeating its title."
+}
+
+# Characters of each finished section quoted in a summary prompt
+SUMMARY_SECTION_CHARS = 1500
+# Recent chat messages quoted in section prompts
+CHAT_MESSAGES = 6
+CHAT_CHARS = 2000
+
+SectionCallback = Callable[[int, Dict[str, Any]], Awaitable[None]]
+# Retrieval key of a section: (query, industry, region)
+ContextKey = Tuple[str, Optional[str], Optional[str]]
+Context = Tuple[str, List[Dict[str, Any]]]
+
+class SectionGenerator:
+    """
+    Generates the content of report sections with the LLM
+
+    Body sections are generated concurrently, each with context retrieved
+    for its own topic; the retrievals of a report go through one batched
+    vector search. Sections flagged "summary" depend on the others and are
+    generated last, from their text. Each finished section is passed to
+    `on_section` right away, so the caller can persist a partial report
+    while the rest is still running.
+
+    The LLM budget (at most `concurrency` calls in flight, and
+    `requests_per_minute` if set) belongs to the instance, so it holds
+    across all reports generated with it at the same time, e.g. a batch.
+    """
+
+    def __init__(
+        self,
+        openai_handler,
+        vector_store=None,
+        concurrency: Optional[int] = None,
+        top_k: int = 5,
+        max_tokens: Optional[int] = None,
+        temperature: float = 0.3,
+        requests_per_minute: Optional[float] = None
+    ):
+        self.openai_handler = openai_handler
+        self.vector_store = vector_store
+        self.concurrency = concurrency or int(os.getenv("REPORT_SECTION_CONCURRENCY", 8))
+        self.top_k = top_k
+        self.max_tokens = max_tokens or int(os.getenv("REPORT_SECTION_MAX_TOKENS", 1200))
+        self.temperature = temperature
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        requests_per_minute = requests_per_minute or float(os.getenv("REPORT_LLM_RPM") or 0)
+        self.rate_limiter = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+
+    async def generate(
+        self,
+        structure: Dict[str, Any],
+        industry: Optional[str] = None,
+        region: Optional[str] = None,
+        messages: Optional[List[Dict[str, str]]] = None,
+        language: str = "zh",
+        on_section: Optional[SectionCallback] = None,
+        completed: Optional[Dict[int, Dict[str, Any]]] = None,
+        contexts: Optional[Dict[ContextKey, Context]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Generate every section of a report structure
+
+        Args:
+            structure: Report structure ({"title", "sections": [...]})
+            industry: Industry name, also the retrieval filter
+            region: Region name, also the retrieval filter
+            messages: Chat messages the report is based on
+            language: Report language ("zh" or "en")
+            on_section: Optional async callback(index, section) awaited as each section finishes
+            completed: Sections already generated by an interrupted run, by
+                index; they are reused as they are and not passed to on_section
+            contexts: Retrieval results fetched in advance (see retrieve())
+
+        Returns:
+            Copies of the sections with "content", "sources" and "elapsed"
+            (plus "error" if the LLM call failed), in structure order
+        """
+        language = language if language in SYSTEM_PROMPTS else "zh"
+        completed = completed or {}
+        sections = [dict(completed.get(i, section)) for i, section in enumerate(structure["sections"])]
+        body = [i for i, section in enumerate(sections) if not section.get("summary")]
+        summaries = [i for i, section in enumerate(sections) if section.get("summary")]
+        chat = self._chat_excerpt(messages or [])
+
+        async def run(index: int, prompt: List[Dict[str, str]], sources: List[Dict[str, Any]]) -> None:
+            section = sections[index]
+            async with self.semaphore:
+                if self.rate_limiter is not None:
+                    await self.rate_limiter.acquire()
+                started = time.perf_counter()
+                try:
+                    section["content"] = await self._complete(prompt)
+                except Exception as e:
+                    logger.warning(f"报告章节生成失败: {section['title']}: {e}")
+                    section["content"] = ""
+                    section["error"] = str(e)
+                section["elapsed"] = round(time.perf_counter() - started, 3)
+            section["sources"] = sources
+            if on_section is not None:
+                await on_section(index, section)
+
+        pending = [i for i in body if i not in completed]
+        keys = {i: self.context_key(structure["title"], sections[i], industry, region) for i in pending}
+        retrieved = await self.retrieve(list(keys.values()), contexts)
+        async def run_body(index: int) -> None:
+            context, sources = retrieved[keys[index]]
+            prompt = self._section_prompt(structure["title"], sections[index], industry, region, chat, context, language)
+            await run(index, prompt, sources)
+
+        await asyncio.gather(*(run_body(i) for i in pending))
+
+        written = [sections[i] for i in body if sections[i]["content"]]
+        await asyncio.gather(*(
+            run(i, self._summary_prompt(structure["title"], sections[i], written, language), [])
+            for i in summaries if i not in completed
+        ))
+        return sections
+
+    def context_key(
+        self,
+        title: str,
+        section: Dict[str, Any],
+        industry: Optional[str],
+        region: Optional[str]
+    ) -> ContextKey:
+        """
+        Retrieval key of a body section
+
+        Industry and region are search filters, so the query names only the
+        industry and the section topic; reports on the same industry in
+        different regions then share their query texts (and embeddings).
+        """
+        topic = self._plain_title(section["title"])
+        query = f"{industry} {topic}" if industry else f"{title} {topic}"
+        return (query, industry, region)
+
+    async def retrieve(
+        self,
+        keys: List[ContextKey],
+        contexts: Optional[Dict[ContextKey, Context]] = None
+    ) -> Dict[ContextKey, Context]:
+        """
+        Context for each retrieval key, from one batched search
+
+        Args:
+            keys: Retrieval keys (see context_key())
+            contexts: Results already fetched; only the missing keys are searched
+
+        Returns:
+            Dict of {key: (context, sources)} covering every key
+        """
+        results = dict(contexts or {})
+        missing = list(dict.fromkeys(key for key in keys if key not in results))
+        if not missing:
+            return results
+        found: List[Context] = [("", []) for _ in missing]
+        if self.vector_store is not None:
+            try:
+                found = await self.vector_store.search_many(
+                    [query for query, _, _ in missing],
+                    [{"industry": industry, "region": region} for _, industry, region in missing],
+                    self.top_k
+                )
+            except Exception as e:
+                logger.warning(f"报告章节检索失败，将不带参考资料生成: {e}")
+        results.update(zip(missing, found))
+        return results
+
+    async def _complete(self, prompt: List[Dict[str, str]]) -> str:
+        response = await self.openai_handler.chat_completion(
+            messages=prompt,
+            temperature=self.temperature,
+            max_tokens=self.max_tokens
+        )
+        return response["choices"][0]["message"]["content"].strip()
+
+    @staticmethod
+    def _plain_title(title: str) -> str:
+        """Section title without its "3. " numbering"""
+        number, _, rest = title.partition(". ")
+        return rest if rest and number.isdigit() else title
+
+    @staticmethod
+    def _chat_excerpt(messages: List[Dict[str, str]]) -> str:
+        """The last user/assistant turns, newest kept when over the length limit"""
+        turns = [m for m in messages if m.get("role") in ("user", "assistant")][-CHAT_MESSAGES:]
+        excerpt = "\n".join(f"{m['role']}: {m['content']}" for m in turns)
+        return excerpt[-CHAT_CHARS:]
+
+    def _section_prompt(
+        self,
+        title: str,
+        section: Dict[str, Any],
+        industry: Optional[str],
+        region: Optional[str],
+        chat: str,
+        context: str,
+        language: str
+    ) -> List[Dict[str, str]]:
+        guidance = TYPE_GUIDANCE[language].get(section.get("type"), TYPE_GUIDANCE[language]["text"])
+        if language == "en":
+            parts = [
+                f"Report: {title}",
+                f"Industry: {industry or 'not specified'}; region: {region or 'not specified'}",
+                f"Write the section \"{section['title']}\". {guidance}"
+            ]
+            if context:
+                parts.append(f"Reference material:\n{context}")
+            if chat:
+                parts.append(f"Relevant conversation:\n{chat}")
+        else:
+            parts = [
+                f"报告：{title}",
+                f"产业：{industry or '未指定'}；地区：{region or '未指定'}",
+                f"请撰写“{section['title']}”一节。{guidance}"
+            ]
+            if context:
+                parts.append(f"参考资料：\n{context}")
+            if chat:
+                parts.append(f"相关对话：\n{chat}")
+        return [
+            {"role": "system", "content": SYSTEM_PROMPTS[language]},
+            {"role": "user", "content": "\n\n".join(parts)}
+        ]
+
+    def _summary_prompt(
+        self,
+        title: str,
+        section: Dict[str, Any],
+        written: List[Dict[str, Any]],
+        language: str
+    ) -> List[Dict[str, str]]:
+        quoted = "\n\n".join(f"## {s['title']}\n{s['content'][:SUMMARY_SECTION_CHARS]}" for s in written)
+        guidance = TYPE_GUIDANCE[language].get(section.get("type"), TYPE_GUIDANCE[language]["text"])
+        if language == "en":
+            request = (
+                f"Report: {title}\n\nBased only on the sections below, write the section \"{section['title']}\", "
+                f"summarising the key conclusions. {guidance}\n\n{quoted}"
+            )
+        else:
+            request = (
+                f"报告：{title}\n\n请仅依据以下各节内容撰写“{section['title']}”一节，概括报告的核心结论。"
+                f"{guidance}\n\n{quoted}"
+            )
+        return [
+            {"role": "system", "content": SYSTEM_PROMPTS[language]},
+            {"role": "user", "content": request}
+        ]
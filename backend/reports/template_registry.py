@@ -0,0 +1,212 @@
+import os
+import json
+import asyncio
+import hashlib
+import logging
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Templates shipped with the code; overridden per report type by the file
+# at REPORT_TEMPLATES_PATH and then by active rows of report_templates
+BUILTIN_PATH = os.path.join(os.path.dirname(__file__), "templates", "report_templates.json")
+LANGUAGES = ("zh", "en")
+# Full report title by which of industry/region is given
+TITLE_FORMATS = {
+    "zh": {
+        "both": "{region}{industry}{name}",
+        "industry": "{industry}{name}",
+        "region": "{region}产业{name}"
+    },
+    "en": {
+        "both": "{region} {industry} {name}",
+        "industry": "{industry} {name}",
+        "region": "{region} Industry {name}"
+    }
+}
+
+class CompiledTemplate(NamedTuple):
+    """
+    One report type in one language, resolved and read-only
+
+    The sections are shared by every report of the type; a report copies a
+    section only when it writes to it (SectionGenerator does).
+    """
+    name: str
+    sections: Tuple[Mapping[str, Any], ...]
+    digest: str
+
+def compile_template(content: Dict[str, Any], language: str) -> CompiledTemplate:
+    """
+    Resolve a template to one language
+
+    Args:
+        content: {"name": {lang: str}, "sections": [{"title": {lang: str}, "type", ...}]};
+            languages missing from a title or name fall back to Chinese
+        language: Language to resolve
+
+    Returns:
+        Compiled template
+    """
+    def resolve(value: Any) -> str:
+        if isinstance(value, dict):
+            return value.get(language) or value["zh"]
+        return value
+
+    sections = tuple(
+        MappingProxyType({**section, "title": resolve(section["title"])})
+        for section in content["sections"]
+    )
+    digest = hashlib.sha256(json.dumps(content, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+    return CompiledTemplate(resolve(content["name"]), sections, digest)
+
+class TemplateRegistry:
+    """
+    Report templates, compiled once per language
+
+    Templates are read from the built-in file, the optional override file
+    (REPORT_TEMPLATES_PATH) and the active rows of the report_templates
+    table (template_type = report type, content = template JSON); later
+    sources replace earlier ones per report type. Every (type, language)
+    pair is compiled up front, so a lookup is a dict access. A background
+    task reloads when the override file or the table changes and swaps in
+    the new compiled map as a whole.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        database_url: Optional[str] = None,
+        reload_interval: Optional[float] = None
+    ):
+        self.path = path or os.getenv("REPORT_TEMPLATES_PATH", "./data/templates/report_templates.json")
+        self.database_url = database_url if database_url is not None else os.getenv("DATABASE_URL")
+        self.reload_interval = reload_interval or float(os.getenv("REPORT_TEMPLATE_RELOAD_INTERVAL", 30))
+        self._db_templates: Dict[str, Dict[str, Any]] = {}
+        self._file_signature: Optional[Tuple[float, int]] = None
+        self._db_signature: Optional[Tuple] = None
+        self._compiled: Dict[Tuple[str, str], CompiledTemplate] = {}
+        self._reload_task: Optional[asyncio.Task] = None
+        self._compile()
+
+    def _file_stat(self) -> Optional[Tuple[float, int]]:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime, stat.st_size)
+
+    def _compile(self) -> None:
+        """Merge the sources and compile every (type, language) pair"""
+        with open(BUILTIN_PATH, "r", encoding="utf-8") as f:
+            templates = json.load(f)
+        self._file_signature = self._file_stat()
+        if self._file_signature is not None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    templates.update(json.load(f))
+            except (OSError, json.JSONDecodeError) as e:
+                logger.warning(f"报告模板文件无法读取，已忽略: {self.path}: {e}")
+        templates.update(self._db_templates)
+
+        compiled = {}
+        for report_type, content in templates.items():
+            try:
+                for language in LANGUAGES:
+                    compiled[(report_type, language)] = compile_template(content, language)
+            except (KeyError, TypeError) as e:
+                logger.warning(f"报告模板 {report_type} 格式错误，已跳过: {e}")
+        if ("default", "zh") not in compiled:
+            raise ValueError("Report templates must define a \"default\" template")
+        self._compiled = compiled
+
+    def get(self, report_type: str, language: str = "zh") -> CompiledTemplate:
+        """Compiled template of a report type (the default template for unknown types)"""
+        language = language if language in LANGUAGES else "zh"
+        template = self._compiled.get((report_type, language))
+        return template if template is not None else self._compiled[("default", language)]
+
+    def title(
+        self,
+        report_type: str,
+        title: str,
+        industry: Optional[str],
+        region: Optional[str],
+        language: str = "zh"
+    ) -> str:
+        """Full report title; the given title is used only without industry and region"""
+        name = self.get(report_type, language).name
+        formats = TITLE_FORMATS.get(language, TITLE_FORMATS["zh"])
+        if industry and region:
+            return formats["both"].format(region=region, industry=industry, name=name)
+        elif industry:
+            return formats["industry"].format(industry=industry, name=name)
+        elif region:
+            return formats["region"].format(region=region, name=name)
+        return title or name
+
+    async def _load_database(self) -> bool:
+        """Read the active report_templates rows if they changed; returns whether they did"""
+        import asyncpg
+
+        conn = await asyncpg.connect(self.database_url, timeout=10)
+        try:
+            signature = tuple(await conn.fetchrow(
+                "SELECT COUNT(*), MAX(updated_at), MAX(id) FROM report_templates WHERE is_active"
+            ))
+            if signature == self._db_signature:
+                return False
+            rows = await conn.fetch(
+                "SELECT template_type, content FROM report_templates WHERE is_active ORDER BY updated_at, id"
+            )
+        finally:
+            await conn.close()
+        templates = {}
+        for row in rows:
+            content = row["content"]
+            templates[row["template_type"]] = json.loads(content) if isinstance(content, str) else content
+        self._db_templates = templates
+        self._db_signature = signature
+        return True
+
+    async def reload(self) -> bool:
+        """
+        Recompile if the override file or the table changed
+
+        Returns:
+            Whether the templates were recompiled
+        """
+        changed = self._file_stat() != self._file_signature
+        if self.database_url:
+            try:
+                changed = await self._load_database() or changed
+            except Exception as e:
+                logger.warning(f"从数据库加载报告模板失败，继续使用当前模板: {e}")
+        if changed:
+            self._compile()
+            logger.info(f"报告模板已重新加载: {len(self._compiled) // len(LANGUAGES)} 种报告类型")
+        return changed
+
+    async def start(self) -> None:
+        """Load the database templates and start watching for changes"""
+        await self.reload()
+        if self._reload_task is None and self.reload_interval > 0:
+            self._reload_task = asyncio.create_task(self._watch())
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            try:
+                await self.reload()
+            except Exception as e:
+                logger.error(f"报告模板重新加载失败: {e}")
+
+    async def close(self) -> None:
+        if self._reload_task is not None:
+            self._reload_task.cancel()
+            try:
+                await self._reload_task
+            except asyncio.CancelledError:
+                pass
+            self._reload_task = None
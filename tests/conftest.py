@@ -0,0 +1,7 @@
+import pytest
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Run the test inside an empty directory; services keep their state under ./data"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
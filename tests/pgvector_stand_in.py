@@ -0,0 +1,138 @@
+"""
+In-process stand-in for the asyncpg pool PgVectorStore talks to
+
+Implements exactly the statements PgVectorStore issues against the schema
+of backend/db/init_vector.sql (including the vector(N) column size, read
+from that file), over Python lists. Any other statement raises, so a change
+to PgVectorStore's SQL shows up as a test failure until the stand-in is
+updated with it.
+"""
+import os
+import re
+import copy
+import json
+from contextlib import asynccontextmanager
+
+import numpy as np
+
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), "..", "backend", "db", "init_vector.sql")
+
+def schema_dimensions() -> int:
+    with open(SCHEMA_PATH, "r", encoding="utf-8") as f:
+        return int(re.search(r"embedding vector\((\d+)\)", f.read()).group(1))
+
+class DataError(Exception):
+    """What asyncpg raises for a value the column does not accept"""
+
+class UniqueViolationError(Exception):
+    pass
+
+class StandInDatabase:
+    def __init__(self):
+        self.dimensions = schema_dimensions()
+        # document_chunks rows joined with their embeddings row
+        self.chunks = []
+        self.next_id = 1
+
+class StandInConnection:
+    def __init__(self, db: StandInDatabase):
+        self.db = db
+        self.staging = None
+
+    @asynccontextmanager
+    async def transaction(self):
+        snapshot = copy.deepcopy((self.db.chunks, self.db.next_id))
+        try:
+            yield
+        except BaseException:
+            self.db.chunks, self.db.next_id = snapshot
+            raise
+        finally:
+            # staging_chunks is ON COMMIT DROP
+            self.staging = None
+
+    async def execute(self, sql: str, *args):
+        sql = " ".join(sql.split())
+        if sql.startswith("SELECT set_config('ivfflat.probes'"):
+            return "SELECT 1"
+        if sql == "DELETE FROM document_chunks WHERE document_id = $1 AND chunk_index = ANY($2::int[])":
+            doc_id, indexes = args
+            self.db.chunks = [c for c in self.db.chunks if not (c["document_id"] == doc_id and c["chunk_index"] in indexes)]
+            return "DELETE"
+        if sql == "DELETE FROM document_chunks WHERE document_id = $1":
+            self.db.chunks = [c for c in self.db.chunks if c["document_id"] != args[0]]
+            return "DELETE"
+        if sql.startswith("CREATE TEMP TABLE staging_chunks"):
+            self.staging = []
+            return "CREATE TABLE"
+        if sql.startswith("WITH inserted AS ( INSERT INTO document_chunks"):
+            (doc_id,) = args
+            existing = {c["chunk_index"] for c in self.db.chunks if c["document_id"] == doc_id}
+            for row in self.staging:
+                if len(row["embedding"]) != self.db.dimensions:
+                    raise DataError(f"expected {self.db.dimensions} dimensions, not {len(row['embedding'])}")
+                if row["chunk_index"] in existing:
+                    raise UniqueViolationError(f"duplicate chunk ({doc_id}, {row['chunk_index']})")
+                existing.add(row["chunk_index"])
+                self.db.chunks.append({
+                    "id": self.db.next_id,
+                    "document_id": doc_id,
+                    "chunk_index": row["chunk_index"],
+                    "content": row["content"],
+                    "industry": None,
+                    "region": None,
+                    "metadata": "{}",
+                    "tags": json.loads(row["tags"]),
+                    "embedding": np.asarray(row["embedding"], dtype=np.float32)
+                })
+                self.db.next_id += 1
+            return "INSERT"
+        if sql.startswith("UPDATE document_chunks SET industry = $2, region = $3, metadata = $4::jsonb"):
+            doc_id, industry, region, metadata = args
+            for chunk in self.db.chunks:
+                if chunk["document_id"] == doc_id:
+                    chunk.update(industry=industry, region=region, metadata=metadata)
+            return "UPDATE"
+        raise NotImplementedError(f"Statement not supported by the stand-in: {sql}")
+
+    async def copy_records_to_table(self, table, records, columns):
+        assert table == "staging_chunks" and self.staging is not None
+        self.staging.extend(dict(zip(columns, record)) for record in records)
+
+    async def fetch(self, sql: str, *args):
+        sql = " ".join(sql.split())
+        if sql.startswith("SELECT chunk_id, document_id, content, metadata, tags, similarity FROM search_similar_chunks("):
+            query, threshold, limit, industry, region = args
+            query = np.asarray(query, dtype=np.float32)
+            rows = []
+            for chunk in self.db.chunks:
+                if (industry is not None and chunk["industry"] != industry) or (region is not None and chunk["region"] != region):
+                    continue
+                vector = chunk["embedding"]
+                similarity = float(query @ vector / (np.linalg.norm(query) * np.linalg.norm(vector)))
+                if similarity > threshold:
+                    rows.append({
+                        "chunk_id": chunk["id"],
+                        "document_id": chunk["document_id"],
+                        "content": chunk["content"],
+                        # jsonb comes back as text without a type codec
+                        "metadata": chunk["metadata"],
+                        "tags": json.dumps(chunk["tags"], ensure_ascii=False),
+                        "similarity": similarity
+                    })
+            rows.sort(key=lambda row: -row["similarity"])
+            return rows[:limit]
+        if sql == "SELECT chunk_index FROM document_chunks WHERE document_id = $1 ORDER BY chunk_index":
+            return [{"chunk_index": c["chunk_index"]} for c in sorted(self.db.chunks, key=lambda c: c["chunk_index"]) if c["document_id"] == args[0]]
+        raise NotImplementedError(f"Query not supported by the stand-in: {sql}")
+
+class StandInPool:
+    def __init__(self, db: StandInDatabase = None):
+        self.db = db or StandInDatabase()
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield StandInConnection(self.db)
+
+    async def close(self):
+        pass
@@ -0,0 +1,115 @@
+import os
+
+import numpy as np
+import pytest
+
+from backend.rag.ann_index import ExactIndex, IVFFlatIndex
+from backend.rag.vector_store import VectorStore
+
+DIM = 32
+
+def normalised(vectors):
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+def clustered(n, clusters=40, seed=0):
+    """Rows around random centres, like embeddings of documents on a few topics"""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, DIM))
+    return normalised(centres[rng.integers(clusters, size=n)] + 0.5 * rng.standard_normal((n, DIM)))
+
+def queries(count, seed=1):
+    return clustered(count, seed=seed)
+
+@pytest.fixture(scope="module")
+def matrix():
+    return clustered(20000)
+
+@pytest.fixture
+def index(matrix):
+    index = IVFFlatIndex(nlist=50, nprobe=8)
+    index.sync(matrix)
+    return index
+
+def test_recall_against_the_exact_scan(matrix, index):
+    assert index.is_trained and index.ntotal == len(matrix)
+    exact = ExactIndex()
+    found = 0
+    for query in queries(50):
+        expected, _ = exact.search(matrix, query, 10)
+        rows, scores = index.search(matrix, query, 10)
+        np.testing.assert_allclose(scores, matrix[rows] @ query, rtol=1e-5)
+        found += len(set(rows.tolist()) & set(expected.tolist()))
+    assert found / 500 >= 0.9
+    # Probing every list is exact
+    query = queries(1)[0]
+    assert index.search(matrix, query, 10, nprobe=50)[0].tolist() == exact.search(matrix, query, 10)[0].tolist()
+
+@pytest.mark.parametrize("density", [None, 0.5, 0.01])
+def test_search_many_matches_search(matrix, index, density):
+    mask = None if density is None else np.random.default_rng(2).random(len(matrix)) < density
+    batch = queries(8)
+    for backend in (index, ExactIndex()):
+        results = backend.search_many(matrix, batch, 10, mask)
+        for query, (rows, scores) in zip(batch, results):
+            expected_rows, expected_scores = backend.search(matrix, query, 10, mask)
+            assert rows.tolist() == expected_rows.tolist()
+            np.testing.assert_allclose(scores, expected_scores, rtol=1e-5)
+            if mask is not None:
+                assert mask[rows].all()
+
+def test_untrained_index_falls_back_to_exact_search():
+    small = clustered(100)
+    index = IVFFlatIndex(nlist=50)
+    query = queries(1)[0]
+    assert index.search(small, query, 5)[0].tolist() == ExactIndex().search(small, query, 5)[0].tolist()
+    assert not index.is_trained
+
+def test_save_and_load_round_trip(tmp_path, matrix, index):
+    path = str(tmp_path / "ivf.npz")
+    index.save(path)
+    loaded = IVFFlatIndex(path=path)
+    assert loaded.nlist == 50 and loaded.ntotal == len(matrix)
+    np.testing.assert_array_equal(loaded.centroids, index.centroids)
+    for query in queries(10):
+        assert loaded.search(matrix, query, 10)[0].tolist() == index.search(matrix, query, 10)[0].tolist()
+
+    # New rows are assigned incrementally on top of the loaded ones
+    grown = np.concatenate([matrix, clustered(500, seed=3)])
+    loaded.sync(grown)
+    assert loaded.ntotal == len(grown)
+
+async def test_compaction_removes_the_saved_index_and_it_is_retrained(workdir, monkeypatch):
+    monkeypatch.setenv("VECTOR_INDEX", "ivf")
+    monkeypatch.setenv("IVF_NLIST", "10")
+    monkeypatch.setenv("SEARCH_MODE", "dense")
+
+    class Embedder:
+        async def embeddings(self, texts, model=None):
+            return queries(len(texts), seed=4).tolist()
+
+    store = VectorStore(Embedder())
+    vectors = clustered(1200, seed=5)
+    for doc in range(4):
+        rows = vectors[doc * 300:(doc + 1) * 300]
+        store.storage.append(f"doc{doc}", list(range(300)), rows, [f"doc{doc}-{i}" for i in range(300)])
+        await store.set_document_metadata(f"doc{doc}", {"title": f"doc{doc}"})
+    await store.search("产业", top_k=5)
+    store.index.save()
+    ann_file = os.path.join(store.storage.root_dir, "ivf.npz")
+    assert store.index.is_trained and os.path.exists(ann_file)
+
+    await store.delete_document("doc0")
+    await store.delete_document("doc1")
+    store.storage.compact()
+    assert not os.path.exists(ann_file)
+
+    # A fresh process trains a new index over the 600 remaining rows
+    reopened = VectorStore(Embedder())
+    assert reopened.index.is_trained and reopened.index.ntotal == 600
+    assert os.path.exists(ann_file)
+    _, sources = await reopened.search("产业", top_k=20)
+    assert {source["title"] for source in sources} <= {"doc2", "doc3"}
+    # The running store picks up the compacted rows too
+    _, sources = await store.search("产业", top_k=20)
+    assert store.index.ntotal == 600
+    assert {source["title"] for source in sources} <= {"doc2", "doc3"}
@@ -0,0 +1,83 @@
+import itertools
+
+import pytest
+
+from backend.reports import artifact_cache
+from backend.reports.artifact_cache import ReportArtifactCache, report_key
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Strictly increasing time.time(), so last-use order is deterministic"""
+    ticks = itertools.count(1000)
+    monkeypatch.setattr(artifact_cache.time, "time", lambda: float(next(ticks)))
+
+def write(cache, report_id, size, formats=("json", "docx")):
+    cache.directory(report_id)
+    for fmt in formats:
+        with open(cache.path(report_id, fmt), "wb") as f:
+            f.write(b"x" * size)
+    return cache.put(report_id, list(formats))
+
+def make_cache(tmp_path, **limits):
+    return ReportArtifactCache(str(tmp_path / "objects"), **limits)
+
+def test_least_recently_used_reports_are_evicted_over_the_entry_limit(tmp_path, clock):
+    cache = make_cache(tmp_path, max_entries=3)
+    for report_id in ["a1", "b2", "c3"]:
+        write(cache, report_id, 10)
+    # Serving a1 makes b2 the least recently used
+    assert cache.get("a1") is not None
+    write(cache, "d4", 10)
+
+    assert cache.get("b2") is None
+    assert not (tmp_path / "objects" / "b2" / "b2.docx").exists()
+    assert all(cache.get(report_id) for report_id in ["a1", "c3", "d4"])
+
+def test_eviction_over_the_size_limit_never_removes_the_new_report(tmp_path, clock):
+    cache = make_cache(tmp_path, max_bytes=100)
+    write(cache, "a1", 20)
+    write(cache, "b2", 20)
+    entry = write(cache, "c3", 30)
+    assert entry["files"]["docx"]["size"] == 30
+    # 40 + 40 + 60 > 100: only the oldest goes
+    assert cache.get("a1") is None and cache.get("b2") and cache.get("c3")
+
+    # A report larger than the whole budget evicts everything else but is kept
+    write(cache, "d4", 80)
+    assert [cache.get(report_id) is not None for report_id in ["b2", "c3", "d4"]] == [False, False, True]
+
+def test_incomplete_reports_and_missing_files(tmp_path, clock):
+    cache = make_cache(tmp_path)
+    entry = write(cache, "a1", 10)
+    assert entry["files"]["json"]["etag"] == cache.get("a1")["files"]["json"]["etag"]
+
+    write(cache, "b2", 10, formats=("json",))
+    cache.put("b2", ["json"], complete=False)
+    assert cache.get("b2", complete_only=True) is None
+    assert cache.get("b2")["complete"] is False
+
+    # Files deleted behind the index's back drop the entry
+    (tmp_path / "objects" / "a1" / "a1.json").unlink()
+    assert cache.get("a1") is None
+    cache.remove("b2")
+    assert cache.get("b2") is None and not (tmp_path / "objects" / "b2" / "b2.json").exists()
+
+def test_eviction_and_removal_delete_the_partial_sections(tmp_path, clock):
+    cache = make_cache(tmp_path, max_entries=1)
+    # An incomplete report, with the sections a rerun would resume from
+    write(cache, "a1", 10, formats=("json", "sections.jsonl"))
+    cache.put("a1", ["json"], complete=False)
+    write(cache, "b2", 10, formats=("json", "sections.jsonl"))
+    cache.put("b2", ["json"], complete=False)
+    assert not (tmp_path / "objects" / "a1" / "a1.sections.jsonl").exists()
+
+    cache.remove("b2")
+    assert not (tmp_path / "objects" / "b2" / "b2.sections.jsonl").exists()
+
+def test_report_key_normalises_messages_and_includes_the_template():
+    messages = [{"role": "user", "content": "请评估杭州新能源产业集群？"}]
+    spaced = [{"role": "user", "content": "请评估杭州新能源产业集群?  "}]
+    key = report_key(messages, "executive", "报告", "新能源", "杭州", "zh", True, ["docx", "json"], template="t1")
+    assert report_key(spaced, "executive", "报告", "新能源", "杭州", "zh", True, ["json", "docx"], template="t1") == key
+    assert report_key(messages, "executive", "报告", "新能源", "杭州", "zh", True, ["docx", "json"], template="t2") != key
+    assert report_key(messages, "executive", "报告", "新能源", "苏州", "zh", True, ["docx", "json"], template="t1") != key
@@ -0,0 +1,90 @@
+import os
+import json
+
+import pytest
+
+from backend.reports.batch_reports import BatchReportRunner
+from backend.reports.report_generator import ReportGenerator
+
+class FakeLLM:
+    def __init__(self):
+        self.calls = 0
+        self.error = None
+
+    async def chat_completion(self, messages, temperature, max_tokens):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        return {"choices": [{"message": {"content": "新生成的内容"}}]}
+
+def write_template(section_type, mtime):
+    path = "./data/templates/report_templates.json"
+    template = {"name": {"zh": "摘要"}, "sections": [
+        {"title": {"zh": "现状"}, "type": section_type},
+        {"title": {"zh": "展望"}, "type": "forecast"}
+    ]}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"executive": template}, f, ensure_ascii=False)
+    os.utime(path, (mtime, mtime))
+
+@pytest.mark.parametrize("template_changed", [False, True])
+async def test_resume_discards_sections_written_from_an_edited_template(workdir, monkeypatch, template_changed):
+    monkeypatch.setenv("REPORT_FORMATS", "")
+    monkeypatch.delenv("DATABASE_URL", raising=False)
+    os.makedirs("./data/templates")
+    write_template("text", mtime=1000)
+    llm = FakeLLM()
+    generator = ReportGenerator(llm)
+    runner = BatchReportRunner(generator)
+
+    # A run interrupted after writing the first section
+    manifest = runner.create(["杭州"], ["新能源"], ["executive"], include_charts=False)
+    job = manifest["jobs"][0]
+    old_id = generator.report_key([], "executive", "", "新能源", "杭州", False, "zh")
+    with open(generator._partial_path(old_id), "w", encoding="utf-8") as f:
+        f.write(json.dumps({"index": 0, "title": "现状", "type": "text", "content": "旧章节"}, ensure_ascii=False) + "\n")
+    job.update(status="running", report_id=old_id)
+    runner._save(manifest)
+
+    if template_changed:
+        write_template("assessment", mtime=2000)
+        assert await generator.templates.reload()
+
+    manifest = await runner.run(manifest["id"])
+    job = manifest["jobs"][0]
+    assert manifest["status"] == "done"
+    with open(generator.artifact_cache.path(job["report_id"], "json"), "r", encoding="utf-8") as f:
+        sections = json.load(f)["structure"]["sections"]
+    if template_changed:
+        assert job["report_id"] != old_id
+        assert not os.path.exists(generator._partial_path(old_id))
+        assert [s["content"] for s in sections] == ["新生成的内容", "新生成的内容"]
+        assert sections[0]["type"] == "assessment" and llm.calls == 2
+    else:
+        assert job["report_id"] == old_id
+        assert [s["content"] for s in sections] == ["旧章节", "新生成的内容"] and llm.calls == 1
+
+async def test_jobs_with_failed_sections_are_retried_on_resume(workdir, monkeypatch):
+    monkeypatch.setenv("REPORT_FORMATS", "")
+    monkeypatch.delenv("DATABASE_URL", raising=False)
+    os.makedirs("./data/templates")
+    write_template("text", mtime=1000)
+    llm = FakeLLM()
+    generator = ReportGenerator(llm)
+    runner = BatchReportRunner(generator)
+    batch_id = runner.create(["杭州"], ["新能源"], ["executive"], include_charts=False)["id"]
+
+    # Rate limited throughout the first run
+    llm.error = RuntimeError("HTTP 429")
+    manifest = await runner.run(batch_id)
+    assert manifest["status"] == "partial" and llm.calls == 2
+    assert manifest["jobs"][0]["status"] == "failed"
+    assert generator.artifact_cache.get(manifest["jobs"][0]["report_id"])["complete"] is False
+
+    llm.error, llm.calls = None, 0
+    manifest = await runner.run(batch_id)
+    assert manifest["status"] == "done" and manifest["jobs"][0]["status"] == "done"
+    assert llm.calls == 2
+    # Nothing left to do
+    await runner.run(batch_id)
+    assert llm.calls == 2
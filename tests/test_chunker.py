@@ -0,0 +1,84 @@
+import random
+
+from backend.rag.chunker import CharChunker, StructureChunker, heading_level, split_sentences
+
+REPORT = """# 杭州生物医药产业集群发展报告
+## 第一章 产业规模
+杭州高新区生物医药产业2021年实现产值1234亿元。龙头企业带动效应明显！研发投入年均增长15%；创新成果加快转化。
+人才引进政策持续发力，累计引进高层次人才3000人。
+## 第二章 重点企业
+企业\t产值（亿元）\t员工
+甲公司\t120\t3000
+乙公司\t95\t2100
+## 第三章 发展建议
+（一）加快创新药研发
+建议设立产业基金。
+"""
+
+def chunk(text, pieces=None, **kwargs):
+    chunker = StructureChunker(count_tokens=len, **kwargs)
+    out = []
+    for piece in pieces or [text]:
+        out.extend(chunker.feed(piece))
+    return out + chunker.finish()
+
+def test_sentences_and_headings():
+    assert split_sentences("第一句。第二句！“第三句？”尾巴") == ["第一句。", "第二句！", "“第三句？”", "尾巴"]
+    assert split_sentences("Output grew 3.5 percent. Next") == ["Output grew 3.5 percent.", " Next"]
+    assert [heading_level(line) for line in ["## 产业规模", "第一章 总论", "第二节 规模", "一、概况", "（一）建议", "1.2 产值"]] == [2, 1, 2, 3, 4, 3]
+    assert heading_level("一、产业规模持续扩大，龙头企业带动效应明显。") == 0
+
+def test_sections_tables_and_heading_paths():
+    chunks = chunk(REPORT, max_tokens=200, overlap_tokens=0)
+    assert chunks == [
+        "# 杭州生物医药产业集群发展报告\n## 第一章 产业规模\n"
+        "杭州高新区生物医药产业2021年实现产值1234亿元。龙头企业带动效应明显！研发投入年均增长15%；创新成果加快转化。\n"
+        "人才引进政策持续发力，累计引进高层次人才3000人。",
+        "# 杭州生物医药产业集群发展报告\n## 第二章 重点企业\n企业\t产值（亿元）\t员工\n甲公司\t120\t3000\n乙公司\t95\t2100",
+        "# 杭州生物医药产业集群发展报告\n## 第三章 发展建议\n（一）加快创新药研发\n建议设立产业基金。",
+    ]
+
+def test_packs_whole_sentences_within_the_budget_with_overlap():
+    sentences = [f"第{i}家企业年产值增长{i % 9}个百分点。" for i in range(40)]
+    chunks = chunk("## 企业\n" + "".join(sentences) + "\n", max_tokens=80, overlap_tokens=20)
+    assert len(chunks) > 3
+    for text in chunks:
+        assert len(text) <= 80
+        heading, body = text.split("\n", 1)
+        assert heading == "## 企业"
+        # No sentence is cut
+        assert split_sentences(body) and all(s in sentences for s in split_sentences(body))
+    # Each chunk starts with the last sentence of the previous one
+    for previous, current in zip(chunks, chunks[1:]):
+        assert split_sentences(current.split("\n", 1)[1])[0] == split_sentences(previous)[-1]
+
+def test_large_table_is_split_between_rows_under_its_header():
+    rows = [f"企业{i}\t{i * 10}\t{i * 100}" for i in range(30)]
+    chunks = chunk("## 名录\n企业\t产值\t员工\n" + "\n".join(rows) + "\n", max_tokens=100, overlap_tokens=0)
+    assert len(chunks) > 1
+    seen = []
+    for text in chunks:
+        lines = text.split("\n")
+        assert lines[:2] == ["## 名录", "企业\t产值\t员工"]
+        seen.extend(lines[2:])
+        assert len(text) <= 100
+    assert seen == rows
+
+def test_over_long_sentence_is_cut_into_near_equal_windows():
+    sentence = "产" * 250 + "。"
+    chunks = chunk(sentence, max_tokens=100, overlap_tokens=0)
+    assert "".join(chunks) == sentence
+    assert [len(text) for text in chunks] == [84, 84, 83]
+
+def test_streamed_pieces_give_the_same_chunks():
+    text = REPORT * 5 + "没有换行的超长段落。" * 300
+    expected = chunk(text, max_tokens=120)
+    rng = random.Random(7)
+    cuts = sorted(rng.sample(range(1, len(text)), 40))
+    pieces = [text[start:end] for start, end in zip([0] + cuts, cuts + [len(text)])]
+    assert chunk(text, pieces=pieces, max_tokens=120) == expected
+
+def test_char_chunker_windows_overlap():
+    chunker = CharChunker(chunk_size=10, overlap=4)
+    chunks = chunker.feed("0123456789abcdefghij") + chunker.finish()
+    assert chunks[0] == "0123456789" and chunks[1].startswith("6789")
@@ -0,0 +1,215 @@
+import time
+import asyncio
+import tracemalloc
+
+import docx
+import pytest
+
+from backend.rag.document_processor import DocumentProcessor
+from backend.rag.vector_store import VectorStore
+
+PARAGRAPH = "杭州生物医药产业集群近年来保持快速增长，龙头企业带动效应明显，创新药研发与医疗器械制造形成了较完整的产业链。\n"
+
+def write(path, text):
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+async def test_same_filename_without_source_is_a_new_document(workdir):
+    processor = DocumentProcessor()
+    first = await processor.process_document(write(workdir / "a.txt", "杭州新能源产业报告。\n"), filename="report.txt")
+    second = await processor.process_document(write(workdir / "b.txt", "苏州生物医药产业报告。\n"), filename="report.txt")
+
+    assert first != second
+    assert processor.metadata_store.get(first) is not None
+    assert processor.embedding_storage.has_document(first)
+    assert processor.embedding_storage.has_document(second)
+
+async def test_explicit_source_updates_the_previous_version(workdir):
+    processor = DocumentProcessor()
+    first = await processor.process_document(write(workdir / "a.txt", "第一版内容。\n"), source="crm://42")
+    second = await processor.process_document(write(workdir / "b.txt", "第二版内容。\n"), source="crm://42")
+
+    assert first == second
+    assert processor.metadata_store.get(first)["content_hash"] == DocumentProcessor._file_hash(str(workdir / "b.txt"))
+
+async def test_ingestion_memory_does_not_grow_with_file_size(workdir):
+    processor = DocumentProcessor()
+    peaks = {}
+    for size_mb in (0.5, 2):
+        path = workdir / f"yearbook_{size_mb}mb.txt"
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("# 统计年鉴\n")
+            for _ in range(int(size_mb * 1024 * 1024) // len(PARAGRAPH.encode("utf-8"))):
+                f.write(PARAGRAPH)
+        tracemalloc.start()
+        try:
+            doc_id = await processor.process_document(str(path))
+            peaks[size_mb] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        assert processor.metadata_store.get(doc_id)["chunk_count"] > 0
+
+    # Bounded by the read/hash blocks and one embedding batch: four times the text, about the same peak
+    assert peaks[2] < 1.5 * peaks[0.5]
+
+class RecordingEmbedder:
+    def __init__(self):
+        self.inputs = []
+
+    async def embeddings(self, texts):
+        # The embeddings API rejects empty input
+        assert all(text.strip() for text in texts)
+        self.inputs.extend(texts)
+        return [[0.1] * 8 for _ in texts]
+
+async def test_empty_document_is_recorded_without_embedding(workdir):
+    embedder = RecordingEmbedder()
+    processor = DocumentProcessor(openai_handler=embedder)
+    for name, text in (("empty.txt", ""), ("blank.txt", "\n  \n\n")):
+        doc_id = await processor.process_document(write(workdir / name, text))
+        metadata = processor.metadata_store.get(doc_id)
+        assert metadata["chunk_count"] == 0 and metadata["filename"] == name
+        assert not processor.embedding_storage.has_document(doc_id)
+    assert embedder.inputs == []
+
+    # A document emptied in a new version loses its chunks
+    doc_id = await processor.process_document(write(workdir / "v1.txt", "第一版内容。\n"), source="crm://7")
+    assert processor.embedding_storage.has_document(doc_id)
+    await processor.process_document(write(workdir / "v2.txt", "\n"), source="crm://7")
+    assert processor.metadata_store.get(doc_id)["chunks_removed"] == 1
+    assert not processor.embedding_storage.has_document(doc_id)
+
+async def test_file_hashing_and_copy_run_off_the_event_loop(workdir, monkeypatch):
+    processor = DocumentProcessor()
+    file_hash, store_file = processor._file_hash, processor._store_file
+
+    # A large upload, copied across filesystems
+    def slow_file_hash(path):
+        time.sleep(0.3)
+        return file_hash(path)
+
+    def slow_store_file(src_path, dst_path):
+        time.sleep(0.3)
+        store_file(src_path, dst_path)
+
+    monkeypatch.setattr(processor, "_file_hash", slow_file_hash)
+    monkeypatch.setattr(processor, "_store_file", slow_store_file)
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    task = asyncio.create_task(ticker())
+    try:
+        await processor.process_document(write(workdir / "a.txt", "杭州新能源产业报告。\n"))
+    finally:
+        task.cancel()
+    assert ticks >= 30
+
+def live_chunk_ids(storage, doc_id):
+    records, _ = storage.read_log()
+    rows = [r for r in records if r["op"] == "add"]
+    alive = storage.live_mask(records)
+    return sorted(r["chunk_id"] for i, r in enumerate(rows) if alive[i] and r["doc_id"] == doc_id)
+
+async def test_new_version_reembeds_only_changed_chunks(workdir):
+    sections = {
+        "产业规模": "杭州生物医药产业产值三千亿元。",
+        "龙头企业": "龙头企业带动效应明显。",
+        "发展建议": "加快创新药研发。",
+    }
+    def version(sections):
+        return "".join(f"## {title}\n{body}\n\n" for title, body in sections.items())
+
+    embedder = RecordingEmbedder()
+    processor = DocumentProcessor(openai_handler=embedder)
+    doc_id = await processor.process_document(write(workdir / "v1.md", version(sections)), source="crm://9")
+    first = processor.metadata_store.get(doc_id)
+    assert first["chunk_count"] == 3 and first["chunks_recomputed"] == 3
+
+    embedder.inputs.clear()
+    sections["龙头企业"] = "龙头企业数量增至十二家。"
+    del sections["发展建议"]
+    sections["政策支持"] = "设立产业基金。"
+    assert await processor.process_document(write(workdir / "v2.md", version(sections)), source="crm://9") == doc_id
+
+    second = processor.metadata_store.get(doc_id)
+    assert (second["chunks_reused"], second["chunks_recomputed"], second["chunks_removed"]) == (1, 2, 2)
+    assert embedder.inputs == ["## 龙头企业\n龙头企业数量增至十二家。", "## 政策支持\n设立产业基金。"]
+    # The unchanged chunk keeps its ID; new chunks get fresh IDs, removed ones are tombstoned
+    assert live_chunk_ids(processor.embedding_storage, doc_id) == sorted(
+        i for ids in second["chunk_hashes"].values() for i in ids
+    ) == [0, 3, 4]
+
+    # Uploading the same bytes again embeds nothing
+    embedder.inputs.clear()
+    await processor.process_document(str(workdir / "v2.md"), source="crm://9")
+    assert embedder.inputs == [] and processor.metadata_store.get(doc_id)["chunks_reused"] == 3
+
+class FailingEmbedder(RecordingEmbedder):
+    async def embeddings(self, texts):
+        raise RuntimeError("HTTP 500")
+
+@pytest.mark.parametrize("with_index", [False, True])
+async def test_version_without_chunk_hashes_is_replaced_whole(workdir, with_index):
+    def make_processor(embedder):
+        return DocumentProcessor(openai_handler=embedder, vector_store=VectorStore(embedder) if with_index else None)
+
+    sections = [f"## 第{i}节\n{PARAGRAPH}" for i in range(4)]
+    processor = make_processor(RecordingEmbedder())
+    doc_id = await processor.process_document(write(workdir / "v1.md", "\n".join(sections)), source="s")
+    # As recorded before chunk hashes were kept (e.g. imported legacy metadata)
+    legacy = processor.metadata_store.get(doc_id)
+    del legacy["chunk_hashes"]
+    processor.metadata_store.upsert(doc_id, legacy)
+    old_ids = live_chunk_ids(processor.embedding_storage, doc_id)
+    assert len(old_ids) == 4
+
+    # A failed update rolls back only what it wrote
+    processor = make_processor(FailingEmbedder())
+    with pytest.raises(RuntimeError):
+        await processor.process_document(write(workdir / "v2.md", "\n".join(sections[:3])), source="s")
+    assert live_chunk_ids(processor.embedding_storage, doc_id) == old_ids
+
+    processor = make_processor(RecordingEmbedder())
+    await processor.process_document(write(workdir / "v2.md", "\n".join(sections[:3])), source="s")
+    metadata = processor.metadata_store.get(doc_id)
+    assert (metadata["chunks_reused"], metadata["chunks_recomputed"], metadata["chunks_removed"]) == (0, 3, 4)
+    assert live_chunk_ids(processor.embedding_storage, doc_id) == sorted(
+        i for ids in metadata["chunk_hashes"].values() for i in ids
+    ) == [4, 5, 6]
+
+async def test_chunk_count_includes_repeated_chunks(workdir):
+    processor = DocumentProcessor(openai_handler=RecordingEmbedder())
+    text = "## 附表\n单位：亿元\n\n" * 3 + "## 说明\n数据来自统计年鉴。\n"
+    doc_id = await processor.process_document(write(workdir / "tables.md", text))
+    metadata = processor.metadata_store.get(doc_id)
+    assert len(metadata["chunk_hashes"]) == 2
+    assert metadata["chunk_count"] == len(live_chunk_ids(processor.embedding_storage, doc_id)) == 4
+
+async def test_progress_of_pool_extracted_documents(workdir):
+    document = docx.Document()
+    for i in range(12):
+        document.add_heading(f"第{i}节", level=2)
+        document.add_paragraph(PARAGRAPH * 3)
+    document.save(workdir / "report.docx")
+
+    processor = DocumentProcessor(openai_handler=RecordingEmbedder())
+    processor.embedding_flush_size = 2
+    reports = []
+
+    async def progress(fraction, chunks_done):
+        reports.append((fraction, chunks_done))
+
+    await processor.start()
+    try:
+        await processor.process_document(str(workdir / "report.docx"), progress=progress)
+    finally:
+        await processor.close()
+    # A single extracted piece still reports progress as its chunks are embedded
+    fractions = [fraction for fraction, _ in reports]
+    assert len(fractions) >= 5 and fractions == sorted(fractions)
+    assert 0 < fractions[0] < 0.5 < fractions[-1] <= 0.99
@@ -0,0 +1,86 @@
+import asyncio
+
+from backend.models.embedding_batcher import EmbeddingBatcher, TokenBucket
+from backend.models.tokens import estimate_tokens
+
+def make_batcher(send_batch=None, **kwargs):
+    async def echo(texts, **_):
+        return [[float(len(text))] for text in texts]
+    return EmbeddingBatcher(send_batch or echo, **kwargs)
+
+def test_pack_respects_token_and_item_limits_in_order():
+    batcher = make_batcher(max_batch_tokens=10, max_batch_items=3)
+    assert batcher.pack([4, 4, 4, 1, 1, 1, 1, 9, 12, 2]) == [[0, 1], [2, 3, 4], [5, 6], [7], [8], [9]]
+    assert batcher.pack([]) == []
+
+async def test_embed_keeps_input_order_across_concurrent_batches():
+    sent = []
+
+    async def send(texts, model=None):
+        sent.append((list(texts), model))
+        # Later batches finish first
+        await asyncio.sleep(0.05 / len(sent))
+        return [[float(len(text))] for text in texts]
+
+    texts = ["产业" * n for n in range(1, 30)]
+    batcher = make_batcher(send, max_batch_tokens=60, concurrency=4)
+    vectors = await batcher.embed(texts, model="m")
+
+    assert vectors == [[float(len(text))] for text in texts]
+    assert len(sent) > 1 and all(model == "m" for _, model in sent)
+    assert all(sum(estimate_tokens(text) for text in batch) <= 60 or len(batch) == 1 for batch, _ in sent)
+
+async def test_concurrency_limits_batches_in_flight():
+    in_flight, peak = 0, 0
+
+    async def send(texts, **_):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.02)
+        in_flight -= 1
+        return [[0.0]] * len(texts)
+
+    await make_batcher(send, max_batch_items=1, concurrency=3).embed(["文本"] * 12)
+    assert peak == 3
+
+async def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(per_minute=600, capacity=2)
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    for _ in range(3):
+        await bucket.acquire()
+    # 600/min refills one token per 0.1s
+    assert 0.08 <= loop.time() - start < 0.3
+
+async def test_first_failed_batch_cancels_the_others():
+    sent, finished, cancelled = [], [], []
+
+    async def send(texts, **_):
+        sent.extend(texts)
+        if texts == ["失败"]:
+            await asyncio.sleep(0.01)
+            raise RuntimeError("retries exhausted")
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append(texts)
+            raise
+        finished.append(texts)
+        return [[0.0]] * len(texts)
+
+    batcher = make_batcher(send, max_batch_items=1, concurrency=2)
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    try:
+        await batcher.embed(["正常", "失败", "排队1", "排队2"])
+    except RuntimeError as e:
+        assert str(e) == "retries exhausted"
+    else:
+        raise AssertionError("embed should fail")
+    assert loop.time() - start < 0.5
+    # Batches that were sending are cancelled; the last one never reaches the API
+    await asyncio.sleep(0.05)
+    assert finished == []
+    assert ["正常"] in cancelled
+    assert "排队2" not in sent
@@ -0,0 +1,76 @@
+import json
+import itertools
+
+import httpx
+import pytest
+
+from backend.models import embedding_cache
+from backend.models.embedding_cache import EmbeddingCache
+from backend.models.openai_handler import OpenAIHandler
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"), max_entries=10)
+    yield cache
+    cache.close()
+
+async def test_normalised_text_hits_per_model_and_counters(cache):
+    await cache.put_many(["杭州 新能源"], "m1", [[1.0, 2.0]])
+    # Full-width space and trailing whitespace normalise to the same key
+    assert await cache.get_many(["杭州　新能源\n", "苏州"], "m1") == [[1.0, 2.0], None]
+    assert await cache.get_many(["杭州 新能源"], "m2") == [None]
+    assert cache.stats() == {"hits": 1, "misses": 2, "hit_rate": pytest.approx(1 / 3)}
+
+async def test_least_recently_used_entries_are_evicted_in_batches(cache, monkeypatch):
+    ticks = itertools.count(1000)
+    monkeypatch.setattr(embedding_cache.time, "time", lambda: float(next(ticks)))
+    counts = []
+    cache._conn.set_trace_callback(lambda sql: counts.append(sql) if "COUNT(*)" in sql else None)
+
+    for i in range(10):
+        await cache.put_many([f"文本{i}"], "m", [[float(i)]])
+    # Under the limit: no table scan per put
+    assert counts == []
+    await cache.get_many(["文本0", "文本1"], "m")
+
+    await cache.put_many(["文本10"], "m", [[10.0]])
+    # Evicted down to 90% of the limit, least recently used first
+    assert len(counts) == 1
+    found = await cache.get_many([f"文本{i}" for i in range(11)], "m")
+    assert [i for i, vector in enumerate(found) if vector is not None] == [0, 1, 4, 5, 6, 7, 8, 9, 10]
+
+    # The next count is only due once the puts could reach the limit again
+    await cache.put_many(["文本11"], "m", [[11.0]])
+    assert len(counts) == 1
+
+async def test_handler_keys_text_embedding_3_entries_by_output_dimensions(workdir, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setenv("EMBEDDING_CACHE_PATH", str(workdir / "cache.sqlite"))
+    requests = []
+
+    def respond(request):
+        payload = json.loads(request.content)
+        requests.append((payload["model"], payload.get("dimensions"), payload["input"]))
+        dimensions = payload.get("dimensions") or 4
+        return httpx.Response(200, json={"data": [
+            {"index": i, "embedding": [0.5] * dimensions} for i in range(len(payload["input"]))
+        ]})
+
+    handler = OpenAIHandler()
+    handler.client = httpx.AsyncClient(transport=httpx.MockTransport(respond))
+    try:
+        handler.embedding_dimensions = 256
+        # Duplicates within a call are requested once
+        assert len((await handler.embeddings(["杭州", "杭州 "]))[1]) == 256
+        assert len((await handler.embeddings(["杭州"]))[0]) == 256
+        handler.embedding_dimensions = 512
+        assert len((await handler.embeddings(["杭州"]))[0]) == 512
+        # Models without a dimensions parameter are keyed by name only
+        await handler.embeddings(["杭州"], model="text-embedding-ada-002")
+        await handler.embeddings(["杭州"], model="text-embedding-ada-002")
+    finally:
+        await handler.close()
+    assert [(model, dimensions) for model, dimensions, _ in requests] == [
+        ("text-embedding-3-large", 256), ("text-embedding-3-large", 512), ("text-embedding-ada-002", None)
+    ]
+    assert requests[0][2] == ["杭州"]
@@ -0,0 +1,56 @@
+import random
+
+import pytest
+
+from backend.rag.entity_tagger import EntityTagger, load_dictionary
+
+ENTRIES = [
+    ("industry", "新能源汽车", ["新能源汽车", "电动汽车"]),
+    ("industry", "新能源", ["新能源"]),
+    ("industry", "汽车", ["汽车"]),
+    ("region", "杭州", ["杭州", "杭州市"]),
+    ("region", "州市", ["州市"]),
+]
+
+def test_leftmost_longest_matches_and_aliases():
+    tagger = EntityTagger(ENTRIES)
+    tags = tagger.tag("杭州市新能源汽车产业，电动汽车与新能源并进；汽车零部件在杭州。")
+    assert tags == {
+        "industry": {"新能源汽车": 2, "新能源": 1, "汽车": 1},
+        "region": {"杭州": 2},
+    }
+
+def test_primary_prefers_frequency_then_dictionary_order():
+    tagger = EntityTagger(ENTRIES)
+    assert tagger.primary({"汽车": 2, "新能源": 2}) == "新能源"
+    assert tagger.primary({"汽车": 3, "新能源": 2}) == "汽车"
+    assert tagger.primary({}) is None
+
+def test_matches_across_piece_boundaries():
+    tagger = EntityTagger(ENTRIES)
+    text = "杭州市新能源汽车产业，电动汽车与新能源并进；汽车零部件在杭州。" * 20
+    scanner = tagger.scanner()
+    for start in range(0, len(text), 3):
+        scanner.feed(text[start:start + 3])
+    assert scanner.result() == tagger.tag(text)
+
+def test_counts_match_a_naive_scan_on_a_large_dictionary():
+    rng = random.Random(3)
+    alphabet = "的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产"
+    names = sorted({"".join(rng.choice(alphabet) for _ in range(rng.randint(2, 6))) for _ in range(3000)})
+    # Names that contain another name would be counted differently by leftmost-longest
+    names = [name for name in names if not any(other != name and other in name for other in names)]
+    tagger = EntityTagger([("industry", name, [name]) for name in names])
+    mentions = rng.sample(names, 200)
+    text = "，".join(mention + "".join(rng.choice("，。、；") for _ in range(3)) for mention in mentions * 3)
+
+    counts = tagger.tag(text)["industry"]
+    assert counts == {name: text.count(name) for name in names if text.count(name)}
+
+def test_load_dictionary(tmp_path):
+    path = tmp_path / "entities.tsv"
+    path.write_text("# 注释\n\nregion\t杭州\t杭州市\nindustry\t新能源\n", encoding="utf-8")
+    assert load_dictionary(str(path)) == [("region", "杭州", ["杭州", "杭州市"]), ("industry", "新能源", ["新能源"])]
+    path.write_text("region\n", encoding="utf-8")
+    with pytest.raises(ValueError):
+        load_dictionary(str(path))
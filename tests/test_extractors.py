@@ -0,0 +1,116 @@
+import os
+import time
+import asyncio
+
+import docx
+import openpyxl
+import pytest
+from PyPDF2 import PdfWriter
+
+from backend.rag.extractors import TextExtractor
+
+def blank_pdf(path, pages):
+    writer = PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(width=200, height=200)
+    with open(path, "wb") as f:
+        writer.write(f)
+    return str(path)
+
+def text_pdf(path, page_texts):
+    """Minimal PDF with one line of Helvetica text per page"""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for text in page_texts:
+        stream = f"BT /F1 12 Tf 40 150 Td ({text}) Tj ET".encode()
+        objects.append(b"<< /Length " + str(len(stream)).encode() + b" >>\nstream\n" + stream + b"\nendstream")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 200 200] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>".encode()
+        )
+        page_ids.append(len(objects))
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in page_ids)}] /Count {len(page_ids)} >>".encode()
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    path.write_bytes(bytes(out))
+    return str(path)
+
+@pytest.fixture
+async def extractor():
+    extractor = TextExtractor(max_workers=2, pages_per_task=2, timeout=30)
+    await extractor.start()
+    yield extractor
+    await extractor.close()
+
+async def test_pdf_page_ranges_are_yielded_in_page_order(tmp_path, extractor):
+    pages = [f"Page {i} output grew {i} percent" for i in range(7)]
+    extracted = []
+    path = text_pdf(tmp_path / "report.pdf", pages)
+    pieces = [piece async for piece in extractor.iter_text(path, ".pdf", progress=extracted.append)]
+    # Ranges [0,2) [2,4) [4,6) [6,7)
+    assert len(pieces) == 4
+    assert extracted == [2 / 7, 4 / 7, 6 / 7, 1.0]
+    text = "".join(pieces)
+    assert [text.index(page) for page in pages] == sorted(text.index(page) for page in pages)
+
+async def test_docx_headings_and_tables_and_xlsx_rows(tmp_path, extractor):
+    document = docx.Document()
+    document.add_heading("杭州生物医药产业集群", level=1)
+    document.add_heading("产业规模", level=2)
+    document.add_paragraph("产值增长12%。")
+    table = document.add_table(rows=1, cols=2)
+    table.rows[0].cells[0].text, table.rows[0].cells[1].text = "企业数", "350"
+    document.save(tmp_path / "report.docx")
+    (text,) = [piece async for piece in extractor.iter_text(str(tmp_path / "report.docx"), ".docx")]
+    assert text == "# 杭州生物医药产业集群\n## 产业规模\n产值增长12%。\n企业数\t350\n"
+
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.title = "产值"
+    sheet.append(["地区", "产值"])
+    sheet.append([None, None])
+    sheet.append(["杭州", 3200])
+    workbook.save(tmp_path / "data.xlsx")
+    (text,) = [piece async for piece in extractor.iter_text(str(tmp_path / "data.xlsx"), ".xlsx")]
+    assert text == "# 产值\n地区\t产值\n杭州\t3200\n"
+
+async def test_time_spent_by_the_consumer_does_not_count_against_the_timeout(tmp_path):
+    extractor = TextExtractor(max_workers=2, pages_per_task=1, timeout=1.0)
+    await extractor.start()
+    try:
+        pieces = []
+        async for piece in extractor.iter_text(blank_pdf(tmp_path / "a.pdf", 6), ".pdf"):
+            pieces.append(piece)
+            # Embedding the previous pages, 2.4s in all
+            await asyncio.sleep(0.4)
+    finally:
+        await extractor.close()
+    assert len(pieces) == 6
+
+async def test_a_stuck_task_does_not_kill_other_files_tasks(tmp_path):
+    extractor = TextExtractor(max_workers=2, timeout=1.0)
+    await extractor.start()
+    try:
+        stuck = asyncio.create_task(extractor._run(time.sleep, 30))
+        await asyncio.sleep(0.5)
+        # Still running in the same pool when the stuck task times out
+        other = asyncio.create_task(extractor._run(time.sleep, 0.8))
+        with pytest.raises(asyncio.TimeoutError):
+            await stuck
+        assert await other is None
+        # New work goes to a fresh pool
+        assert await extractor._run(os.getpid) != os.getpid()
+        for _ in range(50):
+            if not extractor._retired:
+                break
+            await asyncio.sleep(0.1)
+        assert not extractor._retired
+    finally:
+        await extractor.close()
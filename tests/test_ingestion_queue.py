@@ -0,0 +1,189 @@
+import time
+import asyncio
+
+from backend.rag.ingestion_queue import (
+    CANCELLED, FAILED, FINAL_STATES, SUCCEEDED, IngestionQueue, SQLiteJobStore
+)
+
+class FakeMetadataStore:
+    def __init__(self):
+        self.documents = {}
+
+    def get(self, doc_id):
+        return self.documents.get(doc_id)
+
+class FakeProcessor:
+    """Stands in for DocumentProcessor: takes `duration` seconds, reporting progress every `step`"""
+
+    def __init__(self, duration=0.0, step=None, failures=0):
+        self.duration = duration
+        self.step = step
+        self.failures = failures
+        self.calls = 0
+        self.rollbacks = 0
+        self.metadata_store = FakeMetadataStore()
+
+    async def process_document(self, file_path, progress=None, filename=None):
+        self.calls += 1
+        elapsed = 0.0
+        try:
+            while elapsed < self.duration:
+                await asyncio.sleep(self.step or self.duration)
+                elapsed += self.step or self.duration
+                if self.step is not None and progress is not None:
+                    await progress(elapsed / self.duration, int(elapsed / self.step))
+        except Exception:
+            # DocumentProcessor deletes the partially written document here
+            self.rollbacks += 1
+            raise
+        if self.calls <= self.failures:
+            raise RuntimeError("embedding API unavailable")
+        doc_id = f"doc-{filename}"
+        self.metadata_store.documents[doc_id] = {"id": doc_id}
+        return doc_id
+
+def upload(workdir, name):
+    path = workdir / name
+    path.write_text("内容", encoding="utf-8")
+    return str(path)
+
+async def wait_final(queue, job_id, timeout=10.0):
+    for _ in range(int(timeout / 0.02)):
+        job = await queue.get(job_id)
+        if job["status"] in FINAL_STATES:
+            return job
+        await asyncio.sleep(0.02)
+    raise AssertionError(f"job {job_id} did not finish: {job}")
+
+async def test_heartbeat_keeps_a_silent_job_leased(workdir):
+    # Runs for several leases without a single progress report
+    processor = FakeProcessor(duration=1.0)
+    queue = IngestionQueue(processor, store=SQLiteJobStore("./data/jobs.sqlite"), workers=2, lease=0.3, poll_interval=0.02)
+    queue.start()
+    try:
+        job, created = await queue.submit(upload(workdir, "a.txt"), job_id="job-a")
+        job = await wait_final(queue, job["id"])
+    finally:
+        await queue.stop()
+    assert created
+    assert job["status"] == SUCCEEDED
+    assert job["attempts"] == 1
+    assert processor.calls == 1
+
+async def test_cancel_stops_a_running_job_at_its_next_progress_report(workdir):
+    processor = FakeProcessor(duration=5.0, step=0.05)
+    queue = IngestionQueue(processor, store=SQLiteJobStore("./data/jobs.sqlite"), workers=1, lease=5.0, poll_interval=0.02)
+    queue.start()
+    try:
+        path = upload(workdir, "b.txt")
+        job, _ = await queue.submit(path, job_id="job-b")
+        while (await queue.get(job["id"]))["status"] != "running":
+            await asyncio.sleep(0.02)
+        await queue.cancel(job["id"])
+        job = await wait_final(queue, job["id"])
+    finally:
+        await queue.stop()
+    assert job["status"] == CANCELLED
+    assert processor.rollbacks == 1
+    assert not (workdir / "b.txt").exists()
+
+async def test_cancel_of_a_queued_job_never_runs_it(workdir):
+    processor = FakeProcessor()
+    queue = IngestionQueue(processor, store=SQLiteJobStore("./data/jobs.sqlite"), workers=0)
+    job, _ = await queue.submit(upload(workdir, "c.txt"), job_id="job-c")
+    job = await queue.cancel(job["id"])
+    assert job["status"] == CANCELLED
+    assert processor.calls == 0
+
+async def test_resubmitting_a_known_job_is_idempotent(workdir):
+    queue = IngestionQueue(FakeProcessor(), store=SQLiteJobStore("./data/jobs.sqlite"), workers=0)
+    first, created = await queue.submit(upload(workdir, "d.txt"), job_id="same")
+    second, created_again = await queue.submit(upload(workdir, "e.txt"), job_id="same")
+    assert created and not created_again
+    assert second["file_path"] == first["file_path"]
+
+async def test_worker_that_lost_its_lease_stops_without_finishing_the_job(workdir):
+    store = SQLiteJobStore("./data/jobs.sqlite")
+    processor = FakeProcessor(duration=5.0, step=0.05)
+    queue = IngestionQueue(processor, store=store, workers=1, lease=5.0, poll_interval=0.02)
+    queue.start()
+    try:
+        path = upload(workdir, "f.txt")
+        job, _ = await queue.submit(path, job_id="job-f")
+        while (await queue.get(job["id"]))["status"] != "running":
+            await asyncio.sleep(0.02)
+        # Another worker re-claims the job (as after an expired lease)
+        store._update(job["id"], {"worker": "other-worker"}, None)
+        await asyncio.sleep(0.3)
+        job = await queue.get(job["id"])
+    finally:
+        await queue.stop()
+    assert job["status"] == "running" and job["worker"] == "other-worker"
+    assert (workdir / "f.txt").exists()
+    assert processor.calls == 1
+    assert processor.rollbacks == 0
+
+async def test_resubmitting_a_document_that_was_deleted_ingests_it_again(workdir):
+    processor = FakeProcessor()
+    queue = IngestionQueue(processor, store=SQLiteJobStore("./data/jobs.sqlite"), workers=1, poll_interval=0.02)
+    queue.start()
+    try:
+        job, _ = await queue.submit(upload(workdir, "g.txt"), filename="g.txt", job_id="sha-g")
+        job = await wait_final(queue, job["id"])
+        assert job["status"] == SUCCEEDED
+
+        unchanged, created = await queue.submit(upload(workdir, "g2.txt"), filename="g.txt", job_id="sha-g")
+        assert not created and unchanged["status"] == SUCCEEDED
+
+        del processor.metadata_store.documents[job["doc_id"]]
+        job, created = await queue.submit(upload(workdir, "g3.txt"), filename="g.txt", job_id="sha-g")
+        assert created
+        job = await wait_final(queue, job["id"])
+    finally:
+        await queue.stop()
+    assert job["status"] == SUCCEEDED
+    assert processor.calls == 2
+
+async def test_workers_process_jobs_concurrently_and_submit_does_not_wait(workdir):
+    processor = FakeProcessor(duration=0.3)
+    queue = IngestionQueue(processor, store=SQLiteJobStore("./data/jobs.sqlite"), workers=4, poll_interval=0.02)
+    queue.start()
+    try:
+        start = time.monotonic()
+        jobs = [(await queue.submit(upload(workdir, f"{i}.txt"), filename=f"{i}.txt"))[0] for i in range(4)]
+        assert time.monotonic() - start < 0.3
+        jobs = [await wait_final(queue, job["id"]) for job in jobs]
+        elapsed = time.monotonic() - start
+    finally:
+        await queue.stop()
+    assert all(job["status"] == SUCCEEDED for job in jobs)
+    assert elapsed < 0.9
+
+async def test_job_of_a_dead_worker_is_reclaimed_after_its_lease(workdir):
+    store = SQLiteJobStore("./data/jobs.sqlite")
+    processor = FakeProcessor()
+    queue = IngestionQueue(processor, store=store, workers=1, lease=0.2, poll_interval=0.02)
+    job, _ = await queue.submit(upload(workdir, "h.txt"), job_id="job-h")
+    # A worker claims the job and dies without renewing its lease
+    assert (await store.claim("dead-worker", 0.2))["id"] == "job-h"
+    queue.start()
+    try:
+        job = await wait_final(queue, job["id"])
+    finally:
+        await queue.stop()
+    assert job["status"] == SUCCEEDED
+    assert job["attempts"] == 2 and job["worker"] != "dead-worker"
+
+async def test_failed_attempts_are_retried_up_to_max_attempts(workdir, monkeypatch):
+    monkeypatch.setenv("INGEST_RETRY_BASE_DELAY", "0.01")
+    processor = FakeProcessor(failures=5)
+    queue = IngestionQueue(processor, store=SQLiteJobStore("./data/jobs.sqlite"), workers=1, max_attempts=3, poll_interval=0.02)
+    queue.start()
+    try:
+        job, _ = await queue.submit(upload(workdir, "i.txt"), job_id="job-i")
+        job = await wait_final(queue, job["id"])
+    finally:
+        await queue.stop()
+    assert job["status"] == FAILED and job["error"] == "embedding API unavailable"
+    assert processor.calls == 3
+    assert not (workdir / "i.txt").exists()
@@ -0,0 +1,92 @@
+import random
+
+import numpy as np
+
+from backend.rag.lexical_index import BM25_B, BM25_K1, IMPACT_SCALE, BM25Index, reciprocal_rank_fusion, tokenize_batch
+
+WORDS = ["产业", "集群", "生物", "医药", "新能源", "汽车", "杭州", "苏州", "研发", "投入", "企业", "产值", "增长", "政策"]
+
+def corpus(n, seed=0):
+    rng = random.Random(seed)
+    # Zipf-like: early words are much more frequent
+    weights = [1 / (i + 1) for i in range(len(WORDS))]
+    return ["".join(rng.choices(WORDS, weights, k=rng.randint(3, 30))) + "。" for _ in range(n)]
+
+def build(texts):
+    index = BM25Index()
+    index.sync(len(texts), lambda start, stop: texts[start:stop])
+    return index
+
+def reference_scores(texts, query):
+    """Plain BM25 with the index's tokenisation"""
+    terms, rows = tokenize_batch(texts)
+    lengths = np.bincount(rows, minlength=len(texts))
+    avg_length = lengths.sum() / len(texts)
+    scores = np.zeros(len(texts))
+    for term in np.unique(tokenize_batch([query])[0]):
+        tf = np.bincount(rows[terms == term], minlength=len(texts))
+        df = np.count_nonzero(tf)
+        if df == 0:
+            continue
+        idf = np.log(1 + (len(texts) - df + 0.5) / (df + 0.5))
+        scores += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * lengths / avg_length))
+    return scores
+
+def test_tokenize_cjk_bigrams_lone_characters_and_ascii_words():
+    terms, rows = tokenize_batch(["杭州新能源", "A股 IPO", "乙"])
+    bigrams = {(ord(a) << 21) | ord(b) for a, b in ["杭州", "州新", "新能", "能源"]}
+    assert set(terms[rows == 0].tolist()) == bigrams
+    assert len(terms[rows == 1]) == 3  # 股 (lone CJK), "a", "ipo"
+    assert terms[rows == 2].tolist() == [ord("乙")]
+
+def test_search_matches_plain_bm25():
+    texts = corpus(3000)
+    index = build(texts)
+    rng = random.Random(1)
+    for _ in range(30):
+        query = "".join(rng.sample(WORDS, rng.randint(1, 4)))
+        rows, scores = index.search(query, 10)
+        expected = reference_scores(texts, query)
+        # Impacts are quantised to 8 bits per term
+        tolerance = 4 * np.log(1 + len(texts)) / IMPACT_SCALE
+        np.testing.assert_allclose(scores, expected[rows], atol=tolerance)
+        # Pruning never drops a row that belongs in the top 10
+        assert scores[-1] >= np.sort(expected)[-10] - 2 * tolerance
+
+def test_rare_terms_outrank_common_ones_and_mask_filters():
+    texts = ["杭州产业集群产业集群。", "苏州政策。", "杭州产业集群。", "苏州产业集群政策。"]
+    index = build(texts)
+    rows, _ = index.search("苏州的政策", 4)
+    assert rows.tolist()[:2] == [1, 3]
+    mask = np.array([True, False, True, False])
+    rows, _ = index.search("苏州的政策", 4, mask=mask)
+    assert rows.tolist() == []
+    rows, _ = index.search("产业集群", 4, mask=mask)
+    assert sorted(rows.tolist()) == [0, 2]
+    assert index.search("没有的词", 4)[0].tolist() == []
+
+def test_incremental_segments_and_persistence_give_the_same_results(tmp_path):
+    texts = corpus(5000, seed=2)
+    whole = build(texts)
+    incremental = BM25Index(str(tmp_path / "bm25"))
+    for end in range(700, 5000 + 700, 700):
+        incremental.sync(min(end, 5000), lambda start, stop: texts[start:stop])
+    incremental.save()
+    assert len(incremental.segments) < 8
+    reloaded = BM25Index(str(tmp_path / "bm25"))
+    assert reloaded.ntotal == 5000
+
+    for query in ["杭州新能源汽车", "研发投入增长", "苏州政策"]:
+        expected_rows, expected_scores = whole.search(query, 10)
+        for index in (incremental, reloaded):
+            rows, scores = index.search(query, 10)
+            # Segments built at different times use slightly different average lengths
+            np.testing.assert_allclose(scores, expected_scores, rtol=0.05)
+            assert len(set(rows.tolist()) & set(expected_rows.tolist())) >= 8
+
+def test_reciprocal_rank_fusion():
+    rows, scores = reciprocal_rank_fusion([np.array([3, 1, 2]), np.array([1, 4]), np.array([])], k=3, rrf_k=60)
+    # 1 is second and first; 3 and 4 tie and are ordered by row
+    assert rows.tolist() == [1, 3, 4]
+    assert np.isclose(scores[0], 1 / 62 + 1 / 61)
+    assert reciprocal_rank_fusion([], k=3)[0].tolist() == []
@@ -0,0 +1,66 @@
+import json
+
+import numpy as np
+
+from backend.rag.metadata_store import MetadataStore
+from backend.rag.vector_store import VectorStore
+
+def document(doc_id, **fields):
+    return {"id": doc_id, "title": doc_id, **fields}
+
+def test_writers_and_readers_share_changes_by_version(tmp_path):
+    path = str(tmp_path / "metadata.sqlite")
+    writer, reader = MetadataStore(path), MetadataStore(path)
+    seen, changed = reader.changes()
+    assert (seen, changed) == (0, {})
+
+    writer.upsert("a", document("a", industry="新能源"))
+    writer.upsert("b", document("b"))
+    # Nothing changed for a poll at the current version
+    assert reader.version == 2
+    seen, changed = reader.changes(seen)
+    assert seen == 2 and set(changed) == {"a", "b"}
+    assert reader.changes(seen) == (2, {})
+
+    writer.upsert("a", document("a", industry="生物医药"))
+    writer.delete("b")
+    seen, changed = reader.changes(seen)
+    assert seen == 4
+    assert changed == {"a": document("a", industry="生物医药"), "b": None}
+    assert reader.get("b") is None and reader.get("a")["industry"] == "生物医药"
+
+def test_find_returns_the_latest_document_by_content_hash_or_source(tmp_path):
+    store = MetadataStore(str(tmp_path / "metadata.sqlite"))
+    store.upsert("old", document("old", content_hash="h1", source="crm://1", processed_date="2024-01-01T00:00:00"))
+    store.upsert("new", document("new", content_hash="h2", source="crm://1", processed_date="2024-02-01T00:00:00"))
+    assert store.find(source="crm://1")["id"] == "new"
+    assert store.find(content_hash="h1")["id"] == "old"
+    assert store.find(content_hash="h3") is None
+    store.delete("new")
+    assert store.find(source="crm://1")["id"] == "old"
+
+def test_legacy_json_is_imported_once(tmp_path):
+    legacy = tmp_path / "document_metadata.json"
+    legacy.write_text(json.dumps({"a": document("a"), "b": document("b")}, ensure_ascii=False), encoding="utf-8")
+    store = MetadataStore(str(tmp_path / "metadata.sqlite"), legacy_json_path=str(legacy))
+    assert store.version == 2 and store.get("b") == document("b")
+    assert not legacy.exists() and (tmp_path / "document_metadata.json.imported").exists()
+
+    # A store that already has documents never imports over them
+    legacy.write_text(json.dumps({"c": document("c")}), encoding="utf-8")
+    store = MetadataStore(str(tmp_path / "metadata.sqlite"), legacy_json_path=str(legacy))
+    assert store.get("c") is None and store.version == 2
+
+async def test_vector_store_filters_pick_up_metadata_written_by_another_worker(workdir):
+    class Embedder:
+        async def embeddings(self, texts, model=None):
+            return [[1.0, 0.0] for _ in texts]
+
+    store = VectorStore(Embedder())
+    store.storage.append("doc", [0], np.asarray([[1.0, 0.0]], dtype=np.float32), ["杭州新能源"])
+    assert await store.search("新能源", region="杭州") == ("", [])
+
+    # Another process (e.g. an ingestion worker) records the document's metadata
+    MetadataStore().upsert("doc", document("doc", region="杭州"))
+    context, sources = await store.search("新能源", region="杭州")
+    assert context == "杭州新能源" and sources[0]["title"] == "doc"
@@ -0,0 +1,55 @@
+import json
+
+import numpy as np
+
+from backend.rag.embedding_storage import EmbeddingStorage
+from backend.rag.migrate_embeddings import migrate
+
+def write_legacy(data_dir, doc_id, chunks):
+    (data_dir / "embeddings").mkdir(parents=True, exist_ok=True)
+    (data_dir / "chunks").mkdir(parents=True, exist_ok=True)
+    embeddings = [
+        {"chunk_id": i, "embedding": [1.0, float(i)], "text": chunk[:2]}
+        for i, chunk in enumerate(chunks)
+    ]
+    (data_dir / "embeddings" / f"{doc_id}_embeddings.json").write_text(json.dumps(embeddings), encoding="utf-8")
+    (data_dir / "chunks" / f"{doc_id}_chunks.json").write_text(json.dumps(chunks, ensure_ascii=False), encoding="utf-8")
+
+def test_migration_reads_the_row_log_once_and_skips_imported_documents(tmp_path, monkeypatch):
+    for doc in range(20):
+        write_legacy(tmp_path, f"doc{doc}", [f"第{doc}篇第一段", f"第{doc}篇第二段"])
+    read = []
+    read_log = EmbeddingStorage.read_log
+
+    def counting_read_log(self, start=0):
+        records, offset = read_log(self, start)
+        read.extend(records)
+        return records, offset
+
+    monkeypatch.setattr(EmbeddingStorage, "read_log", counting_read_log)
+
+    assert migrate(str(tmp_path)) == 20
+    # Appends only tail the log; no full re-read per document
+    assert len(read) <= 2 * 40
+    storage = EmbeddingStorage(str(tmp_path / "vectors"))
+    records, _ = storage.read_log()
+    assert len(records) == 40
+    record = next(r for r in records if r["doc_id"] == "doc1" and r["chunk_id"] == 1)
+    # Full chunk text, not the preview in the embedding file
+    assert storage.read_text(record["offset"], record["length"]) == "第1篇第二段"
+
+    # A rerun imports only new files
+    write_legacy(tmp_path, "doc20", ["新文档"])
+    assert migrate(str(tmp_path), delete=True) == 1
+    assert storage.live_documents() == {f"doc{doc}" for doc in range(21)}
+    assert not list((tmp_path / "embeddings").iterdir())
+
+def test_live_documents_follow_deletions(tmp_path):
+    storage = EmbeddingStorage(str(tmp_path))
+    vectors = np.ones((2, 2), dtype=np.float32)
+    storage.append("a", [0, 1], vectors, ["一", "二"])
+    storage.append("b", [0, 1], vectors, ["一", "二"])
+    storage.delete("a", [0])
+    storage.delete("b")
+    assert storage.live_documents() == {"a"}
+    assert storage.has_document("a") and not storage.has_document("b")
@@ -0,0 +1,79 @@
+import json
+import asyncio
+
+import pytest
+
+from backend.models.openai_handler import OpenAIHandler
+
+CHAT_RESPONSE = json.dumps({"choices": [{"message": {"role": "assistant", "content": "好"}}]}).encode("utf-8")
+
+class KeepAliveServer:
+    """Local HTTP/1.1 server answering every request with a chat completion; counts TCP connections"""
+
+    def __init__(self):
+        self.connections = 0
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                header = await reader.readuntil(b"\r\n\r\n")
+                length = next(
+                    (int(line.split(b":", 1)[1]) for line in header.split(b"\r\n")
+                     if line.lower().startswith(b"content-length:")),
+                    0
+                )
+                await reader.readexactly(length)
+                await asyncio.sleep(0.01)
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    b"Content-Length: " + str(len(CHAT_RESPONSE)).encode() + b"\r\n\r\n" + CHAT_RESPONSE
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+@pytest.fixture
+async def server_url():
+    server = KeepAliveServer()
+    listener = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+    yield server, f"http://127.0.0.1:{listener.sockets[0].getsockname()[1]}"
+    listener.close()
+
+@pytest.fixture
+def handler_env(workdir, monkeypatch, server_url):
+    server, url = server_url
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setenv("OPENAI_BASE_URL", url)
+    monkeypatch.setenv("OPENAI_HTTP2", "false")
+    monkeypatch.setenv("OPENAI_MAX_KEEPALIVE", "20")
+    monkeypatch.setenv("RESPONSE_CACHE", "false")
+    monkeypatch.setenv("EMBEDDING_CACHE", "false")
+    return server
+
+async def test_concurrent_chats_reuse_pooled_connections(handler_env):
+    handler = OpenAIHandler()
+    await handler.start()
+    try:
+        for _ in range(3):
+            results = await asyncio.gather(*[
+                handler.chat_completion(messages=[{"role": "user", "content": "你好"}]) for _ in range(20)
+            ])
+            assert all(result["choices"][0]["message"]["content"] == "好" for result in results)
+    finally:
+        await handler.close()
+    # A client per request would have opened 60
+    assert handler_env.connections <= 20
+
+async def test_start_is_idempotent_and_close_releases_the_client(handler_env):
+    handler = OpenAIHandler()
+    client = await handler.start()
+    assert await handler.start() is client
+    await handler.close()
+    assert client.is_closed and handler.client is None
+    # A request after close (e.g. from a background task during shutdown) gets a new client
+    await handler.chat_completion(messages=[{"role": "user", "content": "你好"}])
+    assert handler.client is not client
+    await handler.close()
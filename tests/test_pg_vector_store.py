@@ -0,0 +1,128 @@
+import os
+import json
+
+import httpx
+import numpy as np
+import pytest
+
+from backend.models.openai_handler import OpenAIHandler
+from backend.rag.pg_vector_store import PgVectorStore
+from pgvector_stand_in import SCHEMA_PATH, StandInPool, schema_dimensions
+
+DIMENSIONS = schema_dimensions()
+
+def basis(i, j=None):
+    """Unit vector along axis i (or halfway between axes i and j)"""
+    vector = np.zeros(DIMENSIONS, dtype=np.float32)
+    vector[i] = 1.0
+    if j is not None:
+        vector[j] = 1.0
+    return (vector / np.linalg.norm(vector)).tolist()
+
+class FakeEmbedder:
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    async def embeddings(self, texts, **kwargs):
+        return [self.vectors[text] for text in texts]
+
+def chunk(chunk_id, text, vector, tags=None):
+    return {"chunk_id": chunk_id, "text": text, "embedding": vector, "tags": tags or {}}
+
+@pytest.fixture(params=["stand-in", "postgres"])
+async def store(request, workdir):
+    """PgVectorStore on the in-process stand-in, and on a real database when TEST_VECTOR_DB_URL is set"""
+    embedder = FakeEmbedder({"新能源": basis(0), "生物医药": basis(1), "新能源电池": basis(0, 2)})
+    if request.param == "stand-in":
+        yield PgVectorStore(embedder, pool=StandInPool())
+        return
+    dsn = os.getenv("TEST_VECTOR_DB_URL")
+    if not dsn:
+        pytest.skip("TEST_VECTOR_DB_URL not set")
+    # Every ivfflat list is scanned, so the tiny test corpus is found whatever the centroids
+    store = PgVectorStore(embedder, dsn=dsn, min_pool_size=1, max_pool_size=2, probes=100)
+    pool = await store.connect()
+    with open(SCHEMA_PATH, "r", encoding="utf-8") as f:
+        schema = f.read()
+    async with pool.acquire() as conn:
+        await conn.execute(schema)
+        await conn.execute("TRUNCATE document_chunks CASCADE")
+    yield store
+    await store.close()
+
+async def test_search_many_applies_each_querys_filters(store):
+    tags = {"companies": ["宁德时代"]}
+    await store.add_embeddings([chunk(0, "杭州电池产业", basis(0), tags), chunk(1, "杭州光伏产业", basis(0, 2))], "doc-hz")
+    await store.set_document_metadata("doc-hz", {"title": "杭州报告", "industry": "新能源", "region": "杭州"})
+    await store.add_embeddings([chunk(0, "苏州生物医药", basis(1))], "doc-sz")
+    await store.set_document_metadata("doc-sz", {"title": "苏州报告", "industry": "生物医药", "region": "苏州"})
+
+    results = await store.search_many(
+        ["新能源", "生物医药", "新能源"],
+        [{"region": "杭州"}, None, {"region": "苏州"}],
+        top_k=2
+    )
+
+    context, sources = results[0]
+    assert context.split("\n\n") == ["杭州电池产业", "杭州光伏产业"]
+    assert [source["title"] for source in sources] == ["杭州报告", "杭州报告"]
+    assert sources[0]["score"] == pytest.approx(1.0, abs=1e-5)
+    # Same fields as VectorStore sources
+    assert sources[0] == {
+        "title": "杭州报告", "score": sources[0]["score"], "dense_score": sources[0]["score"], "bm25_score": None,
+        "industry": "新能源", "region": "杭州", "tags": tags
+    }
+    assert sources[1]["tags"] == {}
+    assert results[1][0].split("\n\n")[0] == "苏州生物医药"
+    # The Suzhou document is orthogonal to the query
+    assert results[2] == ("", [])
+
+async def test_add_embeddings_appends_batches_and_replaces_on_reingestion(store):
+    await store.add_embeddings([chunk(0, "第一批", basis(0))], "doc")
+    await store.add_embeddings([chunk(1, "第二批", basis(0, 2))], "doc", replace=False)
+    context, _ = (await store.search_many(["新能源"], top_k=5))[0]
+    assert context.split("\n\n") == ["第一批", "第二批"]
+
+    await store.add_embeddings([chunk(0, "新版本", basis(0))], "doc")
+    context, _ = (await store.search_many(["新能源"], top_k=5))[0]
+    assert context == "新版本"
+
+async def test_delete_chunks_removes_only_the_given_chunks(store):
+    await store.add_embeddings([chunk(i, f"分块{i}", basis(0, i + 2)) for i in range(3)], "doc")
+    await store.delete_chunks("doc", [1])
+    context, _ = (await store.search_many(["新能源"], top_k=5))[0]
+    assert sorted(context.split("\n\n")) == ["分块0", "分块2"]
+    assert await store.chunk_ids("doc") == [0, 2]
+
+    await store.delete_document("doc")
+    assert (await store.search_many(["新能源"], top_k=5))[0] == ("", [])
+
+async def test_vectors_of_another_size_are_rejected_atomically(store):
+    await store.add_embeddings([chunk(0, "保留", basis(0))], "doc")
+    # e.g. text-embedding-3-large at its native 3072 dimensions
+    with pytest.raises(Exception, match=f"expected {DIMENSIONS} dimensions"):
+        await store.add_embeddings([chunk(0, "替换", [0.1] * 3072)], "doc")
+    context, _ = (await store.search_many(["新能源"], top_k=5))[0]
+    assert context == "保留"
+
+async def test_embedding_requests_ask_for_the_column_dimensions(workdir, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setenv("EMBEDDING_CACHE", "false")
+    payloads = []
+
+    def respond(request):
+        payload = json.loads(request.content)
+        payloads.append(payload)
+        dimensions = payload.get("dimensions", 3072)
+        return httpx.Response(200, json={"data": [
+            {"index": i, "embedding": [0.0] * dimensions} for i in range(len(payload["input"]))
+        ]})
+
+    handler = OpenAIHandler()
+    handler.client = httpx.AsyncClient(transport=httpx.MockTransport(respond))
+    try:
+        vectors = await handler.embeddings(["杭州新能源"])
+    finally:
+        await handler.close()
+    assert payloads[0]["dimensions"] == DIMENSIONS
+    assert len(vectors[0]) == DIMENSIONS
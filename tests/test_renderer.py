@@ -0,0 +1,102 @@
+import os
+import sys
+import time
+import asyncio
+
+import docx
+import pytest
+
+from backend.reports.renderer import ReportRenderer
+
+def report(report_id):
+    return {
+        "id": report_id,
+        "title": "杭州新能源决策者摘要",
+        "structure": {
+            "title": "杭州新能源决策者摘要",
+            "sections": [
+                {"title": "决策摘要", "type": "text", "content": "杭州新能源产业基础扎实。"},
+                {"title": "关键发现", "type": "bullet_points", "content": "- 产业链完整\n- 人才集聚"}
+            ]
+        },
+        "charts": []
+    }
+
+async def test_a_timed_out_task_does_not_fail_other_reports_renders(workdir):
+    os.makedirs("./data/reports")
+    renderer = ReportRenderer("./data/reports", "./data/templates", max_workers=2, timeout=1.5)
+    await renderer.start()
+    try:
+        stuck = asyncio.create_task(renderer._run(time.sleep, 30))
+        await asyncio.sleep(1.0)
+        # Another report's task, still running when the stuck one times out
+        other = asyncio.create_task(renderer._run(time.sleep, 1.0))
+        with pytest.raises(TimeoutError):
+            await stuck
+        assert await other is None
+
+        files = await renderer.render(report("r1"), ["docx"])
+        assert os.path.getsize(files["docx"]) > 0
+    finally:
+        await renderer.close()
+
+CHARTS = [
+    {"type": "radar", "title": "产业评估", "data": [
+        {"subject": subject, "value": value, "fullMark": 100}
+        for subject, value in [("规模", 80), ("创新", 70), ("人才", 65), ("政策", 90), ("资本", 60)]
+    ]},
+    {"type": "trend", "title": "产值趋势", "data": [
+        {"name": "2022", "actual": 100}, {"name": "2023", "actual": 120},
+        {"name": "2024", "forecast": 140}, {"name": "2025", "forecast": 165}
+    ]},
+    {"type": "heatmap", "title": "区域对比", "data": [{"name": "杭州", "value": 85}, {"name": "宁波", "value": 60}]}
+]
+
+@pytest.fixture
+async def renderer(workdir):
+    os.makedirs("./data/reports")
+    renderer = ReportRenderer("./data/reports", "./data/templates", max_workers=2, timeout=30)
+    await renderer.start()
+    yield renderer
+    await renderer.close()
+
+async def test_charts_are_placed_in_the_docx(renderer):
+    data = report("r1")
+    data["structure"]["sections"].append({"title": "产业评估", "type": "assessment", "content": "总体较强。", "includes_chart": True})
+    data["charts"] = CHARTS
+    files = await renderer.render(data, ["docx"])
+    assert files == {"docx": os.path.abspath("./data/reports/r1.docx")}
+    assert len(docx.Document(files["docx"]).inline_shapes) == 3
+    # Chart images are scratch files
+    assert sorted(os.listdir("./data/reports")) == ["r1.docx"]
+
+async def test_a_pdf_only_render_leaves_no_docx(workdir, monkeypatch):
+    # Stand-in for LibreOffice: copies the DOCX it is given to <outdir>/<name>.pdf
+    bin_dir = workdir / "bin"
+    bin_dir.mkdir()
+    script = bin_dir / "soffice"
+    script.write_text(
+        f"#!{sys.executable}\n"
+        "import os, shutil, sys\n"
+        "out_dir = sys.argv[sys.argv.index('--outdir') + 1]\n"
+        "name = os.path.splitext(os.path.basename(sys.argv[-1]))[0]\n"
+        "shutil.copy(sys.argv[-1], os.path.join(out_dir, name + '.pdf'))\n"
+    )
+    script.chmod(0o755)
+    # Set before the pool starts so the workers inherit it
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    os.makedirs("./data/reports")
+    renderer = ReportRenderer("./data/reports", "./data/templates", max_workers=1, timeout=30)
+    await renderer.start()
+    try:
+        data = report("r1")
+        data["charts"] = CHARTS[:1]
+        files = await renderer.render(data, ["pdf"])
+    finally:
+        await renderer.close()
+    assert files == {"pdf": os.path.abspath("./data/reports/r1.pdf")}
+    assert sorted(os.listdir("./data/reports")) == ["r1.pdf"]
+
+def test_pdf_conversion_is_given_less_time_than_its_pool_task():
+    renderer = ReportRenderer(timeout=100)
+    assert renderer.pdf_timeout < renderer.timeout
@@ -0,0 +1,77 @@
+import numpy as np
+
+from backend.models.embedding_cache import normalize_text
+from backend.models.response_cache import ResponseCache
+
+ANSWER = {"choices": [{"message": {"content": "杭州新能源产业规模约三千亿元"}}]}
+
+def ask(question, context=()):
+    return [*context, {"role": "user", "content": question}]
+
+def fake_embed(vectors):
+    async def embed(texts):
+        # The cache embeds the normalized question
+        return [vectors[next(q for q in vectors if normalize_text(q) == text)] for text in texts]
+    return embed
+
+async def test_exact_hit_after_normalization_and_copy_on_read():
+    cache = ResponseCache()
+    await cache.put(ask("杭州 新能源产业规模？"), "gpt", 0, ANSWER)
+
+    cached = await cache.get(ask("  杭州  新能源产业规模？ "), "gpt", 0)
+    assert cached == ANSWER
+    cached["choices"].clear()
+    assert await cache.get(ask("杭州 新能源产业规模？"), "gpt", 0) == ANSWER
+    assert cache.stats()["hits"] == 2
+
+async def test_parameters_and_temperature_separate_entries():
+    cache = ResponseCache()
+    await cache.put(ask("问题"), "gpt", 0, ANSWER, max_tokens=100)
+    assert await cache.get(ask("问题"), "gpt", 0, max_tokens=200) is None
+    assert await cache.get(ask("问题"), "other", 0, max_tokens=100) is None
+    # Non-deterministic requests are neither stored nor served
+    await cache.put(ask("随机"), "gpt", 0.7, ANSWER)
+    assert await cache.get(ask("随机"), "gpt", 0.7) is None
+    assert cache.stats()["entries"] == 1
+
+async def test_ttl_and_lru_eviction(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("backend.models.response_cache.time.time", lambda: now[0])
+    cache = ResponseCache(max_entries=2, ttl=60)
+    await cache.put(ask("一"), "gpt", 0, 1)
+    await cache.put(ask("二"), "gpt", 0, 2)
+    assert await cache.get(ask("一"), "gpt", 0) == 1
+    await cache.put(ask("三"), "gpt", 0, 3)
+    # "二" was least recently used
+    assert await cache.get(ask("二"), "gpt", 0) is None
+    assert await cache.get(ask("一"), "gpt", 0) == 1
+
+    now[0] += 61
+    assert await cache.get(ask("三"), "gpt", 0) is None
+    assert cache.stats()["entries"] == 0
+
+async def test_semantic_hit_only_within_context_and_scope():
+    vectors = {
+        "杭州新能源产业规模多大？": [1.0, 0.0],
+        "杭州新能源产业有多大规模？": [0.98, 0.2],
+        "苏州生物医药企业有哪些？": [0.0, 1.0],
+    }
+    cache = ResponseCache(similarity_threshold=0.95, embed=fake_embed(vectors))
+    await cache.put(ask("杭州新能源产业规模多大？"), "gpt", 0, ANSWER, scope=("新能源", "杭州"))
+
+    assert await cache.get(ask("杭州新能源产业有多大规模？"), "gpt", 0, scope=("新能源", "杭州")) == ANSWER
+    assert cache.stats()["semantic_hits"] == 1
+    assert await cache.get(ask("苏州生物医药企业有哪些？"), "gpt", 0, scope=("新能源", "杭州")) is None
+    assert await cache.get(ask("杭州新能源产业有多大规模？"), "gpt", 0, scope=("新能源", "苏州")) is None
+    earlier = ({"role": "user", "content": "另一段对话"}, {"role": "assistant", "content": "好"})
+    assert await cache.get(ask("杭州新能源产业有多大规模？", earlier), "gpt", 0, scope=("新能源", "杭州")) is None
+
+async def test_embedding_failure_falls_back_to_exact_matching():
+    async def broken(texts):
+        raise RuntimeError("embedding API down")
+
+    cache = ResponseCache(similarity_threshold=0.9, embed=broken)
+    await cache.put(ask("问题"), "gpt", 0, ANSWER)
+    assert await cache.get(ask("问题"), "gpt", 0) == ANSWER
+    assert await cache.get(ask("近似问题"), "gpt", 0) is None
+    assert np.isclose(cache.stats()["hit_rate"], 0.5)
@@ -0,0 +1,128 @@
+import json
+import time
+import asyncio
+from email.utils import formatdate
+
+import httpx
+import pytest
+
+from backend.models.openai_handler import OpenAIHandler
+from backend.models.retry import RetryPolicy, RetryableError, parse_retry_after
+
+CHAT_RESPONSE = {"choices": [{"message": {"role": "assistant", "content": "ok"}}]}
+
+@pytest.fixture
+async def handler_for(workdir, monkeypatch):
+    """OpenAIHandler whose requests are answered by respond(request) instead of the API"""
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setenv("RESPONSE_CACHE", "false")
+    monkeypatch.setenv("EMBEDDING_CACHE", "false")
+    handlers = []
+
+    def create(respond, **policy):
+        handler = OpenAIHandler()
+        handler.client = httpx.AsyncClient(transport=httpx.MockTransport(respond))
+        handler.retry_policy = RetryPolicy(**policy)
+        handlers.append(handler)
+        return handler
+
+    yield create
+    for handler in handlers:
+        await handler.close()
+
+def chat(handler, content):
+    return handler.chat_completion(messages=[{"role": "user", "content": content}], temperature=0)
+
+async def test_other_requests_complete_while_one_backs_off(handler_for):
+    throttled = []
+
+    async def respond(request):
+        if "throttle" in json.loads(request.content)["messages"][0]["content"] and not throttled:
+            throttled.append(time.monotonic())
+            return httpx.Response(429, headers={"Retry-After": "0.5"})
+        await asyncio.sleep(0.01)
+        return httpx.Response(200, json=CHAT_RESPONSE)
+
+    handler = handler_for(respond, max_attempts=2, base_delay=0.01)
+    backing_off = asyncio.create_task(chat(handler, "throttle"))
+    completed = []
+    while not backing_off.done():
+        await chat(handler, "hello")
+        completed.append(time.monotonic())
+    assert (await backing_off) == CHAT_RESPONSE
+
+    # Normal chats kept completing during the 0.5s wait
+    assert len([t for t in completed if t - throttled[0] < 0.45]) >= 10
+
+@pytest.mark.parametrize("headers, expected", [
+    ({"retry-after-ms": "300"}, 0.3),
+    ({"retry-after": "0.3"}, 0.3),
+])
+async def test_retry_after_headers_set_the_wait(handler_for, headers, expected):
+    attempts = []
+
+    def respond(request):
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            return httpx.Response(429, headers=headers)
+        return httpx.Response(200, json=CHAT_RESPONSE)
+
+    # Without the header the first wait would be up to 10s
+    handler = handler_for(respond, max_attempts=2, base_delay=10)
+    assert (await chat(handler, "hello")) == CHAT_RESPONSE
+    assert expected <= attempts[1] - attempts[0] < expected + 0.2
+
+def test_parse_retry_after():
+    assert parse_retry_after({"retry-after-ms": "1500", "retry-after": "7"}) == 1.5
+    assert parse_retry_after({"retry-after": "7"}) == 7.0
+    assert 8 < parse_retry_after({"retry-after": formatdate(time.time() + 10, usegmt=True)}) <= 10
+    assert parse_retry_after({"retry-after": formatdate(time.time() - 10, usegmt=True)}) == 0.0
+    assert parse_retry_after({"retry-after": "soon"}) is None
+    assert parse_retry_after({}) is None
+
+async def test_deadline_stops_retries():
+    calls = []
+    cause = ValueError("rate limited")
+
+    async def operation():
+        calls.append(time.monotonic())
+        raise RetryableError("HTTP 429", retry_after=0.2, cause=cause)
+
+    policy = RetryPolicy(max_attempts=10, deadline=0.5)
+    start = time.monotonic()
+    with pytest.raises(ValueError) as raised:
+        await policy.call(operation)
+    # Attempts at 0, 0.2 and 0.4s; a third wait would end past the deadline
+    assert raised.value is cause
+    assert len(calls) == 3
+    assert time.monotonic() - start < 0.5
+
+async def test_deadline_bounds_a_slow_attempt():
+    async def operation():
+        await asyncio.sleep(5)
+
+    start = time.monotonic()
+    with pytest.raises(asyncio.TimeoutError):
+        await RetryPolicy(max_attempts=3).call(operation, deadline=0.2)
+    assert time.monotonic() - start < 1
+
+async def test_retries_only_retryable_errors_up_to_max_attempts():
+    calls = []
+
+    async def rate_limited():
+        calls.append(None)
+        raise RetryableError("HTTP 503", retry_after=0)
+
+    async def bad_request():
+        calls.append(None)
+        raise KeyError("not retryable")
+
+    policy = RetryPolicy(max_attempts=3)
+    with pytest.raises(RetryableError):
+        await policy.call(rate_limited)
+    assert len(calls) == 3
+
+    calls.clear()
+    with pytest.raises(KeyError):
+        await policy.call(bad_request)
+    assert len(calls) == 1
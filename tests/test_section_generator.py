@@ -0,0 +1,101 @@
+import re
+import asyncio
+
+from backend.reports.section_generator import SectionGenerator
+
+STRUCTURE = {
+    "title": "杭州市生物医药产业集群评估报告",
+    "sections": [
+        {"title": "1. 执行摘要", "type": "text", "summary": True},
+        {"title": "2. 产业现状", "type": "text"},
+        {"title": "3. 创新能力", "type": "assessment"},
+        {"title": "4. 政策环境", "type": "bullet_points"},
+        {"title": "5. 发展预测", "type": "forecast"},
+    ]
+}
+
+class FakeLLM:
+    """Answers each section prompt with the section title after `latency`; tracks calls in flight"""
+
+    def __init__(self, latency=0.1, fail=()):
+        self.latency = latency
+        self.fail = set(fail)
+        self.in_flight = 0
+        self.peak = 0
+        self.prompts = []
+
+    async def chat_completion(self, messages, temperature, max_tokens):
+        prompt = messages[-1]["content"]
+        self.prompts.append(prompt)
+        title = re.search(r"“(.+?)”一节", prompt).group(1)
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.in_flight -= 1
+        if title in self.fail:
+            raise RuntimeError("HTTP 500")
+        return {"choices": [{"message": {"content": f" {title}正文 "}}]}
+
+class FakeVectorStore:
+    def __init__(self):
+        self.calls = []
+
+    async def search_many(self, queries, filters, top_k):
+        self.calls.append((queries, filters))
+        return [(f"{query}的资料", [{"title": query}]) for query in queries]
+
+async def test_body_sections_run_concurrently_then_summaries_from_their_text():
+    llm, store = FakeLLM(latency=0.2), FakeVectorStore()
+    generator = SectionGenerator(llm, store, concurrency=8)
+    finished = []
+
+    async def on_section(index, section):
+        finished.append(index)
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    sections = await generator.generate(STRUCTURE, industry="生物医药", region="杭州", on_section=on_section)
+    elapsed = loop.time() - start
+
+    # Four body sections at once, then the summary: two LLM latencies, not five
+    assert llm.peak == 4 and elapsed < 0.6
+    assert finished[-1] == 0 and sorted(finished) == [0, 1, 2, 3, 4]
+    assert [s["content"] for s in sections] == [f"{s['title']}正文" for s in STRUCTURE["sections"]]
+    assert all(f"{s['title']}正文" in llm.prompts[-1] for s in STRUCTURE["sections"][1:])
+
+    # One batched retrieval, filtered by industry and region
+    assert len(store.calls) == 1
+    queries, filters = store.calls[0]
+    assert queries == ["生物医药 产业现状", "生物医药 创新能力", "生物医药 政策环境", "生物医药 发展预测"]
+    assert filters == [{"industry": "生物医药", "region": "杭州"}] * 4
+    assert sections[1]["sources"] == [{"title": "生物医药 产业现状"}]
+    assert "生物医药 产业现状的资料" in llm.prompts[0]
+
+async def test_concurrency_limit_is_shared_across_reports():
+    llm = FakeLLM(latency=0.05)
+    generator = SectionGenerator(llm, concurrency=3)
+    await asyncio.gather(*(generator.generate(STRUCTURE, industry="新能源", region=region) for region in ["杭州", "苏州"]))
+    assert llm.peak == 3
+    assert len(llm.prompts) == 10
+
+async def test_failed_section_is_reported_and_left_out_of_the_summary():
+    llm = FakeLLM(latency=0.01, fail={"3. 创新能力"})
+    sections = await SectionGenerator(llm).generate(STRUCTURE, industry="生物医药")
+    assert sections[2]["content"] == "" and sections[2]["error"] == "HTTP 500"
+    assert sections[3]["content"] == "4. 政策环境正文"
+    assert "3. 创新能力" not in llm.prompts[-1]
+
+async def test_completed_sections_are_reused():
+    llm = FakeLLM(latency=0.01)
+    completed = {1: dict(STRUCTURE["sections"][1], content="已生成的现状", sources=[])}
+    finished = []
+
+    async def on_section(index, section):
+        finished.append(index)
+
+    sections = await SectionGenerator(llm).generate(STRUCTURE, completed=completed, on_section=on_section)
+    assert sections[1]["content"] == "已生成的现状"
+    assert 1 not in finished and len(llm.prompts) == 4
+    assert "已生成的现状" in llm.prompts[-1]
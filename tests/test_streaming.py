@@ -0,0 +1,65 @@
+import json
+import time
+import asyncio
+
+import httpx
+import pytest
+
+from backend.models.openai_handler import OpenAIHandler
+from backend.models.retry import RetryPolicy
+
+def sse(delta):
+    return f"data: {json.dumps({'choices': [{'delta': {'content': delta}}]}, ensure_ascii=False)}\n\n".encode("utf-8")
+
+@pytest.fixture
+async def handler(workdir, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setenv("RESPONSE_CACHE", "false")
+    monkeypatch.setenv("EMBEDDING_CACHE", "false")
+    handler = OpenAIHandler()
+    handler.retry_policy = RetryPolicy(max_attempts=2, base_delay=0.01)
+    yield handler
+    await handler.close()
+
+def serve(handler, respond):
+    handler.client = httpx.AsyncClient(transport=httpx.MockTransport(respond))
+
+async def test_deltas_are_yielded_as_they_arrive(handler):
+    async def generate():
+        yield b": keep-alive\n\n"
+        for token in ["杭州", "新能源", "产业"]:
+            yield sse(token)
+            await asyncio.sleep(0.2)
+        yield b"data: [DONE]\n\n"
+        yield sse("after done")
+
+    serve(handler, lambda request: httpx.Response(200, content=generate()))
+    start = time.monotonic()
+    arrivals, deltas = [], []
+    async for delta in handler.stream_chat_completion([{"role": "user", "content": "你好"}]):
+        arrivals.append(time.monotonic() - start)
+        deltas.append(delta)
+
+    assert deltas == ["杭州", "新能源", "产业"]
+    # The first token is not held back until the whole completion is generated
+    assert arrivals[0] < 0.15
+    assert arrivals[-1] >= 0.35
+
+async def test_stream_request_is_retried_before_any_output(handler):
+    requests = []
+
+    def respond(request):
+        requests.append(json.loads(request.content))
+        if len(requests) == 1:
+            return httpx.Response(429, headers={"retry-after-ms": "10"})
+        return httpx.Response(200, content=sse("好") + b"data: [DONE]\n\n")
+
+    serve(handler, respond)
+    deltas = [delta async for delta in handler.stream_chat_completion([{"role": "user", "content": "你好"}])]
+    assert deltas == ["好"]
+    assert len(requests) == 2 and requests[1]["stream"] is True
+
+async def test_chat_completion_with_stream_returns_the_generator(handler):
+    serve(handler, lambda request: httpx.Response(200, content=sse("好") + b"data: [DONE]\n\n"))
+    stream = await handler.chat_completion([{"role": "user", "content": "你好"}], stream=True)
+    assert [delta async for delta in stream] == ["好"]
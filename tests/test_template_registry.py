@@ -0,0 +1,85 @@
+import os
+import json
+
+import pytest
+
+from backend.reports.template_registry import TemplateRegistry
+
+def template(name, *titles):
+    return {"name": {"zh": name}, "sections": [{"title": {"zh": title, "en": title.upper()}, "type": "text"} for title in titles]}
+
+def write_templates(path, templates, mtime=None):
+    path.write_text(json.dumps(templates, ensure_ascii=False), encoding="utf-8")
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+@pytest.fixture
+def override(tmp_path):
+    return tmp_path / "report_templates.json"
+
+def make_registry(override, db_templates=None):
+    registry = TemplateRegistry(path=str(override), database_url="postgresql://templates", reload_interval=60)
+
+    async def load_database():
+        if db_templates is None or registry._db_templates == db_templates:
+            return False
+        registry._db_templates = dict(db_templates)
+        return True
+
+    registry._load_database = load_database
+    return registry
+
+async def test_database_overrides_file_overrides_builtin_per_report_type(override):
+    write_templates(override, {
+        "executive": template("文件版摘要", "a"),
+        "policy": template("文件版政策", "b")
+    })
+    registry = make_registry(override, {"policy": template("数据库版政策", "c"), "custom": template("自定义", "d")})
+    # Before the database is read: builtin < file
+    assert registry.get("executive").name == "文件版摘要"
+    assert registry.get("policy").name == "文件版政策"
+    assert registry.get("trend").name == TemplateRegistry(path=str(override.with_name("missing.json"))).get("trend").name
+
+    assert await registry.reload() is True
+    assert registry.get("policy").name == "数据库版政策"
+    assert registry.get("executive").name == "文件版摘要"
+    assert [s["title"] for s in registry.get("custom", "en").sections] == ["D"]
+    # Nothing changed: no recompile
+    assert await registry.reload() is False
+
+async def test_changed_override_file_is_reloaded_and_changes_the_digest(override):
+    write_templates(override, {"executive": template("旧版", "a")}, mtime=1000)
+    registry = make_registry(override)
+    compiled = registry.get("executive")
+
+    write_templates(override, {"executive": template("新版", "a", "b")}, mtime=2000)
+    assert await registry.reload() is True
+    assert registry.get("executive").name == "新版"
+    assert registry.get("executive").digest != compiled.digest
+    # Compiled templates are shared and read-only
+    assert registry.get("executive") is registry.get("executive")
+    with pytest.raises(TypeError):
+        registry.get("executive").sections[0]["title"] = "改"
+
+def test_malformed_templates_are_skipped_and_unknown_types_fall_back(override):
+    write_templates(override, {"executive": {"name": "缺少章节"}, "trend": template("趋势", "a")})
+    registry = make_registry(override)
+    assert registry.get("executive").name != "缺少章节"
+    assert registry.get("trend").name == "趋势"
+    # English falls back to Chinese for the name; unknown types and languages use defaults
+    assert registry.get("trend", "en").name == "趋势"
+    assert registry.get("unknown", "fr") is registry.get("default", "zh")
+
+    override.write_text("{", encoding="utf-8")
+    assert make_registry(override).get("trend").name != "趋势"
+
+    write_templates(override, {"default": {"sections": []}})
+    with pytest.raises(ValueError):
+        TemplateRegistry(path=str(override))
+
+def test_titles(override):
+    registry = make_registry(override)
+    name = registry.get("executive").name
+    assert registry.title("executive", "自定", "新能源", "杭州") == f"杭州新能源{name}"
+    assert registry.title("executive", "自定", None, "杭州") == f"杭州产业{name}"
+    assert registry.title("executive", "自定", None, None) == "自定"
@@ -0,0 +1,84 @@
+import zlib
+
+import numpy as np
+import pytest
+
+from backend.rag.vector_store import VectorStore
+
+WORDS = ["产业", "集群", "发展", "企业", "研发", "投资", "园区", "政策", "人才", "市场", "创新", "制造"]
+DIM = 16
+
+class CountingEmbedder:
+    """Deterministic vectors per text; counts requests"""
+
+    def __init__(self):
+        self.requests = []
+
+    async def embeddings(self, texts, model=None):
+        self.requests.append(list(texts))
+        return [np.random.default_rng(zlib.crc32(text.encode("utf-8"))).standard_normal(DIM).tolist() for text in texts]
+
+async def make_store(monkeypatch, mode, documents=40, per_doc=25, index="exact"):
+    monkeypatch.setenv("SEARCH_MODE", mode)
+    monkeypatch.setenv("VECTOR_INDEX", index)
+    # Enough rows (39 per list) for the IVF index to train
+    monkeypatch.setenv("IVF_NLIST", "10")
+    store = VectorStore(CountingEmbedder())
+    rng = np.random.default_rng(0)
+    for doc in range(documents):
+        doc_id = f"doc{doc}"
+        texts = ["".join(rng.choice(WORDS, 6)) for _ in range(per_doc)]
+        store.storage.append(doc_id, list(range(per_doc)), rng.standard_normal((per_doc, DIM)).astype(np.float32), texts)
+        await store.set_document_metadata(doc_id, {
+            "title": doc_id,
+            "industry": "生物医药" if doc % 4 == 0 else "新能源",
+            "region": "杭州" if doc % 2 == 0 else "苏州"
+        })
+    return store
+
+QUERIES = ["产业集群发展", "研发投入", "人才政策", "产业集群发展"]
+FILTERS = [None, {"industry": "生物医药"}, {"industry": "新能源", "region": "苏州"}, {"region": "杭州"}]
+
+@pytest.mark.parametrize("index", ["exact", "ivf"])
+@pytest.mark.parametrize("mode", ["dense", "hybrid"])
+async def test_search_many_matches_one_search_per_query_with_one_embedding_request(workdir, monkeypatch, mode, index):
+    store = await make_store(monkeypatch, mode, index=index)
+    batched = await store.search_many(QUERIES, FILTERS, top_k=5)
+    # Distinct query texts are embedded together, once
+    assert store.openai_handler.requests == [["产业集群发展", "研发投入", "人才政策"]]
+    assert store.index.name == index and (index == "exact" or store.index.is_trained)
+
+    for query, filters, result in zip(QUERIES, FILTERS, batched):
+        assert result == await store.search(query, top_k=5, **(filters or {}))
+        context, sources = result
+        assert len(sources) == 5 and len(context.split("\n\n")) == 5
+        for source in sources:
+            for field, value in (filters or {}).items():
+                assert source[field] == value
+
+async def test_pre_and_post_filtering_agree(workdir, monkeypatch):
+    store = await make_store(monkeypatch, "dense")
+    store.prefilter_selectivity = 1.0
+    prefiltered = await store.search_many(QUERIES, FILTERS, top_k=5)
+    store.prefilter_selectivity = 0.0
+    assert await store.search_many(QUERIES, FILTERS, top_k=5) == prefiltered
+
+async def test_filters_matching_nothing_and_bad_arguments(workdir, monkeypatch):
+    store = await make_store(monkeypatch, "hybrid")
+    results = await store.search_many(["产业", "产业"], [{"region": "宁波"}, None], top_k=3)
+    assert results[0] == ("", [])
+    assert len(results[1][1]) == 3
+    assert store.openai_handler.requests == [["产业"]]
+
+    assert await store.search_many([], top_k=3) == []
+    with pytest.raises(ValueError):
+        await store.search_many(["产业", "集群"], [None], top_k=3)
+
+async def test_deleted_documents_are_not_returned(workdir, monkeypatch):
+    store = await make_store(monkeypatch, "dense", documents=4)
+    await store.delete_document("doc0")
+    await store.delete_chunks("doc1", list(range(20)))
+    _, sources = await store.search("产业", top_k=100)
+    assert [source["title"] for source in sources].count("doc1") == 5
+    assert "doc0" not in {source["title"] for source in sources}
+    assert len(sources) == 55